@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        #connect the cache invalidation, change feed and history receivers
+        from . import cacheHelpers, authentication, changeFeed, historyHelpers
@@ -0,0 +1,168 @@
+# native async variants of the polling and autosave endpoints, for ASGI deployments (see CRAYKOI_ASYNC_VIEWS in urls.py)
+# DRF views are synchronous, these are plain django views that reuse the same authentication, lookups and encoders
+import asyncio
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from .authentication import CachedTokenAuthentication
+from .cacheHelpers import cachedPageStyles, projectData, recordChunks
+from .changeFeed import asyncEventStream, feedResponse, resumeVersion
+from .componentTree import TreeError
+from .cursorHelpers import parseListing, filterComponents, projectItem, componentPage, needsStyles, ListingError
+from .jsonCodec import dumps, loads
+from .models import Project, Component, Style
+from .treeHelpers import deleteSubtree
+from .streamHelpers import projectComponents, encodeComponentData, STREAM_CHUNK_SIZE
+from .versionHelpers import projectETag, notModified
+from .writeBehind import autosave, flushProject, hasPending
+
+def jsonResponse(data=None, code=status.HTTP_200_OK, headers=None):
+    return HttpResponse(b"" if data is None else dumps(data), status=code, headers=headers, content_type="application/json")
+
+async def replayChunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+#whole-project payload builds in flight, keyed by (project id, version)
+payloadBuilds = {}
+
+def buildPayload(project):
+    return list(recordChunks(project, encodeComponentData(projectComponents(project))))
+
+async def sharedPayload(project):
+    #every autosave changes the etag of all idle editors at once, they share a single build of the new version
+    key = (project.id, project.version)
+    build = payloadBuilds.get(key)
+    if build is None:
+        build = payloadBuilds[key] = asyncio.ensure_future(sync_to_async(buildPayload)(project))
+        build.add_done_callback(lambda done: payloadBuilds.pop(key, None))
+    #a client going away must not cancel the build the others are waiting on
+    return await asyncio.shield(build)
+
+async def encodeComponents(components, fields=None):
+    #async twin of encodeJSONArray over a queryset, one chunk per STREAM_CHUNK_SIZE components
+    resolve = needsStyles(fields)
+    batch, first = [], True
+    yield b"["
+    async for component in components.aiterator(chunk_size=STREAM_CHUNK_SIZE):
+        batch.append(component)
+        if len(batch) >= STREAM_CHUNK_SIZE:
+            yield await encodeBatch(batch, fields, resolve, first)
+            batch, first = [], False
+    if batch:
+        yield await encodeBatch(batch, fields, resolve, first)
+    yield b"]"
+
+async def encodeBatch(batch, fields, resolve, first):
+    if resolve:
+        await sync_to_async(Style.resolve)(batch)
+    encoded = b",".join(dumps(projectItem(component, fields)) for component in batch)
+    return encoded if first else b"," + encoded
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAPIView(View):
+    #token authentication and DRF-shaped error bodies for async handlers, exempt from csrf like APIView: the token
+    #travels in a header a foreign site cannot set
+    authentication = CachedTokenAuthentication()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            result = await sync_to_async(self.authentication.authenticate)(request)
+        except exceptions.AuthenticationFailed as exc:
+            return self.unauthorized(exc.detail)
+        if result is None:
+            return self.unauthorized("Authentication credentials were not provided.")
+        request.user, request.auth = result
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return jsonResponse({"detail": "Not found."}, code=status.HTTP_404_NOT_FOUND)
+
+    def unauthorized(self, detail):
+        return jsonResponse({"detail": detail}, code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": self.authentication.authenticate_header(None)})
+
+    async def getProject(self, request, project_id, flush=True):
+        if flush and hasPending(project_id):
+            await sync_to_async(flushProject)(project_id)
+        try:
+            return await Project.objects.aget(id=project_id, user=request.user, hidden=False)
+        except Project.DoesNotExist:
+            raise Http404
+
+class AsyncProjectListView(AsyncAPIView):
+    async def get(self, request):
+        data = [{"name": project.name, "id": project.id} async for project in Project.objects.filter(user=request.user, hidden=False)]
+        return jsonResponse(data)
+
+class AsyncComponentView(AsyncAPIView):
+    async def getComponent(self, request, project_id, page_id, comp_id):
+        if hasPending(project_id):
+            await sync_to_async(flushProject)(project_id)
+        try:
+            return await Component.objects.select_related("page__project").aget(id=comp_id, page_id=page_id, page__project_id=project_id, page__project__user=request.user, page__project__hidden=False)
+        except Component.DoesNotExist:
+            raise Http404
+    async def get(self, request, project_id, page_id, comp_id):
+        component = await self.getComponent(request, project_id, page_id, comp_id)
+        etag = projectETag(component.page.project)
+        if notModified(request, etag):
+            return jsonResponse(code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        styles = await sync_to_async(cachedPageStyles)(component.page)
+        return jsonResponse(styles[component.comp_id], headers={"ETag": etag})
+    async def delete(self, request, project_id, page_id, comp_id):
+        component = await self.getComponent(request, project_id, page_id, comp_id)
+        try:
+            await sync_to_async(deleteSubtree)(component.page.project, component, cascade=request.GET.get("subtree") == "1")
+        except TreeError as exc:
+            return jsonResponse({"detail": exc.errors[(component.page_id, component.comp_id)][0]}, code=status.HTTP_400_BAD_REQUEST)
+        return jsonResponse()
+
+class AsyncComponentListView(AsyncAPIView):
+    async def get(self, request, project_id):
+        project = await self.getProject(request, project_id)
+        etag = projectETag(project)
+        if notModified(request, etag):
+            return jsonResponse(code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        try:
+            listing = parseListing(request.GET)
+        except ListingError as exc:
+            return jsonResponse({"detail": str(exc)}, code=status.HTTP_400_BAD_REQUEST)
+        if listing is None:
+            chunks = await sync_to_async(projectData.get)(project.id, project.version)
+            if chunks is None:
+                chunks = await sharedPayload(project)
+            return StreamingHttpResponse(replayChunks(chunks), content_type="application/json", headers={"ETag": etag})
+        components = filterComponents(project, listing["page"], listing["page_title"], listing["fields"])
+        if listing["limit"] is None:
+            return StreamingHttpResponse(encodeComponents(components, listing["fields"]), content_type="application/json", headers={"ETag": etag})
+        rows, cursor = await sync_to_async(componentPage)(components, listing["limit"], listing["after"])
+        if needsStyles(listing["fields"]):
+            await sync_to_async(Style.resolve)(rows)
+        data = {"results": [projectItem(comp, listing["fields"]) for comp in rows], "next": cursor}
+        return jsonResponse(data, headers={"ETag": etag})
+    async def put(self, request, project_id):
+        #the bulk write runs in a worker thread, the event loop keeps serving polls meanwhile
+        project = await self.getProject(request, project_id, flush=False)
+        try:
+            data = loads(request.body)
+        except ValueError:
+            return jsonResponse({"detail": "JSON parse error."}, code=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, list):
+            return jsonResponse(code=status.HTTP_400_BAD_REQUEST)
+        errors, pending = await sync_to_async(autosave)(project, data)
+        if errors:
+            return jsonResponse({"errors": errors}, code=status.HTTP_400_BAD_REQUEST)
+        return jsonResponse(code=status.HTTP_202_ACCEPTED if pending else status.HTTP_200_OK)
+
+class AsyncChangeFeedView(AsyncAPIView):
+    #an open stream costs no worker here, only a thread while it waits for the next event
+    async def get(self, request, project_id):
+        project = await self.getProject(request, project_id)
+        try:
+            since = resumeVersion(request)
+        except ValueError:
+            return jsonResponse({"detail": "version must be a non-negative integer."}, code=status.HTTP_400_BAD_REQUEST)
+        return feedResponse(asyncEventStream(project, since))
@@ -0,0 +1,83 @@
+# token authentication that keeps the token -> user lookup off the per-request hot path
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .cacheHelpers import CACHE_ALIAS
+from .localCache import TTLCache
+
+#tokens are rotated through auth/refresh/ or by logging in again once they expire
+TOKEN_TTL = getattr(settings, "CRAYKOI_TOKEN_TTL", timedelta(days=7))
+TOKEN_CACHE_TIMEOUT = getattr(settings, "CRAYKOI_TOKEN_CACHE_TIMEOUT", 300)
+#other processes only see an invalidation through the shared tier, keep the local one short
+LOCAL_TOKEN_TTL = getattr(settings, "CRAYKOI_LOCAL_TOKEN_TTL", 30)
+LOCAL_TOKEN_CACHE_SIZE = getattr(settings, "CRAYKOI_LOCAL_TOKEN_CACHE_SIZE", 1024)
+
+localTokens = TTLCache(LOCAL_TOKEN_CACHE_SIZE, LOCAL_TOKEN_TTL)
+
+def tokenCacheKey(key):
+    #never put raw tokens in the cache backend
+    return "craykoi:token:" + hashlib.sha256(key.encode()).hexdigest()
+
+def tokenExpires(token):
+    return token.created + TOKEN_TTL
+
+def isExpired(token):
+    return tokenExpires(token) <= timezone.now()
+
+def invalidateToken(key):
+    cacheKey = tokenCacheKey(key)
+    localTokens.delete(cacheKey)
+    caches[CACHE_ALIAS].delete(cacheKey)
+
+def rotateToken(user):
+    #replaces the user's token, the old key stops working immediately
+    Token.objects.filter(user=user).delete()
+    return Token.objects.create(user=user)
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cacheKey = tokenCacheKey(key)
+        entry = localTokens.get(cacheKey)
+        if entry is None:
+            entry = caches[CACHE_ALIAS].get(cacheKey)
+            if entry is None:
+                entry = self.loadEntry(key)
+                caches[CACHE_ALIAS].set(cacheKey, entry, self.remaining(entry, TOKEN_CACHE_TIMEOUT))
+            localTokens.set(cacheKey, entry, self.remaining(entry, LOCAL_TOKEN_TTL))
+        user, expires = entry
+        if expires <= timezone.now():
+            raise exceptions.AuthenticationFailed("Token has expired.")
+        return (user, key)
+
+    def loadEntry(self, key):
+        try:
+            token = Token.objects.select_related("user").get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed("Invalid token.")
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        if isExpired(token):
+            raise exceptions.AuthenticationFailed("Token has expired.")
+        return (token.user, tokenExpires(token))
+
+    def remaining(self, entry, timeout):
+        return max(1, min(timeout, int((entry[1] - timezone.now()).total_seconds())))
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidateToken(instance.key)
+
+@receiver(post_save, sender=get_user_model())
+def user_changed(sender, instance, created=False, **kwargs):
+    #the cached user object would be stale, e.g. after deactivation
+    if not created:
+        for key in Token.objects.filter(user_id=instance.pk).values_list("key", flat=True):
+            invalidateToken(key)
@@ -0,0 +1,117 @@
+# percentage geometry of whole pages at once, as columns rather than one component at a time
+#
+# numpy does the arithmetic when it is installed, otherwise (and for small pages) the scalar code loops over the
+# rows; both divide the same float64 values and round half to even, so they agree with the scalar path exactly
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#below this many components building the arrays costs more than the loop saves
+VECTOR_MIN_ROWS = 256
+#largest magnitude float64 holds exactly, pages with larger integers (sqlite stores 64 bits) take the scalar path
+EXACT_LIMIT = 2 ** 53
+#widest spread of percentages formatted once per value and shared, wider columns are formatted per row
+LABEL_RANGE = 10000
+
+def ratio(value, total):
+    #a zero parent dimension has no defined ratio, report it as 0 and let the clamps decide
+    if not total:
+        return 0
+    return round((value / total)*100)
+
+def relativeGeometry(left, top, width, height, parentLeft, parentTop, parentWidth, parentHeight):
+    #(width, height, left, top) percentages of a component inside its parent
+    width = 100 if not parentWidth else ratio(width, parentWidth)
+    if width > 98:
+        width = 100
+    left = ratio(left, parentLeft)
+    if left < 1:
+        left = 0
+    top = ratio(top, parentTop)
+    if top < 1:
+        top = 0
+    height = 100 if not parentHeight else ratio(height, parentHeight)
+    if height > 98:
+        height = 100
+    return width, height, left, top
+
+def scalarColumns(columns, parents):
+    left, top, width, height = columns
+    widths, heights, lefts, tops = [], [], [], []
+    for row, parent in enumerate(parents):
+        if parent < 0:
+            geometry = (100, 100, 0, 0)
+        else:
+            geometry = relativeGeometry(left[row], top[row], width[row], height[row], left[parent], top[parent], width[parent], height[parent])
+        widths.append(geometry[0])
+        heights.append(geometry[1])
+        lefts.append(geometry[2])
+        tops.append(geometry[3])
+    return widths, heights, lefts, tops
+
+def vectorRatio(value, total):
+    #int64 / int64 divides as float64 like python does for exact integers, rint rounds half to even like round
+    zero = total == 0
+    return numpy.where(zero, 0, numpy.rint(value / numpy.where(zero, 1, total) * 100)).astype(numpy.int64)
+
+def vectorColumns(columns, parents):
+    left, top, width, height = columns
+    roots = parents < 0
+    parents = numpy.where(roots, 0, parents)
+    parentLeft, parentTop, parentWidth, parentHeight = left[parents], top[parents], width[parents], height[parents]
+    widths = numpy.where(parentWidth == 0, 100, vectorRatio(width, parentWidth))
+    widths[widths > 98] = 100
+    lefts = vectorRatio(left, parentLeft)
+    lefts[lefts < 1] = 0
+    tops = vectorRatio(top, parentTop)
+    tops[tops < 1] = 0
+    heights = numpy.where(parentHeight == 0, 100, vectorRatio(height, parentHeight))
+    heights[heights > 98] = 100
+    widths[roots], heights[roots], lefts[roots], tops[roots] = 100, 100, 0, 0
+    return widths, heights, lefts, tops
+
+def vectorLabels(values):
+    #"n%" strings of a column, each distinct value is formatted once and the strings are gathered by numpy
+    if not len(values):
+        return []
+    low, high = int(values.min()), int(values.max())
+    if high - low > LABEL_RANGE:
+        return [f'{value}%' for value in values.tolist()]
+    labels = numpy.array([f'{value}%' for value in range(low, high + 1)], dtype=object)
+    return labels[values - low].tolist()
+
+def exactArrays(columns):
+    #the columns as int64 arrays, None when a value would not survive the float64 division exactly
+    try:
+        arrays = [numpy.asarray(column, dtype=numpy.int64) for column in columns]
+    except (OverflowError, TypeError, ValueError):
+        return None
+    for array in arrays:
+        if len(array) and (array.min() < -EXACT_LIMIT or array.max() > EXACT_LIMIT):
+            return None
+    return arrays
+
+def vectorGeometry(columns, parents):
+    #the arrays of vectorColumns, None when the scalar loop has to run
+    if numpy is None or len(parents) < VECTOR_MIN_ROWS:
+        return None
+    arrays = exactArrays(columns)
+    if arrays is None:
+        return None
+    return vectorColumns(arrays, numpy.asarray(parents, dtype=numpy.intp))
+
+def geometryColumns(columns, parents):
+    #columns is (left, top, width, height) per component, parents the row of each component's parent or -1 for
+    #roots; returns (width, height, left, top) lists of int percentages, roots get the full size of the page
+    result = vectorGeometry(columns, parents)
+    if result is None:
+        return scalarColumns(columns, parents)
+    return tuple(values.tolist() for values in result)
+
+def percentColumns(columns, parents):
+    #geometryColumns formatted as css percentages
+    result = vectorGeometry(columns, parents)
+    if result is None:
+        return tuple([f'{value}%' for value in values] for values in scalarColumns(columns, parents))
+    return tuple(vectorLabels(values) for values in result)
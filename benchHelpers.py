@@ -0,0 +1,84 @@
+# deterministic synthetic projects and query budgets for benchmarks and regression tests
+import random
+from collections import deque
+from .models import Project, Page, Component, Style
+from .signals import components_changed
+
+#upper bound on SQL queries per request, whatever the size of the project
+#the bulk writes issue one statement per batch of changed rows, budgets assume a single batch
+#writes are budgeted for a history snapshot, one query more than a delta
+QUERY_BUDGETS = {
+    "projects-list": 2,
+    "projects-new": 2,
+    "page-post": 9,
+    "page-styles": 2,
+    "page-viewport": 3,
+    "page-css": 3,
+    "project-css": 4,
+    "components-list": 2,
+    "components-list-page": 2,
+    "components-list-put": 12,
+    "components-delta": 14,
+    "new-component": 12,
+    "component-view": 2,
+    "component-view-delete": 10,
+    "component-subtree": 3,
+    "component-move": 12,
+    "project-clone": 11,
+    "page-clone": 18,
+    "page-view": 11,
+    "project-view": 9,
+    "project-history": 2,
+    "project-restore": 16,
+    #the replay of a reconnecting client, the stream itself reads nothing more
+    "project-events": 2,
+}
+
+def treeParents(count, depth, fanout):
+    #parent index (or None) of each component, trees are filled breadth first up to depth levels
+    parents, levels, children = [], [], []
+    open_slots = deque()
+    for index in range(count):
+        while open_slots and (children[open_slots[0]] >= fanout or levels[open_slots[0]] >= depth - 1):
+            open_slots.popleft()
+        if open_slots:
+            parent = open_slots[0]
+            children[parent] += 1
+            levels.append(levels[parent] + 1)
+        else:
+            parent = None
+            levels.append(0)
+        parents.append(parent)
+        children.append(0)
+        open_slots.append(index)
+    return parents
+
+def generateStyle(rng, size):
+    return {f"prop{n}": "#%06x" % rng.randrange(0xffffff) for n in range(size)}
+
+def generateProject(user, name, pages=1, components=100, depth=3, fanout=4, style_size=4, seed=0, canvas=1000, size=1000):
+    #same arguments always produce the same project; components are per page, placed on a canvas x canvas square
+    rng = random.Random(seed)
+    project = Project.objects.create(user=user, name=name)
+    page_ids = set()
+    for page_number in range(pages):
+        page = Page.objects.create(project=project, title=f"page-{page_number}")
+        page_ids.add(page.id)
+        rows = []
+        for index, parent in enumerate(treeParents(components, depth, fanout)):
+            rows.append(Component(
+                page=page,
+                secondary_state=generateStyle(rng, style_size),
+                left=rng.randrange(1, canvas),
+                top=rng.randrange(1, canvas),
+                width=rng.randrange(1, size),
+                height=rng.randrange(1, size),
+                comp_id=f"comp-{page_number}-{index}",
+                parent=None if parent is None else f"comp-{page_number}-{parent}",
+            ))
+        Style.intern(rows)
+        Component.objects.bulk_create(rows, batch_size=1000)
+    if page_ids:
+        components_changed.send(sender=Component, project=project, pages=page_ids)
+    project.refresh_from_db()
+    return project
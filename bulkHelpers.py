@@ -0,0 +1,248 @@
+# helper functions for saving many components of a project at once
+from django.db import transaction
+from rest_framework import serializers
+from .models import Component, Style
+from .componentTree import TreeError
+from .serializers import ComponentSerializer
+from .styleHelpers import getStyle, getComp
+from .signals import components_changed
+from .instrumentation import timed
+from .deleteHelpers import rawDelete
+
+#secondary_state is written through its style column
+UPDATE_FIELDS = ['style', 'left', 'top', 'width', 'height', 'comp_id', 'parent']
+
+GEOMETRY_FIELDS = ['left', 'top', 'width', 'height', 'parent']
+
+def loadComponentMap(project, comp_ids=None):
+    #one query: every component of the project (or the given comp_ids) keyed by (page title, comp_id)
+    components = Component.objects.filter(page__project=project).select_related("page")
+    if comp_ids is not None:
+        components = components.filter(comp_id__in=comp_ids)
+    return {(comp.page.title, comp.comp_id): comp for comp in Style.resolve(list(components))}
+
+def validateComponent(validator, component_data):
+    #one serializer instance validates every item, returns (validated data, errors)
+    try:
+        return validator.run_validation(component_data), None
+    except serializers.ValidationError as exc:
+        return None, exc.detail
+
+def assignChanged(component, validated):
+    #sets the validated values that differ, returns their names
+    changed = set()
+    for field, value in validated.items():
+        if getattr(component, field) != value:
+            setattr(component, field, value)
+            changed.add(field)
+    return changed
+
+def validateUpdates(componentMap, items):
+    #validate the whole payload in memory, returns ({changed component: changed fields}, per item errors)
+    validator = ComponentSerializer()
+    changed = {}
+    errors = []
+    for index, compData in enumerate(items):
+        if not isinstance(compData, dict):
+            errors.append({"index": index, "errors": ["Expected a component object."]})
+            continue
+        key = (compData.get("page"), compData.get("id"))
+        #only strings name a component, a list or dict could not even be looked up
+        component = componentMap.get(key) if isinstance(key[0], str) and isinstance(key[1], str) else None
+        if component is None:
+            errors.append({"index": index, "page": key[0], "id": key[1], "errors": ["Component does not exist."]})
+            continue
+        try:
+            component_data = getComp(compData)
+            component_data["secondary_state"] = getStyle(compData)
+        except KeyError as missing:
+            field = missing.args[0] if missing.args else "non_field_errors"
+            errors.append({"index": index, "page": key[0], "id": key[1], "errors": {field: ["This field is required."]}})
+            continue
+        validated, itemErrors = validateComponent(validator, component_data)
+        if itemErrors:
+            errors.append({"index": index, "page": key[0], "id": key[1], "errors": itemErrors})
+            continue
+        #autosaves resend the whole project, only rows that really differ are written
+        fields = assignChanged(component, validated)
+        if fields:
+            changed.setdefault(component, set()).update(fields)
+    return changed, errors
+
+def treeErrors(exc, keys):
+    #per item errors of a rejected tree, keys is [(index, component)] in payload order
+    errors = []
+    for index, component in keys:
+        #a component deleted and created again in one delta is reported once
+        messages = exc.errors.pop((component.page_id, component.comp_id), None)
+        if messages:
+            errors.append({"index": index, "id": component.comp_id, "errors": {"parent": messages}})
+    return errors
+
+def bulkUpdateComponents(project, items):
+    #nothing is written unless every item is valid and the parents still form trees
+    componentMap = loadComponentMap(project)
+    with timed("serializer"):
+        changed, errors = validateUpdates(componentMap, items)
+    if errors:
+        return [], errors
+    components = list(changed)
+    if components:
+        try:
+            with transaction.atomic():
+                Component.syncTree(components, strict=True)
+                Style.intern(components)
+                fields = {"style" if field == "secondary_state" else field for names in changed.values() for field in names}
+                Component.objects.bulk_update(components, sorted(fields), batch_size=500)
+                components_changed.send(sender=Component, project=project, pages={comp.page_id for comp in components}, saved=components, fields=changed)
+        except TreeError as exc:
+            keys = [(index, componentMap.get((item.get("page"), item.get("id")))) for index, item in enumerate(items)]
+            return [], treeErrors(exc, [(index, component) for index, component in keys if component is not None])
+    return components, errors
+
+def buildComponent(page, compData, validator=None):
+    #validates a creation payload in memory, returns (unsaved component, errors)
+    try:
+        component_data = getComp(compData)
+        #the client's page key stays in secondary_state like on autosaves, the listing has no other page field
+        component_data["secondary_state"] = getStyle(compData)
+    except KeyError as missing:
+        field = missing.args[0] if missing.args else "non_field_errors"
+        return None, {field: ["This field is required."]}
+    validated, errors = validateComponent(validator or ComponentSerializer(), component_data)
+    if errors:
+        return None, errors
+    return Component(page=page, **validated), None
+
+def bulkCreateComponents(project, page, items):
+    #nothing is inserted unless every item is valid, its comp_id is free on the page and its parent exists
+    validator = ComponentSerializer()
+    taken = set(page.components.filter(comp_id__in=[item.get("id") for item in items if isinstance(item, dict)]).values_list("comp_id", flat=True))
+    components, errors, keys = [], [], []
+    for index, compData in enumerate(items):
+        if not isinstance(compData, dict):
+            errors.append({"index": index, "errors": ["Expected a component object."]})
+            continue
+        with timed("serializer"):
+            component, itemErrors = buildComponent(page, compData, validator)
+        if itemErrors:
+            errors.append({"index": index, "id": compData.get("id"), "errors": itemErrors})
+            continue
+        if component.comp_id in taken:
+            errors.append({"index": index, "id": component.comp_id, "errors": {"id": ["A component with this id already exists on the page."]}})
+            continue
+        taken.add(component.comp_id)
+        components.append(component)
+        keys.append((index, component))
+    if errors:
+        return [], errors
+    try:
+        with transaction.atomic():
+            Component.syncTree(components, strict=True)
+            Style.intern(components)
+            Component.objects.bulk_create(components, batch_size=500)
+            if components:
+                components_changed.send(sender=Component, project=project, pages={page.id}, saved=components)
+    except TreeError as exc:
+        return [], treeErrors(exc, keys)
+    return components, errors
+
+def mergeUpdate(component, opData):
+    #geometry keys replace columns, any other key is merged into secondary_state, None removes it
+    data = {field: getattr(component, field) for field in GEOMETRY_FIELDS}
+    data["comp_id"] = component.comp_id
+    secondary = dict(component.secondary_state)
+    for key, value in opData.items():
+        if key in ("op", "page", "id"):
+            continue
+        if key in GEOMETRY_FIELDS:
+            data[key] = value
+        elif value is None:
+            secondary.pop(key, None)
+        else:
+            secondary[key] = value
+    data["secondary_state"] = secondary
+    return data
+
+def validateDelta(project, ops):
+    #replays the ops in memory, returns (creates, {update: changed fields}, deletes, per op results, per op errors)
+    pages = {page.title: page for page in project.pages.all()}
+    componentMap = loadComponentMap(project, {op.get("id") for op in ops if isinstance(op, dict) and isinstance(op.get("id"), str)})
+    validator = ComponentSerializer()
+    creates, updates, deletes = {}, {}, {}
+    changedFields = {}
+    results, errors = [], []
+    for index, opData in enumerate(ops):
+        if not isinstance(opData, dict) or opData.get("op") not in ("create", "update", "delete"):
+            errors.append({"index": index, "errors": ["Expected an object with op create, update or delete."]})
+            continue
+        op = opData["op"]
+        key = (opData.get("page"), opData.get("id"))
+        if not isinstance(key[0], str) or not isinstance(key[1], str):
+            errors.append({"index": index, "page": key[0], "id": key[1], "errors": ["Expected a page title and component id."]})
+            continue
+        page = pages.get(key[0])
+        if page is None:
+            errors.append({"index": index, "page": key[0], "id": key[1], "errors": ["Page does not exist."]})
+            continue
+        component = componentMap.get(key)
+        if op == "create":
+            if component is not None:
+                errors.append({"index": index, "page": key[0], "id": key[1], "errors": ["Component already exists."]})
+                continue
+            component, itemErrors = buildComponent(page, {k: v for k, v in opData.items() if k != "op"}, validator)
+            if itemErrors:
+                errors.append({"index": index, "page": key[0], "id": key[1], "errors": itemErrors})
+                continue
+            componentMap[key] = component
+            creates[key] = component
+            results.append({"index": index, "id": key[1], "status": "created"})
+            continue
+        if component is None:
+            errors.append({"index": index, "page": key[0], "id": key[1], "errors": ["Component does not exist."]})
+            continue
+        if op == "update":
+            validated, itemErrors = validateComponent(validator, mergeUpdate(component, opData))
+            if itemErrors:
+                errors.append({"index": index, "page": key[0], "id": key[1], "errors": itemErrors})
+                continue
+            changedFields.setdefault(key, set()).update(assignChanged(component, validated))
+            if key not in creates:
+                updates[key] = component
+            results.append({"index": index, "id": key[1], "status": "updated"})
+        else:
+            del componentMap[key]
+            if creates.pop(key, None) is None:
+                updates.pop(key, None)
+                deletes[key] = component
+            results.append({"index": index, "id": key[1], "status": "deleted"})
+    updates = {component: changedFields.get(key, set()) for key, component in updates.items()}
+    return list(creates.values()), updates, list(deletes.values()), results, errors
+
+def applyDelta(project, ops):
+    #callers hold the project row lock and run this inside their transaction
+    #the serializer phase also covers the two lookups validateDelta makes
+    with timed("serializer"):
+        creates, updates, deletes, results, errors = validateDelta(project, ops)
+    if errors:
+        return results, errors
+    saved = creates + list(updates)
+    try:
+        Component.syncTree(saved, deletes, strict=True)
+    except TreeError as exc:
+        #reported on the last op that touched the component
+        last = {(opData.get("page"), opData.get("id")): index for index, opData in enumerate(ops)}
+        keys = sorted(((last[(comp.page.title, comp.comp_id)], comp) for comp in saved + deletes), key=lambda pair: pair[0])
+        return results, treeErrors(exc, keys)
+    Style.intern(saved)
+    if deletes:
+        #the batch signal below covers the deleted components, they need none of their own
+        rawDelete(Component.objects.filter(pk__in=[comp.pk for comp in deletes]))
+    if updates:
+        Component.objects.bulk_update(list(updates), UPDATE_FIELDS, batch_size=500)
+    if creates:
+        Component.objects.bulk_create(creates, batch_size=500)
+    pages = {comp.page_id for comp in saved + deletes}
+    if pages:
+        components_changed.send(sender=Component, project=project, pages=pages, saved=saved, deleted=deletes, fields=updates)
+    return results, errors
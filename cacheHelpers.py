@@ -0,0 +1,144 @@
+# two tier cache for computed page styles, page css and project payloads
+# entries are stored with the page/project version they were built from, so a stale
+# entry left in another process's local tier is never served; signals evict eagerly
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Project, Page, Component, Style
+from .signals import components_changed
+from .styleEngine import compilePageStyles
+from .cssCompiler import compilePageCSS
+from .localCache import LRUCache, SizedLRUCache
+
+CACHE_ALIAS = getattr(settings, "CRAYKOI_CACHE_ALIAS", "default")
+CACHE_TIMEOUT = getattr(settings, "CRAYKOI_CACHE_TIMEOUT", 300)
+LOCAL_CACHE_SIZE = getattr(settings, "CRAYKOI_LOCAL_CACHE_SIZE", 256)
+#projects whose encoded listing is larger than this are streamed but not cached
+MAX_PAYLOAD_BYTES = getattr(settings, "CRAYKOI_CACHE_MAX_PAYLOAD_BYTES", 5 * 1024 * 1024)
+#encoded project payloads one process keeps in its local tier, on top of the entry count
+LOCAL_PAYLOAD_BYTES = getattr(settings, "CRAYKOI_LOCAL_PAYLOAD_BYTES", 64 * 1024 * 1024)
+
+class TieredCache:
+    def __init__(self, prefix, maxsize=LOCAL_CACHE_SIZE, maxbytes=None, sizeof=None):
+        #sizeof measures a value, the local tier then also keeps at most maxbytes of them
+        self.prefix = prefix
+        if sizeof is None:
+            self.local = LRUCache(maxsize)
+        else:
+            self.local = SizedLRUCache(maxsize, maxbytes, lambda entry: sizeof(entry[1]))
+        self.counters = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+        self.countersLock = threading.Lock()
+    def count(self, counter):
+        #requests run on several threads, += alone loses updates
+        with self.countersLock:
+            self.counters[counter] += 1
+    def sharedKey(self, key):
+        return f"craykoi:{self.prefix}:{key}"
+    def get(self, key, version):
+        entry = self.local.get(key)
+        if entry is not None and entry[0] == version:
+            self.count("local_hits")
+            return entry[1]
+        entry = caches[CACHE_ALIAS].get(self.sharedKey(key))
+        if entry is not None and entry[0] == version:
+            self.count("shared_hits")
+            self.local.set(key, entry)
+            return entry[1]
+        self.count("misses")
+        return None
+    def set(self, key, version, value):
+        entry = (version, value)
+        self.local.set(key, entry)
+        caches[CACHE_ALIAS].set(self.sharedKey(key), entry, CACHE_TIMEOUT)
+    def delete(self, key):
+        self.local.delete(key)
+        caches[CACHE_ALIAS].delete(self.sharedKey(key))
+    def stats(self):
+        with self.countersLock:
+            data = dict(self.counters)
+        data.update({"local_size": len(self.local), "local_maxsize": self.local.maxsize})
+        if isinstance(self.local, SizedLRUCache):
+            data.update({"local_bytes": self.local.bytes, "local_maxbytes": self.local.maxbytes})
+        return data
+
+pageStyles = TieredCache("styles")
+#payloads are lists of encoded chunks of up to MAX_PAYLOAD_BYTES each
+projectData = TieredCache("data", maxbytes=LOCAL_PAYLOAD_BYTES, sizeof=lambda chunks: sum(map(len, chunks)))
+pageCSS = TieredCache("css")
+
+def cachedPageStyles(page):
+    #{comp_id: style} for the page, the returned dict is shared and must not be mutated
+    styles = pageStyles.get(page.id, page.version)
+    if styles is None:
+        styles = compilePageStyles(Style.resolve(list(page.components.all())))
+        pageStyles.set(page.id, page.version, styles)
+    return styles
+
+def cachedPagesCSS(pages):
+    #{page id: css} for the given pages, only pages whose version moved are recompiled, from one component query
+    css, stale = {}, []
+    for page in pages:
+        entry = pageCSS.get(page.id, page.version)
+        if entry is None:
+            stale.append(page)
+        else:
+            css[page.id] = entry
+    if stale:
+        components = defaultdict(list)
+        for comp in Style.resolve(list(Component.objects.filter(page__in=stale).order_by("page_id", "id"))):
+            components[comp.page_id].append(comp)
+        for page in stale:
+            styles = compilePageStyles(components[page.id])
+            pageStyles.set(page.id, page.version, styles)
+            css[page.id] = compilePageCSS(page.id, styles)
+            pageCSS.set(page.id, page.version, css[page.id])
+    return css
+
+def recordChunks(project, chunks):
+    #pass encoded chunks through, caching them once the whole payload has been produced
+    recorded = []
+    size = 0
+    for chunk in chunks:
+        if recorded is not None:
+            size += len(chunk)
+            if size > MAX_PAYLOAD_BYTES:
+                recorded = None
+            else:
+                recorded.append(chunk)
+        yield chunk
+    if recorded is not None:
+        projectData.set(project.id, project.version, recorded)
+
+def cacheStats():
+    return {"styles": pageStyles.stats(), "css": pageCSS.stats(), "data": projectData.stats()}
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_cache_changed(sender, instance, **kwargs):
+    projectData.delete(instance.id)
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def page_cache_changed(sender, instance, **kwargs):
+    pageStyles.delete(instance.id)
+    pageCSS.delete(instance.id)
+    projectData.delete(instance.project_id)
+
+@receiver(post_save, sender=Component)
+@receiver(post_delete, sender=Component)
+def component_cache_changed(sender, instance, **kwargs):
+    pageStyles.delete(instance.page_id)
+    pageCSS.delete(instance.page_id)
+    #only evict when the page is already loaded, the version check covers the rest
+    if Component.page.is_cached(instance):
+        projectData.delete(instance.page.project_id)
+
+@receiver(components_changed)
+def components_cache_changed(sender, project, pages=None, **kwargs):
+    for page_id in pages if pages is not None else project.pages.values_list("id", flat=True):
+        pageStyles.delete(page_id)
+        pageCSS.delete(page_id)
+    projectData.delete(project.id)
@@ -0,0 +1,158 @@
+# per project change feed: every committed write publishes one compact event tagged with the project
+# version it produced, the sse endpoints replay the events a client missed; the async one then follows new ones,
+# the sync one answers like a long poll so it does not pin a worker
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+from rest_framework import renderers
+from .eventBus import createBus
+from .jsonCodec import dumps
+from .models import Project, Page, Component
+from .signals import components_changed
+
+FEED_ENABLED = getattr(settings, "CRAYKOI_CHANGE_FEED", True)
+#seconds between keep-alive comments on an idle stream
+FEED_HEARTBEAT = getattr(settings, "CRAYKOI_FEED_HEARTBEAT", 15)
+#async streams end after this many seconds so they do not pin a connection, EventSource reconnects with Last-Event-ID
+FEED_MAX_SECONDS = getattr(settings, "CRAYKOI_FEED_MAX_SECONDS", 300)
+#seconds the sync stream waits for new events when there is nothing to catch up on, it holds a worker meanwhile
+FEED_POLL_SECONDS = getattr(settings, "CRAYKOI_FEED_POLL_SECONDS", 5)
+#bulk writes of more components than this only publish the ids of the changed pages
+FEED_MAX_ITEMS = getattr(settings, "CRAYKOI_FEED_MAX_ITEMS", 500)
+#milliseconds EventSource waits before reconnecting
+FEED_RETRY_MS = getattr(settings, "CRAYKOI_FEED_RETRY_MS", 3000)
+
+bus = createBus()
+
+def encodeEvent(version, name, data):
+    #compact json never contains a newline, so the data fits on a single line
+    return f"id: {version}\nevent: {name}\ndata: ".encode() + dumps(dict(data, version=version)) + b"\n\n"
+
+def resetFrame(version):
+    #the client missed events that are no longer kept and has to reload the project
+    return encodeEvent(version, "reset", {})
+
+def publish(name, data, **lookup):
+    #runs right after the version bump receivers, the event is sent once the write is committed
+    if not FEED_ENABLED:
+        return
+    row = Project.objects.filter(**lookup).values_list("id", "version").first()
+    if row is None:
+        return
+    project_id, version = row
+    frame = encodeEvent(version, name, data)
+    transaction.on_commit(lambda: bus.publish(project_id, version, frame))
+
+def componentChanges(saved=(), deleted=()):
+    #{page id: {"saved": [component data], "deleted": [comp_id]}}
+    pages = {}
+    for comp in saved:
+        pages.setdefault(str(comp.page_id), {"saved": [], "deleted": []})["saved"].append(comp.getData())
+    for comp in deleted:
+        pages.setdefault(str(comp.page_id), {"saved": [], "deleted": []})["deleted"].append(comp.comp_id)
+    return {"pages": pages}
+
+@receiver(post_save, sender=Page)
+def page_feed_saved(sender, instance, **kwargs):
+    publish("page", {"id": instance.id, "title": instance.title}, pk=instance.project_id)
+
+@receiver(post_delete, sender=Page)
+def page_feed_deleted(sender, instance, **kwargs):
+    publish("page", {"id": instance.id, "deleted": True}, pk=instance.project_id)
+
+@receiver(post_save, sender=Component)
+def component_feed_saved(sender, instance, **kwargs):
+    publish("components", componentChanges(saved=[instance]), pages=instance.page_id)
+
+@receiver(post_delete, sender=Component)
+def component_feed_deleted(sender, instance, **kwargs):
+    publish("components", componentChanges(deleted=[instance]), pages=instance.page_id)
+
+@receiver(components_changed)
+def components_feed_changed(sender, project, pages=None, saved=None, deleted=None, **kwargs):
+    if (saved is None and deleted is None) or len(saved or ()) + len(deleted or ()) > FEED_MAX_ITEMS:
+        #clients reload these pages (every page when None)
+        publish("pages", {"pages": None if pages is None else sorted(pages)}, pk=project.id)
+    else:
+        publish("components", componentChanges(saved or (), deleted or ()), pk=project.id)
+
+@receiver(post_delete, sender=Project)
+def project_feed_deleted(sender, instance, **kwargs):
+    #after the events of the cascade, which are published on commit too
+    if FEED_ENABLED:
+        transaction.on_commit(lambda: bus.drop(instance.id))
+
+def resumeVersion(request):
+    #Last-Event-ID is sent by a reconnecting EventSource, ?version= by a client that just loaded the listing
+    value = request.META.get("HTTP_LAST_EVENT_ID") or request.GET.get("version")
+    if not value:
+        return None
+    version = int(value)
+    if version < 0:
+        raise ValueError(value)
+    return version
+
+def nextFrames(events, last):
+    #(frames, version reached) for the (version, frame) events newer than last
+    if not events:
+        return [], last
+    newest = events[-1][0]
+    if events[0][0] > last + 1:
+        #the backlog was trimmed past the client
+        return [resetFrame(newest)], newest
+    return [frame for version, frame in events], newest
+
+def startFrames(project, since, events):
+    #frames that bring a client at version since up to date with the project it just loaded
+    if since is None:
+        return [], project.version
+    if since > project.version or (since < project.version and not events):
+        return [resetFrame(project.version)], project.version
+    return nextFrames(events, since)
+
+def eventStream(project, since):
+    #sync workers are few, so the stream answers like a long poll: it sends the catch-up, or the first events within
+    #FEED_POLL_SECONDS when there is none, and ends; EventSource reconnects after FEED_RETRY_MS with Last-Event-ID
+    frames, last = startFrames(project, since, None if since is None else bus.since(project.id, since))
+    yield f"retry: {FEED_RETRY_MS}\n\n".encode() + b"".join(frames)
+    if not frames and FEED_POLL_SECONDS > 0:
+        events = bus.wait(project.id, last, FEED_POLL_SECONDS)
+        if events:
+            yield b"".join(nextFrames(events, last)[0])
+
+async def asyncEventStream(project, since):
+    #same stream for async views, waits run in a thread of their own instead of the shared sync thread
+    since_events = None if since is None else await sync_to_async(bus.since, thread_sensitive=False)(project.id, since)
+    frames, last = startFrames(project, since, since_events)
+    yield f"retry: {FEED_RETRY_MS}\n\n".encode() + b"".join(frames)
+    deadline = time.monotonic() + FEED_MAX_SECONDS
+    remaining = FEED_MAX_SECONDS
+    while remaining > 0:
+        events = await sync_to_async(bus.wait, thread_sensitive=False)(project.id, last, min(FEED_HEARTBEAT, remaining))
+        if events:
+            frames, last = nextFrames(events, last)
+            yield b"".join(frames)
+        else:
+            yield b": keep-alive\n\n"
+        remaining = deadline - time.monotonic()
+
+def feedResponse(stream):
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    #keeps nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        #only errors go through the renderer, they are sent as a single error event
+        if data is None:
+            return b""
+        return b"event: error\ndata: " + dumps(data) + b"\n\n"
@@ -0,0 +1,46 @@
+# server-side copies of projects and pages, component rows are copied by the database without passing through python
+from django.db import connection, transaction
+from .models import Project, Page, Component
+from .signals import components_changed
+
+def copyName(name, max_length):
+    #"name (copy)", shortened so it still fits the column
+    suffix = " (copy)"
+    return name[:max_length - len(suffix)] + suffix
+
+def copyComponents(pageMap):
+    #one INSERT ... SELECT copying every component of the pages in {source page id: target page id}
+    #comp_id and parent are scoped by the page, so they are copied verbatim and the tree stays consistent
+    if not pageMap:
+        return 0
+    quote = connection.ops.quote_name
+    table = quote(Component._meta.db_table)
+    page = quote(Component._meta.get_field("page").column)
+    columns = ", ".join(quote(field.column) for field in Component._meta.concrete_fields if not field.primary_key and field.name != "page")
+    cases = " ".join("WHEN %s THEN %s" for _ in pageMap)
+    placeholders = ", ".join("%s" for _ in pageMap)
+    sql = (f"INSERT INTO {table} ({page}, {columns}) "
+        f"SELECT CASE {page} {cases} END, {columns} FROM {table} WHERE {page} IN ({placeholders}) ORDER BY {quote(Component._meta.pk.column)}")
+    params = [value for pair in pageMap.items() for value in pair] + list(pageMap)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+def cloneProject(project, name):
+    #the copy belongs to the same user and starts at version 0; styles are interned, so they are shared, not copied
+    with transaction.atomic():
+        copy = Project.objects.create(user_id=project.user_id, name=name)
+        pages = list(project.pages.order_by("id"))
+        Page.objects.bulk_create([Page(project=copy, title=page.title) for page in pages])
+        #titles are unique per project, they map every source page to its copy without relying on returned ids
+        copies = dict(copy.pages.values_list("title", "id"))
+        copyComponents({page.id: copies[page.title] for page in pages})
+    return copy
+
+def clonePage(page, title):
+    #the copy is added to the page's own project, which gets a version bump like any other write
+    with transaction.atomic():
+        copy = Page.objects.create(project_id=page.project_id, title=title)
+        if copyComponents({page.id: copy.id}):
+            components_changed.send(sender=Component, project=page.project, pages={copy.id})
+    return copy
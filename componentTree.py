@@ -0,0 +1,84 @@
+# materialized paths of the component trees, a page's components form a forest keyed by comp_id
+#
+# a path is the comp_ids from the root down to the component itself, each followed by "/" and with "\" and "/"
+# escaped, so a component's subtree is every row of the page whose path starts with its own
+# a parent that does not exist (rows written before parents were checked) acts as a root of its own: such a
+# child is stored under "/<parent comp_id>/", which is exactly where it belongs once that parent is created
+# as a root; creating or moving it anywhere else rewrites the subtree
+#
+# subtrees are selected with a range on the path, which relies on a binary collation of the column
+# (sqlite's default; on postgres the column needs the "C" collation)
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Substr
+
+ROOT = "/"
+#subtree ranges per query, sqlite refuses expression trees deeper than 1000
+SUBTREE_BATCH = 200
+
+class TreeError(ValueError):
+    def __init__(self, errors):
+        #{(page id, comp_id): [messages]}
+        super().__init__("Invalid component tree.")
+        self.errors = errors
+
+def segment(comp_id):
+    return comp_id.replace("\\", "\\\\").replace("/", "\\/") + "/"
+
+def childPath(parentPath, comp_id):
+    return parentPath + segment(comp_id)
+
+def subtreeFilter(page_id, path):
+    #the component with that path and every descendant, "0" is the character right after "/"
+    return Q(page_id=page_id, path__gte=path, path__lt=path[:-1] + "0")
+
+def subtreesFilters(page_id, paths):
+    #subtreeFilter of every path, SUBTREE_BATCH at a time
+    for start in range(0, len(paths), SUBTREE_BATCH):
+        condition = subtreeFilter(page_id, paths[start])
+        for path in paths[start + 1:start + SUBTREE_BATCH]:
+            condition |= subtreeFilter(page_id, path)
+        yield condition
+
+def ancestorPaths(path):
+    #the path of every ancestor of the component with that path and its own, shortest first
+    escaped = False
+    for index, char in enumerate(path):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == "/" and index:
+            yield path[:index + 1]
+
+def movedPath(oldPath, newPath):
+    #expression rewriting the paths of a subtree that moves from oldPath to newPath, for a single UPDATE
+    return Concat(Value(newPath), Substr("path", len(oldPath) + 1))
+
+def resolvePaths(parents, known):
+    #paths of the components in parents {comp_id: parent comp_id}; a parent outside of parents takes its path
+    #from known {comp_id: path} or is a missing parent; returns (paths, comp_ids on or under a cycle)
+    paths, cycles = {}, set()
+    for start in parents:
+        chain, seen = [], set()
+        node = start
+        while node is not None and node in parents and node not in paths and node not in cycles:
+            if node in seen:
+                break
+            chain.append(node)
+            seen.add(node)
+            node = parents[node]
+        else:
+            if node in cycles:
+                cycles.update(chain)
+                continue
+            if node is None:
+                base = ROOT
+            elif node in paths:
+                base = paths[node]
+            else:
+                base = known.get(node, ROOT + segment(node))
+            for comp_id in reversed(chain):
+                base = paths[comp_id] = childPath(base, comp_id)
+            continue
+        cycles.update(chain)
+    return paths, cycles
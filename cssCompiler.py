@@ -0,0 +1,109 @@
+# turns computed page styles into css, one rule per component scoped by its page
+import json
+import re
+from django.utils.http import quote_etag
+from rest_framework import renderers
+
+#bump whenever the generated css changes shape, it is part of every css etag
+CSS_FORMAT = 3
+
+#keys clients keep in secondary_state that are not style properties
+NON_STYLE_KEYS = {"page"}
+
+PROPERTY_NAME = re.compile(r"^-?[A-Za-z][A-Za-z0-9-]*$")
+#characters that would let a value end its declaration or rule, and comment markers that would swallow the next ones
+UNSAFE_VALUE = re.compile(r"[;{}<>\\\n\r]|/\*|\*/")
+CLOSING = {"(": ")", "[": "]"}
+
+#properties whose numbers React writes without a unit, every other number is a length in px
+UNITLESS = {
+    "animationIterationCount", "aspectRatio", "borderImageOutset", "borderImageSlice", "borderImageWidth", "boxFlex",
+    "boxFlexGroup", "boxOrdinalGroup", "columnCount", "columns", "flex", "flexGrow", "flexPositive", "flexShrink",
+    "flexNegative", "flexOrder", "gridArea", "gridRow", "gridRowEnd", "gridRowSpan", "gridRowStart", "gridColumn",
+    "gridColumnEnd", "gridColumnSpan", "gridColumnStart", "fontWeight", "lineClamp", "lineHeight", "opacity", "order",
+    "orphans", "scale", "tabSize", "widows", "zIndex", "zoom", "fillOpacity", "floodOpacity", "stopOpacity",
+    "strokeDasharray", "strokeDashoffset", "strokeMiterlimit", "strokeOpacity", "strokeWidth",
+}
+VENDOR_PREFIX = re.compile(r"^(?:Webkit|Moz|ms|O)(?=[A-Z])")
+
+propertyNames = {}
+
+def balanced(value):
+    #quotes have to close and brackets outside of them have to pair up, otherwise the rest of the sheet becomes
+    #part of the value; escapes never reach here, UNSAFE_VALUE drops backslashes
+    quote, brackets = None, []
+    for char in value:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in CLOSING:
+            brackets.append(CLOSING[char])
+        elif char in ")]":
+            if not brackets or brackets.pop() != char:
+                return False
+    return quote is None and not brackets
+
+def cssProperty(name):
+    #backgroundColor -> background-color, WebkitTransform/msTransform -> -webkit-transform/-ms-transform
+    prop = propertyNames.get(name)
+    if prop is None:
+        if not PROPERTY_NAME.match(name):
+            prop = ""
+        else:
+            prop = re.sub(r"([A-Z])", r"-\1", name).lower()
+            if name.startswith("ms") and name[2:3].isupper():
+                prop = "-" + prop
+        propertyNames[name] = prop
+    return prop
+
+def isUnitless(name):
+    #WebkitLineClamp is looked up as lineClamp
+    name = VENDOR_PREFIX.sub("", name)
+    return name[:1].lower() + name[1:] in UNITLESS
+
+def cssValue(value, name=None):
+    #strings and numbers only, anything that could break out of the declaration is dropped; numbers of the named
+    #property get px unless it is unitless or they are 0, the way React renders a style object
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    if not isinstance(value, str) and name is not None and value != 0 and not isUnitless(name):
+        return f"{value}px"
+    value = str(value)
+    if not value or UNSAFE_VALUE.search(value) or not balanced(value):
+        return None
+    return value
+
+def cssString(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\a ").replace("\r", "\\d ") + '"'
+
+def compilePageCSS(page_id, styles):
+    #styles is the {comp_id: style} mapping of compilePageStyles, rules keep its order
+    rules = []
+    for comp_id, style in styles.items():
+        declarations = []
+        for name, value in style.items():
+            if name in NON_STYLE_KEYS:
+                continue
+            prop, value = cssProperty(name), cssValue(value, name)
+            if prop and value is not None:
+                declarations.append(f"{prop}:{value};")
+        rules.append(f'[data-page="{page_id}"] [data-comp={cssString(comp_id)}]{{{"".join(declarations)}}}\n')
+    return "".join(rules)
+
+def cssETag(key):
+    #strong etag: the css is fully determined by the versions in key and CSS_FORMAT
+    return quote_etag(f"css{CSS_FORMAT}-{key}")
+
+class CSSRenderer(renderers.BaseRenderer):
+    media_type = "text/css"
+    format = "css"
+    charset = "utf-8"
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, str):
+            return data.encode()
+        #errors are reported as a comment so the body is still a stylesheet
+        return ("/* " + json.dumps(data).replace("*/", "* /") + " */\n").encode()
@@ -0,0 +1,129 @@
+# keyset pagination, page and viewport filters and field projection for the component listing
+import base64
+from django.conf import settings
+from django.db.models import Q
+from .models import Component
+from .spatialGrid import viewportFilter
+
+PAGE_SIZE = getattr(settings, "CRAYKOI_PAGE_SIZE", 100)
+MAX_PAGE_SIZE = getattr(settings, "CRAYKOI_MAX_PAGE_SIZE", 1000)
+
+#query parameters that switch the listing from the full project payload to a filtered one
+LISTING_PARAMS = ("page", "page_title", "fields", "limit", "cursor")
+
+#item keys stored in their own column, any other key is read from secondary_state
+COLUMN_KEYS = {"id": "comp_id", "left": "left", "top": "top", "width": "width", "height": "height", "parent": "parent"}
+
+#range of the integer columns and ids, larger numbers overflow the database driver
+MIN_INT, MAX_INT = -2 ** 31, 2 ** 31 - 1
+
+class ListingError(ValueError):
+    pass
+
+def encodeCursor(component):
+    #opaque position after the given component in (page_id, id) order
+    return base64.urlsafe_b64encode(f"{component.page_id}:{component.id}".encode()).decode().rstrip("=")
+
+def decodeCursor(cursor):
+    try:
+        page_id, pk = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        page_id, pk = int(page_id), int(pk)
+    except ValueError:
+        raise ListingError("Invalid cursor.")
+    if not (MIN_INT <= page_id <= MAX_INT and MIN_INT <= pk <= MAX_INT):
+        raise ListingError("Invalid cursor.")
+    return page_id, pk
+
+def positiveInt(params, name):
+    try:
+        value = int(params[name])
+    except ValueError:
+        raise ListingError(f"{name} must be an integer.")
+    if value < 1:
+        raise ListingError(f"{name} must be positive.")
+    if value > MAX_INT:
+        raise ListingError(f"{name} must be at most {MAX_INT}.")
+    return value
+
+def parseListing(params):
+    #returns None when no listing parameter is given, raises ListingError on bad input
+    if not any(name in params for name in LISTING_PARAMS):
+        return None
+    listing = {"page": None, "page_title": params.get("page_title"), "fields": None, "limit": None, "after": None}
+    if "page" in params:
+        listing["page"] = positiveInt(params, "page")
+    if "fields" in params:
+        fields = [field for field in params["fields"].split(",") if field]
+        if not fields:
+            raise ListingError("fields must name at least one field.")
+        listing["fields"] = fields
+    if "limit" in params:
+        listing["limit"] = min(positiveInt(params, "limit"), MAX_PAGE_SIZE)
+    if "cursor" in params:
+        listing["after"] = decodeCursor(params["cursor"])
+        listing["limit"] = listing["limit"] or PAGE_SIZE
+    return listing
+
+def parseViewport(params):
+    #{"left", "top", "width", "height", "fields"} of a viewport query, raises ListingError on bad input
+    viewport = {}
+    for name in ("left", "top", "width", "height"):
+        if name not in params:
+            raise ListingError(f"{name} is required.")
+        try:
+            viewport[name] = int(params[name])
+        except ValueError:
+            raise ListingError(f"{name} must be an integer.")
+        if not MIN_INT <= viewport[name] <= MAX_INT:
+            raise ListingError(f"{name} must be between {MIN_INT} and {MAX_INT}.")
+    if viewport["width"] < 0 or viewport["height"] < 0:
+        raise ListingError("width and height must not be negative.")
+    viewport["fields"] = [field for field in params.get("fields", "").split(",") if field] or None
+    return viewport
+
+def projectColumns(components, fields):
+    #the style reference is a short key, the style data itself comes from the style cache
+    columns = {COLUMN_KEYS[field] for field in fields if field in COLUMN_KEYS}
+    return components.only("page", "comp_id", "style", *columns)
+
+def viewportComponents(page, left, top, width, height, fields=None):
+    #components of the page intersecting the rectangle, in id order; the cost follows the rows found, not the page size
+    components = Component.objects.filter(viewportFilter(page, left, top, width, height))
+    if fields is not None:
+        components = projectColumns(components, fields)
+    return components.order_by("id")
+
+def filterComponents(project, page=None, page_title=None, fields=None):
+    #components of the project in (page_id, id) order, only loading the columns the projection needs
+    components = Component.objects.filter(page__project=project)
+    if page is not None:
+        components = components.filter(page_id=page)
+    if page_title is not None:
+        components = components.filter(page__title=page_title)
+    if fields is not None:
+        components = projectColumns(components, fields)
+    return components.order_by("page_id", "id")
+
+def needsStyles(fields):
+    return fields is None or any(field not in COLUMN_KEYS for field in fields)
+
+def projectItem(component, fields=None):
+    #same shape as getData restricted to fields, the id is always included
+    if fields is None:
+        return component.getData()
+    item = {"id": component.comp_id}
+    for field in fields:
+        if field in COLUMN_KEYS:
+            item[field] = getattr(component, COLUMN_KEYS[field])
+        elif field in component.secondary_state:
+            item[field] = component.secondary_state[field]
+    return item
+
+def componentPage(components, limit, after=None):
+    #keyset page: rows inserted or deleted behind the cursor never shift the following pages
+    if after is not None:
+        page_id, pk = after
+        components = components.filter(Q(page_id__gt=page_id) | Q(page_id=page_id, id__gt=pk))
+    rows = list(components[:limit + 1])
+    cursor = encodeCursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], cursor
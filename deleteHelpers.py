@@ -0,0 +1,84 @@
+# deletes that skip django's collector for component rows: they go with bulk DELETEs, while the signals that
+# need an instance (version bumps, cache evictions, the change feed) still fire for the page or project itself
+import logging
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+from .models import Project, Page, Component
+
+logger = logging.getLogger(__name__)
+
+#projects with more components than this are hidden at once and purged in the background
+PURGE_THRESHOLD = getattr(settings, "CRAYKOI_PURGE_THRESHOLD", 5000)
+#components deleted per purge transaction, so no lock is held for long
+PURGE_CHUNK_SIZE = getattr(settings, "CRAYKOI_PURGE_CHUNK_SIZE", 2000)
+
+#purges run one after the other, off the request threads
+purgeExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="craykoi-purge")
+
+def rawDelete(queryset):
+    #one DELETE statement, no rows are loaded and no signals are sent
+    return queryset._raw_delete(queryset.db)
+
+def deletePage(page):
+    #the page delete afterwards finds no components left and only sends the page's own post_delete
+    with transaction.atomic():
+        rawDelete(Component.objects.filter(page_id=page.id))
+        page.delete()
+
+def isLarge(project):
+    return Component.objects.filter(page__project=project)[PURGE_THRESHOLD:].exists()
+
+def deleteProject(project):
+    #returns True when the delete was deferred: the project is hidden now and purged later
+    if isLarge(project):
+        hideProject(project)
+        return True
+    with transaction.atomic():
+        removeRows(project.id)
+        project.delete()
+    return False
+
+def removeRows(project_id):
+    #pages need no signals either: their cache entries are unreachable once the project is gone and age out
+    rawDelete(Component.objects.filter(page__project_id=project_id))
+    rawDelete(Page.objects.filter(project_id=project_id))
+
+def hideProject(project):
+    #a single UPDATE takes the project out of every lookup and frees its name for a new project
+    Project.objects.filter(pk=project.pk).update(hidden=True, name=f"deleted-{project.pk}-{secrets.token_hex(8)}")
+    transaction.on_commit(lambda: purgeExecutor.submit(purgeInBackground, project.pk))
+
+def purgeProject(project_id, chunk_size=PURGE_CHUNK_SIZE):
+    #deletes the components of a hidden project one chunk per transaction, then the project itself
+    components = Component.objects.filter(page__project_id=project_id)
+    while True:
+        with transaction.atomic():
+            ids = list(components.values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                break
+            rawDelete(Component.objects.filter(pk__in=ids))
+    project = Project.objects.filter(pk=project_id, hidden=True).first()
+    if project is not None:
+        with transaction.atomic():
+            removeRows(project_id)
+            project.delete()
+
+def purgeInBackground(project_id):
+    try:
+        purgeProject(project_id)
+    except Exception:
+        #the project stays hidden, the purge_projects command picks it up again
+        logger.exception("purging project %s failed", project_id)
+    finally:
+        #connections are per thread, this one would otherwise stay open
+        connections.close_all()
+
+def purgeHidden():
+    #every project left hidden, e.g. by a restart during a background purge
+    purged = 0
+    for project_id in Project.objects.filter(hidden=True).values_list("id", flat=True):
+        purgeProject(project_id)
+        purged += 1
+    return purged
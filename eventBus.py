@@ -0,0 +1,145 @@
+# backends of the project change feed, free of model imports like localCache
+# a bus keeps the last FEED_BACKLOG encoded events of every project as (version, frame) pairs ordered by version
+import threading
+import time
+from bisect import insort
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+#memory, redis or local-redis (the in-process stand-in for redis, same code path as redis)
+FEED_BUS = getattr(settings, "CRAYKOI_FEED_BUS", "memory")
+FEED_BACKLOG = getattr(settings, "CRAYKOI_FEED_BACKLOG", 1000)
+FEED_REDIS_URL = getattr(settings, "CRAYKOI_FEED_REDIS_URL", "redis://localhost:6379/0")
+#seconds a redis backlog outlives the last event of its project
+FEED_REDIS_TTL = getattr(settings, "CRAYKOI_FEED_REDIS_TTL", 24 * 3600)
+#seconds between two reads of a redis backlog by a waiting subscriber
+FEED_POLL_INTERVAL = getattr(settings, "CRAYKOI_FEED_POLL_INTERVAL", 0.1)
+
+class InProcessBus:
+    #subscribers are woken as soon as an event is published, but only those of this process
+    def __init__(self, backlog=FEED_BACKLOG):
+        self.backlog = backlog
+        self.events = {}
+        self.condition = threading.Condition()
+    def publish(self, project_id, version, frame):
+        with self.condition:
+            events = self.events.setdefault(project_id, [])
+            #commits of concurrent writes may publish out of order
+            insort(events, (version, frame))
+            del events[:-self.backlog]
+            self.condition.notify_all()
+    def since(self, project_id, version):
+        with self.condition:
+            return [event for event in self.events.get(project_id, ()) if event[0] > version]
+    def wait(self, project_id, version, timeout):
+        #events newer than version, an empty list once timeout seconds passed without any
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                events = [event for event in self.events.get(project_id, ()) if event[0] > version]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self.condition.wait(remaining)
+    def drop(self, project_id):
+        with self.condition:
+            self.events.pop(project_id, None)
+
+class RedisBus:
+    #one sorted set per project scored by version, shared by every process; waiting subscribers poll it
+    def __init__(self, client, prefix="craykoi:feed", backlog=FEED_BACKLOG, ttl=FEED_REDIS_TTL, poll_interval=FEED_POLL_INTERVAL):
+        self.client = client
+        self.prefix = prefix
+        self.backlog = backlog
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+    def key(self, project_id):
+        return f"{self.prefix}:{project_id}"
+    def publish(self, project_id, version, frame):
+        key = self.key(project_id)
+        self.client.zadd(key, {frame: version})
+        self.client.zremrangebyrank(key, 0, -self.backlog - 1)
+        self.client.expire(key, self.ttl)
+    def since(self, project_id, version):
+        return [(int(score), frame) for frame, score in self.client.zrangebyscore(self.key(project_id), f"({version}", "+inf", withscores=True)]
+    def wait(self, project_id, version, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.since(project_id, version)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            time.sleep(min(self.poll_interval, remaining))
+    def drop(self, project_id):
+        self.client.delete(self.key(project_id))
+
+class LocalRedis:
+    #in-memory stand-in for the part of the redis-py client RedisBus uses, for tests and single process setups
+    def __init__(self):
+        self.sets = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+    def members(self, name):
+        #sorted set as {member: score}, dropped once its ttl passed
+        if name in self.expires and self.expires[name] <= time.monotonic():
+            self.sets.pop(name, None)
+            del self.expires[name]
+        return self.sets.get(name, {})
+    def ranked(self, name):
+        #redis orders equal scores by member
+        return sorted(self.members(name).items(), key=lambda item: (item[1], item[0]))
+    def zadd(self, name, mapping):
+        with self.lock:
+            members = self.sets.setdefault(name, self.members(name))
+            added = sum(1 for member in mapping if member not in members)
+            members.update((member, float(score)) for member, score in mapping.items())
+            return added
+    def zrangebyscore(self, name, min, max, withscores=False):
+        low, high = scoreBound(min), scoreBound(max)
+        with self.lock:
+            items = [item for item in self.ranked(name) if low(item[1], True) and high(item[1], False)]
+        return items if withscores else [member for member, score in items]
+    def zremrangebyrank(self, name, start, end):
+        with self.lock:
+            ranked = self.ranked(name)
+            count = len(ranked)
+            start, end = start + count if start < 0 else start, end + count if end < 0 else end
+            removed = ranked[max(start, 0):end + 1] if end >= 0 else []
+            for member, score in removed:
+                del self.sets[name][member]
+            return len(removed)
+    def expire(self, name, time_):
+        with self.lock:
+            if name not in self.sets:
+                return False
+            self.expires[name] = time.monotonic() + time_
+            return True
+    def delete(self, *names):
+        with self.lock:
+            removed = 0
+            for name in names:
+                removed += self.sets.pop(name, None) is not None
+                self.expires.pop(name, None)
+            return removed
+
+def scoreBound(bound):
+    #redis score bound ("-inf", "+inf", "(5" exclusive, "5" inclusive) as a test of a score
+    bound = bound.decode() if isinstance(bound, bytes) else str(bound)
+    exclusive = bound.startswith("(")
+    value = float(bound[1:] if exclusive else bound)
+    def check(score, lower):
+        if lower:
+            return score > value if exclusive else score >= value
+        return score < value if exclusive else score <= value
+    return check
+
+def createBus(kind=FEED_BUS):
+    if kind == "memory":
+        return InProcessBus()
+    if kind == "local-redis":
+        return RedisBus(LocalRedis())
+    if kind == "redis":
+        #optional dependency, only needed when the feed is shared between processes
+        import redis
+        return RedisBus(redis.Redis.from_url(FEED_REDIS_URL))
+    raise ImproperlyConfigured(f"Unknown CRAYKOI_FEED_BUS {kind!r}, expected memory, redis or local-redis.")
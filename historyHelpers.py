@@ -0,0 +1,209 @@
+# project history: every write stores a revision, a full snapshot at most every HISTORY_SNAPSHOT_INTERVAL
+# revisions and otherwise a delta holding only the changed fields of the changed components
+#
+# a row is [style digest, left, top, width, height, parent]; styles are interned, so history never repeats
+# the secondary_state blobs themselves
+#   snapshot: {"pages": {page id: title}, "components": {page id: {comp_id: row}}}
+#   delta:    {"pages": {page id: title}, "drop": [page id], "del": {page id: [comp_id]},
+#              "set": {page id: {comp_id: {field: value}}}}
+# a point in time is rebuilt from the nearest snapshot at or before it plus the deltas written since
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery, QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Project, Page, Component, Revision, Style
+from .signals import components_changed
+from .deleteHelpers import rawDelete
+
+HISTORY_ENABLED = getattr(settings, "CRAYKOI_HISTORY", True)
+#a restore replays at most this many deltas
+HISTORY_SNAPSHOT_INTERVAL = getattr(settings, "CRAYKOI_HISTORY_SNAPSHOT_INTERVAL", 50)
+#revisions listed by the history endpoint
+HISTORY_LIST_SIZE = getattr(settings, "CRAYKOI_HISTORY_LIST_SIZE", 100)
+
+ROW_FIELDS = ["style", "left", "top", "width", "height", "parent"]
+ROW_ATTRIBUTES = ["style_id", "left", "top", "width", "height", "parent"]
+ROW_INDEX = {field: index for index, field in enumerate(ROW_FIELDS)}
+
+def componentRow(comp):
+    return [getattr(comp, attribute) for attribute in ROW_ATTRIBUTES]
+
+def changedValues(comp, fields=None):
+    #{row field: value} for the given model field names, the whole row when None
+    row = componentRow(comp)
+    if fields is None:
+        return dict(zip(ROW_FIELDS, row))
+    names = {"style" if field == "secondary_state" else field for field in fields}
+    return {field: row[ROW_INDEX[field]] for field in ROW_FIELDS if field in names}
+
+def snapshotData(project_id):
+    #one query, the left join keeps the pages without components
+    pages, components = {}, {}
+    columns = ["id", "title", "components__comp_id"] + [f"components__{attribute}" for attribute in ROW_ATTRIBUTES]
+    for page_id, title, comp_id, *row in Page.objects.filter(project_id=project_id).order_by("id", "components__id").values_list(*columns):
+        pages[str(page_id)] = title
+        page = components.setdefault(str(page_id), {})
+        if comp_id is not None:
+            page[comp_id] = row
+    return {"pages": pages, "components": components}
+
+def record(delta, **lookup):
+    #stores delta (None forces a snapshot) for the project version the write just produced
+    if not HISTORY_ENABLED:
+        return
+    depth = Revision.objects.filter(project=OuterRef("pk")).order_by("-version", "-id").values("depth")[:1]
+    row = Project.objects.filter(**lookup).annotate(history_depth=Subquery(depth)).values_list("id", "version", "history_depth").first()
+    if row is None:
+        return
+    project_id, version, depth = row
+    if delta is None or depth is None or depth >= HISTORY_SNAPSHOT_INTERVAL:
+        Revision.objects.create(project_id=project_id, version=version, snapshot=True, data=snapshotData(project_id))
+    else:
+        Revision.objects.create(project_id=project_id, version=version, depth=depth + 1, data=delta)
+
+def ownDelete(origin):
+    #deletes cascading from a project or user take the project's revisions with them
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Page, Component)
+
+@receiver(post_save, sender=Page)
+def page_history_saved(sender, instance, **kwargs):
+    record({"pages": {str(instance.id): instance.title}}, pk=instance.project_id)
+
+@receiver(post_delete, sender=Page)
+def page_history_deleted(sender, instance, origin=None, **kwargs):
+    if ownDelete(origin):
+        record({"drop": [str(instance.id)]}, pk=instance.project_id)
+
+@receiver(post_save, sender=Component)
+def component_history_saved(sender, instance, **kwargs):
+    record({"set": {str(instance.page_id): {instance.comp_id: changedValues(instance)}}}, pages=instance.page_id)
+
+@receiver(post_delete, sender=Component)
+def component_history_deleted(sender, instance, origin=None, **kwargs):
+    if ownDelete(origin):
+        record({"del": {str(instance.page_id): [instance.comp_id]}}, pages=instance.page_id)
+
+@receiver(components_changed)
+def components_history_changed(sender, project, pages=None, saved=None, deleted=None, fields=None, **kwargs):
+    if saved is None and deleted is None:
+        #the bulk write did not say what changed
+        record(None, pk=project.id)
+        return
+    fields = fields or {}
+    changes, removed = {}, {}
+    for comp in saved or ():
+        #components created without a returned pk are not hashable, they changed entirely anyway
+        changes.setdefault(str(comp.page_id), {})[comp.comp_id] = changedValues(comp, fields.get(comp) if comp.pk is not None else None)
+    for comp in deleted or ():
+        removed.setdefault(str(comp.page_id), []).append(comp.comp_id)
+    record({"set": changes, "del": removed}, pk=project.id)
+
+def applyRevision(state, delta):
+    for page_id, title in delta.get("pages", {}).items():
+        state.setdefault(page_id, {"title": title, "components": {}})["title"] = title
+    for page_id in delta.get("drop", ()):
+        state.pop(page_id, None)
+    #a batch can delete a component and create it again, so deletes go first
+    for page_id, comp_ids in delta.get("del", {}).items():
+        components = state.get(page_id, {}).get("components", {})
+        for comp_id in comp_ids:
+            components.pop(comp_id, None)
+    for page_id, changes in delta.get("set", {}).items():
+        components = state.setdefault(page_id, {"title": None, "components": {}})["components"]
+        for comp_id, values in changes.items():
+            row = components.setdefault(comp_id, [None] * len(ROW_FIELDS))
+            for field, value in values.items():
+                row[ROW_INDEX[field]] = value
+
+def reconstruct(project_id, version):
+    #{page id: {"title": title, "components": {comp_id: row}}} at version, None before the first snapshot
+    snapshot = Revision.objects.filter(project_id=project_id, snapshot=True, version__lte=version).order_by("-version", "-id").first()
+    if snapshot is None:
+        return None
+    state = {page_id: {"title": title, "components": {}} for page_id, title in snapshot.data["pages"].items()}
+    for page_id, components in snapshot.data["components"].items():
+        state.setdefault(page_id, {"title": None, "components": {}})["components"] = {comp_id: list(row) for comp_id, row in components.items()}
+    deltas = Revision.objects.filter(project_id=project_id, snapshot=False, version__gt=snapshot.version, version__lte=version).order_by("version", "id")
+    for data in deltas.values_list("data", flat=True):
+        applyRevision(state, data)
+    return state
+
+def restoreProject(project, version):
+    #makes the components match their state at version with bulk writes, which are recorded as a new revision
+    #callers hold the project row lock; returns False when the history does not reach back to version or the
+    #project never got that far
+    if version > project.version:
+        return False
+    state = reconstruct(project.id, version)
+    if state is None:
+        return False
+    pages = {page.id: page for page in project.pages.all()}
+    titles = {page.title: page for page in pages.values()}
+    targets = {}
+    for page_id, entry in state.items():
+        #a page deleted since is matched by title, or created again
+        page = pages.get(int(page_id)) or titles.get(entry["title"])
+        if page is None:
+            if entry["title"] is None:
+                continue
+            page = Page.objects.create(project=project, title=entry["title"])
+            titles[page.title] = page
+        for comp_id, row in entry["components"].items():
+            #rows only known from deltas may be incomplete, parent is the one nullable field
+            if None not in row[:-1]:
+                targets[(page.id, comp_id)] = row
+    current = {(comp.page_id, comp.comp_id): comp for comp in Component.objects.filter(page__project=project)}
+    creates, updates = [], {}
+    for key, row in targets.items():
+        comp = current.get(key)
+        if comp is None:
+            creates.append(Component(page_id=key[0], comp_id=key[1], **dict(zip(ROW_ATTRIBUTES, row))))
+            continue
+        changed = {field for field, attribute, value in zip(ROW_FIELDS, ROW_ATTRIBUTES, row) if getattr(comp, attribute) != value}
+        if changed:
+            for attribute, value in zip(ROW_ATTRIBUTES, row):
+                setattr(comp, attribute, value)
+            updates[comp] = changed
+    deletes = [comp for key, comp in current.items() if key not in targets]
+    #the restored parents formed trees when they were saved
+    Component.syncTree(creates + list(updates), deletes)
+    if deletes:
+        rawDelete(Component.objects.filter(pk__in=[comp.pk for comp in deletes]))
+    if updates:
+        Component.objects.bulk_update(list(updates), ROW_FIELDS, batch_size=500)
+    if creates:
+        Component.objects.bulk_create(creates, batch_size=500)
+    saved = Style.resolve(creates + list(updates))
+    if saved or deletes:
+        components_changed.send(sender=Component, project=project, pages={comp.page_id for comp in saved + deletes}, saved=saved, deleted=deletes, fields=updates)
+    return True
+
+def revisionStyles():
+    #digests of every style a revision refers to, restoring it needs them
+    digests = set()
+    for snapshot, data in Revision.objects.values_list("snapshot", "data").iterator(chunk_size=100):
+        if snapshot:
+            for components in data["components"].values():
+                digests.update(row[ROW_INDEX["style"]] for row in components.values())
+        else:
+            for changes in data.get("set", {}).values():
+                digests.update(values["style"] for values in changes.values() if "style" in values)
+    return digests
+
+def collectStyles(batch_size=1000):
+    #deletes the interned styles no component and no revision refers to, returns how many went; every autosave
+    #that changes a colour leaves its old style behind, this is what removes them
+    keep = revisionStyles()
+    unused = Style.objects.exclude(Exists(Component.objects.filter(style=OuterRef("pk"))))
+    digests = [digest for digest in unused.values_list("digest", flat=True).iterator() if digest not in keep]
+    deleted = 0
+    for start in range(0, len(digests), batch_size):
+        with transaction.atomic():
+            #writers share-lock the styles they reuse until they commit (Style.pin), those are skipped; a writer
+            #coming later waits for this transaction and inserts the style again
+            locked = list(unused.filter(digest__in=digests[start:start + batch_size]).select_for_update(skip_locked=True).values_list("digest", flat=True))
+            #a statement of its own, so the exists check sees every writer that committed before the locks were taken
+            deleted += rawDelete(unused.filter(digest__in=locked))
+    return deleted
@@ -0,0 +1,75 @@
+# per request timing hooks and per endpoint histograms, active only with RequestTimingMiddleware
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+#upper bounds in ms of the histogram buckets, the last bucket is open ended
+BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+currentTimings = ContextVar("currentTimings", default=None)
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = []
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+    def total(self):
+        return time.perf_counter() - self.started
+
+@contextmanager
+def timed(name):
+    #adds the time spent in the block to the current request, a no-op when instrumentation is off
+    timings = currentTimings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.samples = 0
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.samples += 1
+    def data(self):
+        return {
+            "buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], self.counts)),
+            "count": self.samples,
+            "mean": self.total / self.samples if self.samples else 0,
+        }
+
+class EndpointStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+    def record(self, endpoint, timings, total_ms):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {"total": Histogram(), "sql": Histogram(), "queries": Histogram()}
+            stats["total"].observe(total_ms)
+            stats["sql"].observe(timings.sql_time * 1000)
+            stats["queries"].observe(timings.queries)
+            for phase, seconds in timings.phases.items():
+                stats.setdefault(phase, Histogram()).observe(seconds * 1000)
+    def data(self):
+        with self.lock:
+            return {endpoint: {name: histogram.data() for name, histogram in stats.items()} for endpoint, stats in self.endpoints.items()}
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+
+endpointStats = EndpointStats()
@@ -0,0 +1,63 @@
+# orjson backed drop-in replacements for DRF's JSONParser/JSONRenderer, stdlib json is used when orjson is missing
+# output is byte for byte what JSONRenderer produces with the default COMPACT_JSON/UNICODE_JSON settings
+import json
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#orjson formats datetimes differently, hand them (and anything it does not know) to DRF's encoder
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+encoder = JSONEncoder()
+
+def escapeSeparators(encoded):
+    #JSONRenderer escapes U+2028/U+2029 so the output is a strict javascript subset
+    if b"\xe2\x80\xa8" in encoded or b"\xe2\x80\xa9" in encoded:
+        encoded = encoded.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+    return encoded
+
+def dumps(data):
+    #compact utf-8 json bytes
+    if orjson is not None:
+        try:
+            return escapeSeparators(orjson.dumps(data, default=encoder.default, option=ORJSON_OPTIONS))
+        except TypeError:
+            #integers over 64 bits and other values orjson refuses
+            pass
+    return escapeSeparators(json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode())
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        #indented (browsable api) or non default output keeps the stock code path
+        if orjson is None or self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", "utf-8").lower().replace("_", "-")
+        if orjson is None or not self.strict or encoding not in ("utf-8", "utf8"):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            #orjson rejects NaN and Infinity, which is what STRICT_JSON asks for
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
+
+class FastJSONMixin:
+    #views opt in per class, other content types still go through the configured defaults
+    parser_classes = [FastJSONParser] + api_settings.DEFAULT_PARSER_CLASSES
+    renderer_classes = [FastJSONRenderer] + api_settings.DEFAULT_RENDERER_CLASSES
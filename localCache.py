@@ -0,0 +1,78 @@
+# in-process caches, free of model imports so models.py can use them too
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    def get(self, key):
+        with self.lock:
+            try:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            except KeyError:
+                return None
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    def __len__(self):
+        return len(self.entries)
+
+class SizedLRUCache(LRUCache):
+    #LRU also bounded by the summed size of its values, an entry larger than maxbytes is not kept at all
+    def __init__(self, maxsize, maxbytes, sizeof):
+        super().__init__(maxsize)
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.sizes = {}
+        self.bytes = 0
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            self.bytes -= self.sizes.pop(key, 0)
+            self.entries.pop(key, None)
+            if size > self.maxbytes:
+                return
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.bytes += size
+            while len(self.entries) > self.maxsize or self.bytes > self.maxbytes:
+                old, _ = self.entries.popitem(last=False)
+                self.bytes -= self.sizes.pop(old)
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.bytes -= self.sizes.pop(key, 0)
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.bytes = 0
+
+class TTLCache(LRUCache):
+    #LRU whose entries also expire after ttl seconds
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize)
+        self.ttl = ttl
+    def get(self, key):
+        entry = super().get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self.delete(key)
+            return None
+        return entry[1]
+    def set(self, key, value, ttl=None):
+        super().set(key, (time.monotonic() + (self.ttl if ttl is None else ttl), value))
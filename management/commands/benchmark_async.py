@@ -0,0 +1,176 @@
+import asyncio
+import json
+import sys
+import time
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from ...benchHelpers import generateProject
+from ...models import Component
+from ...urls import buildPatterns
+
+
+class AsyncURLConf:
+    urlpatterns = buildPatterns(async_views=True)
+
+
+class Command(BaseCommand):
+    help = ("Idle editors poll the project listing while one editor autosaves; compares poll latency on the "
+            "WSGI path (sync views on a bounded worker pool) with the ASGI path (async views on one event loop).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--editors", type=int, default=50, help="idle editors polling the listing")
+        parser.add_argument("--polls", type=int, default=10, help="polls per editor")
+        parser.add_argument("--interval", type=float, default=100, help="ms between two polls of an editor")
+        parser.add_argument("--autosaves", type=int, default=5, help="bulk PUTs sent one after the other while polling")
+        parser.add_argument("--workers", type=int, default=4, help="WSGI worker threads")
+        parser.add_argument("--pages", type=int, default=4)
+        parser.add_argument("--components", type=int, default=500, help="components per page")
+        parser.add_argument("--keep", action="store_true", help="keep the generated rows instead of deleting them")
+
+    def handle(self, *args, **options):
+        self.options = options
+        user = User.objects.create_user(username=f"benchmark-{time.time_ns()}")
+        try:
+            self.project = generateProject(user, f"benchmark-{user.id}", pages=options["pages"], components=options["components"])
+            self.headers = {"Authorization": f"Token {Token.objects.get(user=user).key}"}
+            self.payload = []
+            for comp in Component.objects.filter(page__project=self.project).select_related("page"):
+                item = comp.getData()
+                item["page"] = comp.page.title
+                self.payload.append(item)
+            self.stdout.write(f"{options['editors']} editors x {options['polls']} polls every {options['interval']:.0f}ms, "
+                f"{options['autosaves']} autosaves of {len(self.payload)} components")
+            self.stdout.write(f"{'path':<6}{'wall s':>8}{'poll p50':>10}{'poll p95':>10}{'poll max':>10}{'save ms':>9}")
+            self.report("wsgi", *self.runWSGI())
+            with override_settings(ROOT_URLCONF=AsyncURLConf):
+                self.report("asgi", *asyncio.run(self.runASGI()))
+        finally:
+            if not options["keep"]:
+                user.delete()
+
+    def report(self, label, wall, polls, saves):
+        polls.sort()
+        pick = lambda percent: polls[min(len(polls) - 1, int(len(polls) * percent / 100))]
+        self.stdout.write(f"{label:<6}{wall:>8.2f}{pick(50):>10.1f}{pick(95):>10.1f}{polls[-1]:>10.1f}{sum(saves) / max(1, len(saves)):>9.1f}")
+
+    def autosaveBody(self, round):
+        for item in self.payload[round % 50::50]:
+            item["left"] = item["left"] % 1000 + 1
+        return json.dumps(self.payload)
+
+    def schedule(self):
+        #(due time offset in seconds, editor) for every poll, editors are spread over the first interval
+        interval = self.options["interval"] / 1000
+        editors = self.options["editors"]
+        return sorted((n * interval + editor * interval / editors, editor) for editor in range(editors) for n in range(self.options["polls"]))
+
+    def runWSGI(self):
+        app = WSGIHandler()
+        url = reverse("components-list", kwargs={"project_id": self.project.id})
+        polls, saves, etags = [], [], {}
+
+        def poll(editor, due):
+            status, response_headers = self.wsgiRequest(app, "GET", url, dict(self.headers, **{"If-None-Match": etags.get(editor, "")}))
+            etags[editor] = response_headers.get("etag", "")
+            polls.append((time.perf_counter() - due) * 1000)
+
+        def autosave():
+            for round in range(self.options["autosaves"]):
+                started = time.perf_counter()
+                self.wsgiRequest(app, "PUT", url, dict(self.headers, **{"Content-Type": "application/json"}), self.autosaveBody(round).encode())
+                saves.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.options["workers"]) as pool:
+            pool.submit(autosave)
+            for offset, editor in self.schedule():
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(poll, editor, started + offset)
+        return time.perf_counter() - started, polls, saves
+
+    async def runASGI(self):
+        app = ASGIHandler()
+        url = reverse("components-list", kwargs={"project_id": self.project.id})
+        polls, saves, etags = [], [], {}
+
+        async def editor(number, offsets, started):
+            for offset in offsets:
+                await asyncio.sleep(max(0, started + offset - time.perf_counter()))
+                headers = dict(self.headers, **{"If-None-Match": etags.get(number, "")})
+                status, response_headers = await self.request(app, "GET", url, headers)
+                etags[number] = response_headers.get("etag", "")
+                polls.append((time.perf_counter() - started - offset) * 1000)
+
+        async def autosave():
+            for round in range(self.options["autosaves"]):
+                begun = time.perf_counter()
+                await self.request(app, "PUT", url, dict(self.headers, **{"Content-Type": "application/json"}), self.autosaveBody(round).encode())
+                saves.append((time.perf_counter() - begun) * 1000)
+
+        offsets = {}
+        for offset, number in self.schedule():
+            offsets.setdefault(number, []).append(offset)
+        started = time.perf_counter()
+        await asyncio.gather(autosave(), *(editor(number, times, started) for number, times in offsets.items()))
+        return time.perf_counter() - started, polls, saves
+
+    def wsgiRequest(self, app, method, path, headers, body=b""):
+        #minimal WSGI server call, same request shape as the ASGI client below
+        environ = {
+            "REQUEST_METHOD": method, "PATH_INFO": path, "QUERY_STRING": "", "SCRIPT_NAME": "",
+            "SERVER_NAME": "testserver", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1", "REMOTE_ADDR": "127.0.0.1",
+            "wsgi.input": BytesIO(body), "wsgi.url_scheme": "http", "wsgi.errors": sys.stderr, "CONTENT_LENGTH": str(len(body)),
+        }
+        for key, value in headers.items():
+            name = key.upper().replace("-", "_")
+            environ[name if name == "CONTENT_TYPE" else f"HTTP_{name}"] = value
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response["status"] = int(status.split()[0])
+            response["headers"] = {key.lower(): value for key, value in response_headers}
+
+        result = app(environ, start_response)
+        try:
+            for chunk in result:
+                pass
+        finally:
+            #fires request_finished, which closes the connection like a real server would
+            result.close()
+        return response["status"], response["headers"]
+
+    async def request(self, app, method, path, headers, body=b""):
+        #minimal ASGI client, returns (status, lower-cased response headers) once the body is fully sent
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+            "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "server": ("testserver", 80), "client": ("127.0.0.1", 0),
+            "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+        }
+        received = False
+        response = {}
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            #the client never disconnects, the handler cancels this wait once it is done
+            await asyncio.Future()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {key.decode().lower(): value.decode() for key, value in message["headers"]}
+
+        await app(scope, receive, send)
+        return response["status"], response["headers"]
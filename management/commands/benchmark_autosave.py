@@ -0,0 +1,67 @@
+import json
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+from ... import writeBehind
+from ...benchHelpers import generateProject
+from ...models import Project, Component
+
+
+class Command(BaseCommand):
+    help = ("Replays a drag as whole-project autosave PUTs, one per frame, written straight through and through the "
+            "write-behind buffer, and reports the time per frame and how many project versions each mode writes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--components", type=int, default=2000, help="components of the single page")
+        parser.add_argument("--frames", type=int, default=120, help="autosaves of the drag")
+        parser.add_argument("--fps", type=float, default=60, help="frames per second the editor sends, 0 for back to back")
+        parser.add_argument("--keep", action="store_true", help="keep the generated rows instead of deleting them")
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username=f"benchmark-{time.time_ns()}")
+        enabled = writeBehind.WRITE_BEHIND
+        try:
+            project = generateProject(self.user, f"benchmark-{self.user.id}", components=options["components"])
+            self.url = reverse("components-list", kwargs={"project_id": project.id})
+            self.payload = [dict(comp.getData(), page=comp.page.title) for comp in Component.objects.filter(page__project=project).select_related("page")]
+            self.stdout.write(f"{len(self.payload)} components, {options['frames']} frames at {options['fps']:g} fps, "
+                f"flush interval {writeBehind.WRITE_BEHIND_INTERVAL:g}s")
+            self.stdout.write(f"{'mode':<16}{'p50 ms':>9}{'max ms':>9}{'versions':>10}")
+            for label, mode in (("write-through", False), ("write-behind", True)):
+                writeBehind.WRITE_BEHIND = mode
+                #the first autosave of a session carries the whole project in either mode
+                self.put()
+                version = Project.objects.get(pk=project.pk).version
+                timings = self.drag(options["frames"], options["fps"])
+                writeBehind.flushProject(project.id)
+                versions = Project.objects.get(pk=project.pk).version - version
+                timings.sort()
+                self.stdout.write(f"{label:<16}{timings[len(timings) // 2]:>9.2f}{timings[-1]:>9.2f}{versions:>10}")
+        finally:
+            writeBehind.WRITE_BEHIND = enabled
+            if not options["keep"]:
+                self.user.delete()
+
+    def drag(self, frames, fps):
+        timings = []
+        dragged = self.payload[len(self.payload) // 2]
+        for frame in range(frames):
+            started = time.perf_counter()
+            dragged["left"] = dragged["left"] % 1000 + 1
+            self.put()
+            elapsed = time.perf_counter() - started
+            timings.append(elapsed * 1000)
+            if fps:
+                time.sleep(max(0, 1 / fps - elapsed))
+        return timings
+
+    def put(self):
+        request = self.factory.put(self.url, json.dumps(self.payload), content_type="application/json")
+        force_authenticate(request, user=self.user)
+        match = resolve(self.url)
+        response = match.func(request, **match.kwargs)
+        if response.status_code >= 400:
+            raise CommandError(f"autosave answered {response.status_code}")
@@ -0,0 +1,212 @@
+import json
+import time
+import tracemalloc
+from urllib.parse import urlencode
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+from ... import changeFeed, urls
+from ...benchHelpers import generateProject, QUERY_BUDGETS
+from ...cursorHelpers import encodeCursor
+from ...models import Project, Page, Component, Style, Revision
+
+
+class Command(BaseCommand):
+    help = "Generates a synthetic project and measures latency, SQL queries and memory for every endpoint in urls.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=4)
+        parser.add_argument("--components", type=int, default=500, help="components per page")
+        parser.add_argument("--depth", type=int, default=4)
+        parser.add_argument("--fanout", type=int, default=5)
+        parser.add_argument("--style-size", type=int, default=8, help="keys per secondary_state blob")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--check", action="store_true", help="fail when a query budget is exceeded")
+        parser.add_argument("--keep", action="store_true", help="keep the generated rows instead of deleting them")
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.counter = 0
+        self.signups = []
+        self.user = User.objects.create_user(username=f"benchmark-{time.time_ns()}", password="benchmark", is_staff=True)
+        #the feed scenario measures the catch-up a reconnecting client gets, its stream ends instead of waiting
+        feedSeconds = changeFeed.FEED_POLL_SECONDS
+        changeFeed.FEED_POLL_SECONDS = 0
+        try:
+            started = time.perf_counter()
+            self.project = generateProject(self.user, f"benchmark-{self.user.id}", pages=options["pages"],
+                components=options["components"], depth=options["depth"], fanout=options["fanout"],
+                style_size=options["style_size"], seed=options["seed"])
+            self.page = self.project.pages.order_by("id").first()
+            self.stdout.write(f"generated {options['pages']} x {options['components']} components in {time.perf_counter() - started:.2f}s")
+            scenarios = self.scenarios()
+            missing = {pattern.name for pattern in urls.urlpatterns} - {scenario[1] for scenario in scenarios}
+            if missing:
+                self.stdout.write(f"no scenario for: {', '.join(sorted(missing))}")
+            self.stdout.write(f"{'endpoint':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'budget':>8}{'peak KiB':>10}")
+            over = []
+            for label, name, build in scenarios:
+                timings, queries = [], []
+                #warm up once so the first-ever request of a scenario does not skew the percentiles
+                self.measure(name, build)
+                for _ in range(options["iterations"]):
+                    elapsed, count = self.measure(name, build)
+                    timings.append(elapsed)
+                    queries.append(count)
+                tracemalloc.start()
+                self.measure(name, build)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                timings.sort()
+                budget = QUERY_BUDGETS.get(label)
+                if budget is not None and max(queries) > budget:
+                    over.append(label)
+                self.stdout.write(f"{label:<24}{self.percentile(timings, 50):>9.2f}{self.percentile(timings, 95):>9.2f}{self.percentile(timings, 99):>9.2f}"
+                    f"{max(queries):>9}{budget if budget is not None else '-':>8}{peak / 1024:>10.0f}")
+            if over and options["check"]:
+                raise CommandError(f"query budget exceeded: {', '.join(over)}")
+        finally:
+            changeFeed.FEED_POLL_SECONDS = feedSeconds
+            if not options["keep"]:
+                User.objects.filter(username__in=self.signups).delete()
+                self.user.delete()
+
+    def percentile(self, timings, percent):
+        return timings[min(len(timings) - 1, int(len(timings) * percent / 100))]
+
+    def measure(self, name, build):
+        #build does any setup outside the timed section and returns (method, url kwargs, body, authenticate[, query])
+        method, kwargs, body, authenticate, *query = build()
+        path = reverse(name, kwargs=kwargs)
+        url = f"{path}?{urlencode(query[0])}" if query else path
+        request = self.factory.generic(method, url, json.dumps(body) if body is not None else "", content_type="application/json")
+        if authenticate:
+            force_authenticate(request, user=self.user)
+        match = resolve(path)
+        #the query log is bounded, start every request from an empty one
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = match.func(request, **match.kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elif hasattr(response, "render"):
+                response.render()
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise CommandError(f"{name} answered {response.status_code}")
+        return elapsed, len(context.captured_queries)
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f"{prefix}-{self.counter}-{time.time_ns()}"[:50]
+
+    def scenarios(self):
+        project_kwargs = {"project_id": self.project.id}
+        page_kwargs = {"project_id": self.project.id, "page_id": self.page.id}
+        component = self.page.components.order_by("id").last()
+
+        def full_payload():
+            data = []
+            for comp in Component.objects.filter(page__project=self.project).select_related("page"):
+                item = comp.getData()
+                item["page"] = comp.page.title
+                data.append(item)
+            return data
+        payload = full_payload()
+
+        def autosave():
+            #an autosave resends everything, with about one percent of the components moved
+            self.counter += 1
+            for item in payload[self.counter % 100::100]:
+                item["left"] = item["left"] % 1000 + 1
+            return ("PUT", project_kwargs, payload, True)
+
+        #one screenful from the middle of the first page
+        middle = self.page.components.order_by("id")[self.page.components.count() // 2]
+        listing = {"limit": 100, "page": self.page.id, "fields": "left,top,width,height", "cursor": encodeCursor(middle)}
+
+        def delta():
+            version = Project.objects.get(pk=self.project.pk).version
+            ops = [{"op": "update", "page": self.page.title, "id": component.comp_id, "left": self.counter % 100 + 1}]
+            self.counter += 1
+            return ("POST", project_kwargs, {"base": version, "ops": ops}, True)
+
+        def new_components():
+            prefix = self.unique("new")
+            items = [{"left": 1, "top": 1, "width": 10, "height": 10, "id": f"{prefix}-{n}", "parent": None} for n in range(10)]
+            return ("POST", page_kwargs, items, True)
+
+        def doomed_page():
+            page = Page.objects.create(project=self.project, title=self.unique("doomed"))
+            rows = [Component(page=page, secondary_state={}, left=1, top=1, width=1, height=1, comp_id=f"doomed-{n}") for n in range(self.page.components.count())]
+            Style.intern(rows)
+            Component.objects.bulk_create(rows)
+            return ("DELETE", {"project_id": self.project.id, "page_id": page.id}, None, True)
+
+        def doomed_project():
+            doomed = generateProject(self.user, self.unique("doomed"), pages=2, components=self.page.components.count(), seed=self.counter)
+            return ("DELETE", {"project_id": doomed.id}, None, True)
+
+        def doomed_component():
+            doomed = Component.objects.create(page=self.page, secondary_state={}, left=1, top=1, width=1, height=1, comp_id=self.unique("doomed"))
+            return ("DELETE", {"project_id": self.project.id, "page_id": self.page.id, "comp_id": doomed.id}, None, True)
+
+        #a first level component, moved back and forth between its parent and the top of the page
+        branch = self.page.components.exclude(parent=None).order_by("id").first()
+        root = branch.parent
+
+        def move():
+            self.counter += 1
+            return ("POST", dict(page_kwargs, comp_id=branch.id), {"parent": root if self.counter % 2 else None}, True)
+
+        def restore():
+            #undo the last ten writes
+            versions = list(Revision.objects.filter(project=self.project).order_by("-version").values_list("version", flat=True)[:11])
+            return ("POST", project_kwargs, {"version": versions[-1]}, True)
+
+        def events():
+            #a client reconnecting ten writes behind
+            version = Project.objects.filter(pk=self.project.pk).values_list("version", flat=True).get()
+            return ("GET", project_kwargs, None, True, {"version": max(0, version - 10)})
+
+        def sign_up():
+            email = self.unique("user") + "@example.com"
+            self.signups.append(email)
+            return ("POST", {}, {"email": email, "firstPassword": "benchmark", "secondPassword": "benchmark"}, False)
+
+        return [
+            ("projects-list", "projects-list", lambda: ("GET", {}, None, True)),
+            ("projects-new", "projects-new", lambda: ("POST", {}, {"name": self.unique("project")}, True)),
+            ("page-post", "page-post", lambda: ("POST", project_kwargs, {"title": self.unique("page")}, True)),
+            ("project-view", "project-view", doomed_project),
+            ("page-view", "page-view", doomed_page),
+            ("page-viewport", "page-viewport", lambda: ("GET", page_kwargs, None, True, {"left": 200, "top": 200, "width": 400, "height": 300})),
+            ("page-styles", "page-styles", lambda: ("GET", page_kwargs, None, True)),
+            ("project-css", "project-css", lambda: ("GET", project_kwargs, None, True)),
+            ("page-css", "page-css", lambda: ("GET", page_kwargs, None, True)),
+            ("components-list", "components-list", lambda: ("GET", project_kwargs, None, True)),
+            ("components-list-page", "components-list", lambda: ("GET", project_kwargs, None, True, listing)),
+            ("components-list-put", "components-list", autosave),
+            ("components-delta", "components-delta", delta),
+            ("new-component", "new-component", new_components),
+            ("component-view", "component-view", lambda: ("GET", dict(page_kwargs, comp_id=component.id), None, True)),
+            ("component-view-delete", "component-view", doomed_component),
+            ("component-subtree", "component-subtree", lambda: ("GET", dict(page_kwargs, comp_id=self.page.components.get(comp_id=root).id), None, True)),
+            ("component-move", "component-move", move),
+            ("project-clone", "project-clone", lambda: ("POST", project_kwargs, {"name": self.unique("clone")}, True)),
+            ("page-clone", "page-clone", lambda: ("POST", page_kwargs, {"title": self.unique("clone")}, True)),
+            ("project-history", "project-history", lambda: ("GET", project_kwargs, None, True)),
+            ("project-restore", "project-restore", restore),
+            ("project-events", "project-events", events),
+            ("cache-stats", "cache-stats", lambda: ("GET", {}, None, True)),
+            ("request-stats", "request-stats", lambda: ("GET", {}, None, True)),
+            ("sign-up", "sign-up", sign_up),
+            ("auth-view", "auth-view", lambda: ("POST", {}, {"username": self.user.username, "password": "benchmark"}, False)),
+            ("auth-refresh", "auth-refresh", lambda: ("POST", {}, None, True)),
+            ("auth-logout", "auth-logout", lambda: ("POST", {}, None, True)),
+        ]
@@ -0,0 +1,63 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from ... import batchGeometry
+from ...batchGeometry import scalarColumns, geometryColumns
+from ...benchHelpers import generateStyle, treeParents
+from ...models import Component
+from ...styleEngine import compileStyle, compilePageStyles
+
+
+class Command(BaseCommand):
+    help = ("Compares the per component geometry math with the batch geometry of a whole page, with numpy when it is "
+            "installed, and checks that every path gives the same percentages.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--components", type=int, nargs="+", default=[1000, 10000, 50000], help="components per page")
+        parser.add_argument("--depth", type=int, default=4)
+        parser.add_argument("--fanout", type=int, default=5)
+        parser.add_argument("--style-size", type=int, default=4, help="keys per secondary_state blob")
+        parser.add_argument("--iterations", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if batchGeometry.numpy is None:
+            self.stdout.write("numpy is not installed, the batch geometry falls back to the scalar loop")
+        self.stdout.write(f"{'components':>10}{'operation':>14}{'scalar ms':>12}{'batch ms':>11}{'speedup':>9}")
+        for count in options["components"]:
+            comps = self.page(count, options)
+            index = {comp.comp_id: comp for comp in comps}
+            rows = {comp_id: row for row, comp_id in enumerate(index)}
+            parents = [rows.get(comp.parent, -1) for comp in comps]
+            columns = ([comp.left for comp in comps], [comp.top for comp in comps], [comp.width for comp in comps], [comp.height for comp in comps])
+            if geometryColumns(columns, parents) != scalarColumns(columns, parents):
+                self.stderr.write(f"batch geometry differs from the scalar path on {count} components")
+            self.compare(count, "geometry", options["iterations"],
+                lambda: scalarColumns(columns, parents), lambda: geometryColumns(columns, parents))
+            #the page styles before the batch geometry, one component at a time
+            stock = lambda: {comp.comp_id: compileStyle(comp, index.get(comp.parent)) for comp in comps}
+            if compilePageStyles(comps) != stock():
+                self.stderr.write(f"page styles differ from the scalar path on {count} components")
+            self.compare(count, "page styles", options["iterations"], stock, lambda: compilePageStyles(comps))
+
+    def page(self, count, options):
+        #unsaved components, the benchmark measures the math and not the database
+        rng = random.Random(options["seed"])
+        comps = []
+        for index, parent in enumerate(treeParents(count, options["depth"], options["fanout"])):
+            comps.append(Component(secondary_state=generateStyle(rng, options["style_size"]), left=rng.randrange(0, 1000),
+                top=rng.randrange(0, 1000), width=rng.randrange(0, 1000), height=rng.randrange(0, 1000),
+                comp_id=f"comp-{index}", parent=None if parent is None else f"comp-{parent}"))
+        return comps
+
+    def compare(self, count, label, iterations, scalar, batch):
+        scalar_ms, batch_ms = self.best(iterations, scalar), self.best(iterations, batch)
+        self.stdout.write(f"{count:>10}{label:>14}{scalar_ms:>12.2f}{batch_ms:>11.2f}{scalar_ms / batch_ms:>8.1f}x")
+
+    def best(self, iterations, run):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
@@ -0,0 +1,62 @@
+import json
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ...benchHelpers import generateProject
+from ...bulkHelpers import applyDelta
+from ...historyHelpers import reconstruct, restoreProject, HISTORY_SNAPSHOT_INTERVAL
+from ...models import Project, Component
+
+
+class Command(BaseCommand):
+    help = ("Applies small edits to a generated project and reports what its history stores per edit, compared with "
+            "keeping a full copy of the project per version, and how long rebuilding and restoring an old version takes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=5)
+        parser.add_argument("--components", type=int, default=1000, help="components per page")
+        parser.add_argument("--edits", type=int, default=200, help="delta requests applied one after the other")
+        parser.add_argument("--moves", type=int, default=5, help="components moved by each edit")
+        parser.add_argument("--keep", action="store_true", help="keep the generated rows instead of deleting them")
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f"benchmark-{time.time_ns()}")
+        try:
+            project = generateProject(user, f"benchmark-{user.id}", pages=options["pages"], components=options["components"])
+            components = list(Component.objects.filter(page__project=project).select_related("page").order_by("id"))
+            #what a naive history would store per version: the payload clients save
+            full = len(json.dumps([dict(comp.getData(), page=comp.page.title) for comp in components]))
+            #the generator leaves a snapshot behind
+            base = project.revisions.order_by("-version").first()
+            start = time.perf_counter()
+            for edit in range(options["edits"]):
+                moved = components[edit * options["moves"] % len(components):][:options["moves"]]
+                ops = [{"op": "update", "page": comp.page.title, "id": comp.comp_id, "left": comp.left + edit + 1} for comp in moved]
+                with transaction.atomic():
+                    applyDelta(Project.objects.select_for_update().get(pk=project.pk), ops)
+            elapsed = time.perf_counter() - start
+            revisions = list(project.revisions.filter(version__gt=base.version).order_by("version").values_list("version", "depth", "data"))
+            sizes = [len(json.dumps(data)) for version, depth, data in revisions]
+            deltas = [size for size, (version, depth, data) in zip(sizes, revisions) if depth]
+            self.stdout.write(f"{len(components)} components, {options['edits']} edits of {options['moves']} components, "
+                f"snapshot every {HISTORY_SNAPSHOT_INTERVAL} revisions, {elapsed / options['edits'] * 1000:.2f}ms per edit")
+            self.stdout.write(f"{'full copy per version':<28}{full:>12} B")
+            self.stdout.write(f"{'snapshot':<28}{len(json.dumps(base.data)):>12} B")
+            self.stdout.write(f"{'delta':<28}{sum(deltas) // max(1, len(deltas)):>12} B")
+            self.stdout.write(f"{'history per edit':<28}{sum(sizes) // max(1, len(sizes)):>12} B  ({full * len(sizes) / max(1, sum(sizes)):.0f}x less than full copies)")
+            #the deepest delta replays the longest chain
+            target = max(revisions, key=lambda revision: revision[1], default=(base.version,))[0]
+            timings = []
+            for n in range(5):
+                start = time.perf_counter()
+                reconstruct(project.id, target)
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(f"{'reconstruct':<28}{min(timings) * 1000:>12.2f} ms")
+            start = time.perf_counter()
+            with transaction.atomic():
+                restoreProject(Project.objects.select_for_update().get(pk=project.pk), base.version)
+            self.stdout.write(f"{'restore to the start':<28}{(time.perf_counter() - start) * 1000:>12.2f} ms")
+        finally:
+            if not options["keep"]:
+                user.delete()
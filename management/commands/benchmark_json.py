@@ -0,0 +1,59 @@
+import json
+import random
+import time
+from io import BytesIO
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from ... import jsonCodec
+from ...benchHelpers import generateStyle, treeParents
+from ...jsonCodec import FastJSONParser, FastJSONRenderer
+from ...streamHelpers import encodeJSONArray
+
+
+class Command(BaseCommand):
+    help = "Compares DRF's JSON parser/renderer with the orjson codec on bulk PUT and GET sized component payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--components", type=int, default=10000)
+        parser.add_argument("--style-size", type=int, default=16, help="keys per secondary_state blob")
+        parser.add_argument("--iterations", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if jsonCodec.orjson is None:
+            self.stdout.write("orjson is not installed, the fast codec falls back to stdlib json")
+        rng = random.Random(options["seed"])
+        payload = []
+        for index, parent in enumerate(treeParents(options["components"], 4, 5)):
+            item = generateStyle(rng, options["style_size"])
+            item.update({"left": rng.randrange(1, 1000), "top": rng.randrange(1, 1000), "width": rng.randrange(1, 1000),
+                "height": rng.randrange(1, 1000), "id": f"comp-{index}", "parent": None if parent is None else f"comp-{parent}", "page": "page-0"})
+            payload.append(item)
+        body = JSONRenderer().render(payload)
+        self.stdout.write(f"{len(payload)} components, {len(body) / 1024:.0f} KiB body")
+        self.stdout.write(f"{'operation':<20}{'stock ms':>10}{'fast ms':>10}{'speedup':>9}")
+        self.compare(options["iterations"], "parse (PUT)",
+            lambda: JSONParser().parse(BytesIO(body)), lambda: FastJSONParser().parse(BytesIO(body)))
+        self.compare(options["iterations"], "render",
+            lambda: JSONRenderer().render(payload), lambda: FastJSONRenderer().render(payload))
+        self.compare(options["iterations"], "stream (GET)",
+            lambda: "".join(self.stockStream(payload)), lambda: b"".join(encodeJSONArray(payload)))
+
+    def stockStream(self, items):
+        #the listing encoder before the codec, one json.dumps per item
+        yield "["
+        yield ",".join(json.dumps(item) for item in items)
+        yield "]"
+
+    def compare(self, iterations, label, stock, fast):
+        stock_ms, fast_ms = self.best(iterations, stock), self.best(iterations, fast)
+        self.stdout.write(f"{label:<20}{stock_ms:>10.2f}{fast_ms:>10.2f}{stock_ms / fast_ms:>8.1f}x")
+
+    def best(self, iterations, run):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
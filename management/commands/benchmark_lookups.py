@@ -0,0 +1,54 @@
+import random
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from ...models import Project, Page, Component, Style
+
+
+class Command(BaseCommand):
+    help = "Seeds a large project and times the (project, title) and (page, comp_id) lookups used by the views."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--components", type=int, default=100000)
+        parser.add_argument("--pages", type=int, default=100)
+        parser.add_argument("--lookups", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keep", action="store_true", help="keep the seeded rows instead of deleting them")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        user = User.objects.create_user(username=f"benchmark-{time.time_ns()}")
+        try:
+            project = Project.objects.create(user=user, name=f"benchmark-{user.id}")
+            Page.objects.bulk_create([Page(project=project, title=f"page-{n}") for n in range(options["pages"])])
+            pages = list(project.pages.all())
+            per_page = max(1, options["components"] // len(pages))
+            started = time.perf_counter()
+            for page in pages:
+                rows = [
+                    Component(page=page, secondary_state={}, left=n, top=n, width=10, height=10, comp_id=f"comp-{n}", parent=None if n == 0 else "comp-0")
+                    for n in range(per_page)
+                ]
+                Style.intern(rows)
+                Component.objects.bulk_create(rows, batch_size=1000)
+            self.stdout.write(f"seeded {per_page * len(pages)} components on {len(pages)} pages in {time.perf_counter() - started:.2f}s")
+
+            def run(name, lookup):
+                timings = []
+                for _ in range(options["lookups"]):
+                    started = time.perf_counter()
+                    lookup()
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write(f"{name}: mean {statistics.mean(timings):.3f}ms p50 {timings[len(timings) // 2]:.3f}ms p99 {timings[int(len(timings) * 0.99)]:.3f}ms")
+
+            run("page by (project, title)", lambda: project.pages.get(title=rng.choice(pages).title))
+            run("component by (page, comp_id)", lambda: rng.choice(pages).components.get(comp_id=f"comp-{rng.randrange(per_page)}"))
+            run("children by (page, parent)", lambda: list(rng.choice(pages).components.filter(parent="comp-0")[:10]))
+            self.stdout.write(f"plan on {connection.vendor}:")
+            self.stdout.write(pages[0].components.filter(comp_id="comp-1").explain())
+        finally:
+            if not options["keep"]:
+                user.delete()
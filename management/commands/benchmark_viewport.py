@@ -0,0 +1,46 @@
+import math
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from ...benchHelpers import generateProject
+from ...cursorHelpers import viewportComponents, filterComponents
+from ...models import Style
+
+
+class Command(BaseCommand):
+    help = ("Queries a screen sized viewport on pages of growing size and compares it with loading the whole page, "
+            "the density of the generated canvas stays the same as the pages grow.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,50000", help="comma separated components per page")
+        parser.add_argument("--density", type=int, default=60, help="canvas pixels per component along each side")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--keep", action="store_true", help="keep the generated rows instead of deleting them")
+
+    def handle(self, *args, **options):
+        self.iterations = options["iterations"]
+        user = User.objects.create_user(username=f"benchmark-{time.time_ns()}")
+        try:
+            self.stdout.write(f"{'components':>10}{'visible':>9}{'viewport ms':>13}{'full page ms':>14}")
+            for count in [int(size) for size in options["sizes"].split(",")]:
+                canvas = int(math.sqrt(count)) * options["density"]
+                project = generateProject(user, f"benchmark-{user.id}-{count}", components=count, canvas=canvas, size=300, seed=count)
+                page = project.pages.get()
+                #a 1920x1080 screen at the middle of the canvas
+                rect = {"left": canvas // 2, "top": canvas // 2, "width": 1920, "height": 1080}
+                visible = self.measure(lambda: Style.resolve(list(viewportComponents(page.id, **rect))))
+                full = self.measure(lambda: Style.resolve(list(filterComponents(project, page.id))), iterations=min(options["iterations"], 5))
+                self.stdout.write(f"{count:>10}{len(visible[1]):>9}{visible[0]:>13.2f}{full[0]:>14.2f}")
+        finally:
+            if not options["keep"]:
+                user.delete()
+
+    def measure(self, query, iterations=None):
+        #(median ms, last result)
+        timings = []
+        for n in range(iterations or self.iterations):
+            start = time.perf_counter()
+            result = query()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2], result
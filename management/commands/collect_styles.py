@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from ...historyHelpers import collectStyles
+
+
+class Command(BaseCommand):
+    help = "Deletes the interned component styles that no component and no history revision refers to any more."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"deleted {collectStyles()} unused styles")
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from ...deleteHelpers import purgeHidden
+
+
+class Command(BaseCommand):
+    help = "Purges the rows of deleted (hidden) projects whose background purge was interrupted, e.g. by a restart."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"purged {purgeHidden()} hidden projects")
@@ -0,0 +1,67 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from .instrumentation import RequestTimings, currentTimings, endpointStats
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = getattr(settings, "CRAYKOI_SLOW_REQUEST_MS", 500)
+SLOW_REQUEST_SAMPLE_RATE = getattr(settings, "CRAYKOI_SLOW_REQUEST_SAMPLE_RATE", 1.0)
+#statements kept per request for the slow request log
+MAX_LOGGED_STATEMENTS = 200
+
+class RequestTimingMiddleware:
+    #opt in by adding "main.middleware.RequestTimingMiddleware" to MIDDLEWARE
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = currentTimings.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.recordQuery))
+                response = self.get_response(request)
+        finally:
+            currentTimings.reset(token)
+        total_ms = timings.total() * 1000
+        response["Server-Timing"] = self.header(timings, total_ms)
+        match = getattr(request, "resolver_match", None)
+        endpoint = f"{request.method} {match.url_name if match else 'unresolved'}"
+        endpointStats.record(endpoint, timings, total_ms)
+        if total_ms >= SLOW_REQUEST_MS and random.random() < SLOW_REQUEST_SAMPLE_RATE:
+            statements = sorted(timings.statements, key=lambda entry: entry[1], reverse=True)
+            logger.warning("slow request %s %s: %.1fms, %d queries, %.1fms sql\n%s", request.method, request.path, total_ms,
+                timings.queries, timings.sql_time * 1000, "\n".join(f"{duration * 1000:.1f}ms {sql}" for sql, duration in statements))
+        return response
+
+    def process_template_response(self, request, response):
+        #DRF responses render after the view returns; streamed bodies are encoded after the headers are sent and are not timed
+        timings = currentTimings.get()
+        if timings is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: timings.add("render", time.perf_counter() - started))
+        return response
+
+    def recordQuery(self, execute, sql, params, many, context):
+        timings = currentTimings.get()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if timings is not None:
+                duration = time.perf_counter() - started
+                timings.queries += 1
+                timings.sql_time += duration
+                if len(timings.statements) < MAX_LOGGED_STATEMENTS:
+                    timings.statements.append((sql, duration))
+
+    def header(self, timings, total_ms):
+        entries = [f'db;dur={timings.sql_time * 1000:.1f};desc="{timings.queries} queries"']
+        entries += [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.phases.items()]
+        entries.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(entries)
@@ -0,0 +1,46 @@
+# Renames duplicate lookup keys so that the unique constraints in 0007 can be added.
+# The oldest row keeps its key, later duplicates get a numbered suffix; no rows are deleted.
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def unique_value(taken, value, max_length):
+    n = 2
+    while True:
+        suffix = f'-{n}'
+        candidate = value[:max_length - len(suffix)] + suffix
+        if candidate not in taken:
+            return candidate
+        n += 1
+
+
+def dedupe(model, group_field, key_field):
+    max_length = model._meta.get_field(key_field).max_length
+    duplicates = (model.objects.values(group_field, key_field)
+                  .annotate(rows=Count('id')).filter(rows__gt=1))
+    for duplicate in list(duplicates):
+        group = duplicate[group_field]
+        taken = set(model.objects.filter(**{group_field: group}).values_list(key_field, flat=True))
+        rows = model.objects.filter(**{group_field: group, key_field: duplicate[key_field]}).order_by('id')
+        for row in list(rows)[1:]:
+            value = unique_value(taken, getattr(row, key_field), max_length)
+            taken.add(value)
+            setattr(row, key_field, value)
+            row.save(update_fields=[key_field])
+
+
+def dedupe_lookup_keys(apps, schema_editor):
+    dedupe(apps.get_model('main', 'Page'), 'project', 'title')
+    dedupe(apps.get_model('main', 'Component'), 'page', 'comp_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_auto_20210223_1429'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_lookup_keys, migrations.RunPython.noop),
+    ]
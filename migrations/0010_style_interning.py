@@ -0,0 +1,85 @@
+# Moves Component.secondary_state into the content addressed Style table.
+# Identical dicts end up in a single Style row; the digest must match Style.digestOf.
+
+import hashlib
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 2000
+
+
+def digest_of(data):
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def intern_styles(apps, schema_editor):
+    Component = apps.get_model('main', 'Component')
+    Style = apps.get_model('main', 'Style')
+    last = 0
+    while True:
+        rows = list(Component.objects.filter(id__gt=last).order_by('id').only('id', 'secondary_state')[:BATCH_SIZE])
+        if not rows:
+            break
+        styles = {}
+        for row in rows:
+            row.style_id = digest_of(row.secondary_state)
+            styles[row.style_id] = row.secondary_state
+        Style.objects.bulk_create([Style(digest=digest, data=data) for digest, data in styles.items()], ignore_conflicts=True)
+        Component.objects.bulk_update(rows, ['style'])
+        last = rows[-1].id
+
+
+def restore_secondary_state(apps, schema_editor):
+    Component = apps.get_model('main', 'Component')
+    Style = apps.get_model('main', 'Style')
+    last = 0
+    while True:
+        rows = list(Component.objects.filter(id__gt=last).order_by('id').only('id', 'style')[:BATCH_SIZE])
+        if not rows:
+            break
+        styles = dict(Style.objects.filter(digest__in={row.style_id for row in rows}).values_list('digest', 'data'))
+        for row in rows:
+            row.secondary_state = styles[row.style_id]
+        Component.objects.bulk_update(rows, ['secondary_state'])
+        last = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_page_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Style',
+            fields=[
+                ('digest', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='component',
+            name='style',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='components', to='main.style'),
+        ),
+        migrations.AlterField(
+            model_name='component',
+            name='secondary_state',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(intern_styles, restore_secondary_state),
+        migrations.RemoveField(
+            model_name='component',
+            name='secondary_state',
+        ),
+        migrations.AlterField(
+            model_name='component',
+            name='style',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='components', to='main.style'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_style_interning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='hidden',
+            field=models.BooleanField(default=False),
+        ),
+    ]
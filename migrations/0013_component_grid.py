@@ -0,0 +1,61 @@
+# Places every component in its spatial grid cell for the viewport queries.
+# The cell must match spatialGrid.gridCell with the same cell size and level count.
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+GRID_CELL_SIZE = 256
+GRID_LEVELS = 16
+
+
+def grid_cell(left, top, width, height):
+    size = max(width, height, 0)
+    level = 0
+    while level < GRID_LEVELS - 1 and GRID_CELL_SIZE << level < size:
+        level += 1
+    side = GRID_CELL_SIZE << level
+    return level, left // side, top // side
+
+
+def place_components(apps, schema_editor):
+    Component = apps.get_model('main', 'Component')
+    last = 0
+    while True:
+        rows = list(Component.objects.filter(id__gt=last).order_by('id').only('id', 'left', 'top', 'width', 'height')[:BATCH_SIZE])
+        if not rows:
+            break
+        for row in rows:
+            row.cell_level, row.cell_x, row.cell_y = grid_cell(row.left, row.top, row.width, row.height)
+        Component.objects.bulk_update(rows, ['cell_level', 'cell_x', 'cell_y'])
+        last = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='component',
+            name='cell_level',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='component',
+            name='cell_x',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='component',
+            name='cell_y',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(place_components, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='component',
+            index=models.Index(fields=['page', 'cell_level', 'cell_x', 'cell_y'], name='component_cell_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Stores the materialized path of every component, see componentTree.
+# The paths must match componentTree.segment; a cycle of parents is cut where it closes.
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+
+def segment(comp_id):
+    return comp_id.replace('\\', '\\\\').replace('/', '\\/') + '/'
+
+
+def page_paths(parents):
+    paths = {}
+    for start in parents:
+        chain, seen = [], set()
+        node = start
+        while node is not None and node in parents and node not in paths and node not in seen:
+            chain.append(node)
+            seen.add(node)
+            node = parents[node]
+        if node in seen:
+            base = '/'
+        elif node is None:
+            base = '/'
+        elif node in paths:
+            base = paths[node]
+        else:
+            base = '/' + segment(node)
+        for comp_id in reversed(chain):
+            base = paths[comp_id] = base + segment(comp_id)
+    return paths
+
+
+def store_paths(apps, schema_editor):
+    Component = apps.get_model('main', 'Component')
+    Page = apps.get_model('main', 'Page')
+    for page_id in Page.objects.values_list('id', flat=True).iterator():
+        rows = list(Component.objects.filter(page_id=page_id).only('id', 'comp_id', 'parent'))
+        paths = page_paths({row.comp_id: row.parent for row in rows})
+        for row in rows:
+            row.path = paths[row.comp_id]
+        Component.objects.bulk_update(rows, ['path'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_component_grid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='component',
+            name='path',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(store_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='component',
+            index=models.Index(fields=['page', 'path'], name='component_path_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# resolves and authorizes the project -> page -> component chain of a url in one query
+from django.http import Http404
+from .models import Project, Page, Component
+from .writeBehind import flushProject
+
+class OwnershipMixin:
+    #every lookup raises Http404 when the object is missing, belongs to another user or its project is being deleted
+    #and first writes the project's buffered autosaves, so requests read them (see writeBehind); lookups made while
+    #the project row is locked pass flush=False, the caller flushed before taking the lock
+    def getProject(self, request, project_id, queryset=None, flush=True):
+        if flush:
+            flushProject(project_id)
+        queryset = Project.objects.all() if queryset is None else queryset
+        try:
+            return queryset.get(id=project_id, user=request.user, hidden=False)
+        except Project.DoesNotExist:
+            raise Http404
+    def getPage(self, request, project_id, page_id, flush=True):
+        if flush:
+            flushProject(project_id)
+        try:
+            return Page.objects.select_related("project").get(id=page_id, project_id=project_id, project__user=request.user, project__hidden=False)
+        except Page.DoesNotExist:
+            raise Http404
+    def getComponent(self, request, project_id, page_id, comp_id, flush=True):
+        if flush:
+            flushProject(project_id)
+        try:
+            return Component.objects.select_related("page__project").get(id=comp_id, page_id=page_id, page__project_id=project_id, page__project__user=request.user, page__project__hidden=False)
+        except Component.DoesNotExist:
+            raise Http404
@@ -1,11 +1,24 @@
-from django.db import models
+import hashlib
+import json
+from django.db import connection, models, transaction
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 from rest_framework.parsers import JSONParser
+from .styleEngine import compileStyle
+from .signals import components_changed
+from .localCache import LRUCache
+from .spatialGrid import place, CELL_FIELDS, GEOMETRY_FIELDS
+from .componentTree import ROOT, segment, subtreesFilters, ancestorPaths, resolvePaths, TreeError
 
-#creare Auth Token when a user is created: can i refresh token after some period
+STYLE_CACHE_SIZE = getattr(settings, "CRAYKOI_STYLE_CACHE_SIZE", 10000)
+
+#styles are immutable, an entry keyed by digest can never go stale
+styleCache = LRUCache(STYLE_CACHE_SIZE)
+
+#creare Auth Token when a user is created, it expires after CRAYKOI_TOKEN_TTL and is rotated through auth/refresh/
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
@@ -15,54 +28,308 @@ def create_auth_token(sender, instance=None, created=False, **kwargs):
 class Project(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="projects")
     name = models.CharField(max_length=50, unique=True)
+    #bumped by every page or component write, read endpoints derive their etag from it
+    version = models.PositiveIntegerField(default=0)
+    #set when a large project is deleted, every lookup skips it until deleteHelpers purged its rows
+    hidden = models.BooleanField(default=False)
+
+    @staticmethod
+    def bumpVersion(**lookup):
+        #single UPDATE, callers never need the project row loaded
+        Project.objects.filter(**lookup).update(version=F("version") + 1)
 
 class Page(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="pages");
     title = models.CharField(max_length=50, default=None)
+    #bumped by every write to one of the page's components
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["project", "title"], name="unique_page_title"),
+        ]
+
+    @staticmethod
+    def bumpVersion(**lookup):
+        Page.objects.filter(**lookup).update(version=F("version") + 1)
+
+class Style(models.Model):
+    #every distinct secondary_state is stored once, keyed by the hash of its canonical json
+    digest = models.CharField(max_length=32, primary_key=True)
+    data = models.JSONField()
+
+    @staticmethod
+    def digestOf(data):
+        canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def intern(components):
+        #points every component whose secondary_state was assigned at its style row, one INSERT at most
+        pending = {}
+        for comp in components:
+            if comp.style_id is None and "_secondary_state" in comp.__dict__:
+                data = comp.secondary_state
+                digest = Style.digestOf(data)
+                pending.setdefault(digest, data)
+                comp.style_id = digest
+                del comp.__dict__["_secondary_state"]
+        if pending:
+            Style.objects.bulk_create([Style(digest=digest, data=data) for digest, data in pending.items()], ignore_conflicts=True)
+            #a conflicting row may be an unused style that collectStyles is deleting right now
+            gone = set(pending) - Style.pin(pending)
+            if gone:
+                Style.objects.bulk_create([Style(digest=digest, data=pending[digest]) for digest in gone], ignore_conflicts=True)
+            for digest, data in pending.items():
+                #components of one style share a single dict, the cached one when there is one
+                pending[digest] = styleCache.get(digest) or data
+                styleCache.set(digest, pending[digest])
+            for comp in components:
+                if comp.style_id in pending:
+                    comp.__dict__["_style"] = (comp.style_id, pending[comp.style_id])
+
+    @staticmethod
+    def pin(digests):
+        #share-locks the style rows until the writer commits the components that refer to them, collectStyles skips
+        #locked rows and a collector already holding one makes this wait; returns the digests still there
+        #sqlite has no row locks, its single writer already keeps the collector out
+        if connection.vendor not in ("postgresql", "mysql"):
+            return set(digests)
+        digests = list(digests)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT digest FROM {Style._meta.db_table} WHERE digest IN ({', '.join(['%s'] * len(digests))}) FOR SHARE", digests)
+            return {row[0] for row in cursor.fetchall()}
+
+    @staticmethod
+    def resolve(components):
+        #gives every component its style data, the ones missing from the cache come from one query; the data stays
+        #on the instances, a page with more styles than the cache holds must not go back to a query per component
+        found, missing = {}, set()
+        for comp in components:
+            if comp.style_id is None or comp.__dict__.get("_style", (None,))[0] == comp.style_id:
+                continue
+            data = found.get(comp.style_id) or styleCache.get(comp.style_id)
+            if data is None:
+                missing.add(comp.style_id)
+            else:
+                found[comp.style_id] = data
+        for digest, data in Style.objects.filter(digest__in=missing).values_list("digest", "data") if missing else ():
+            styleCache.set(digest, data)
+            found[digest] = data
+        for comp in components:
+            if comp.style_id in found:
+                comp.__dict__["_style"] = (comp.style_id, found[comp.style_id])
+        return components
+
+class ComponentQuerySet(models.QuerySet):
+    #the bulk writes keep the grid cells and tree paths in step with the geometry and parents, like save does
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        place(objs)
+        Component.syncTree(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs, fields = list(objs), list(fields)
+        if GEOMETRY_FIELDS.intersection(fields):
+            place(objs)
+            fields += CELL_FIELDS
+        if "parent" in fields:
+            Component.syncTree(objs)
+            fields.append("path")
+        return super().bulk_update(objs, fields, *args, **kwargs)
 
 class Component(models.Model):
     page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name="components")
-    secondary_state = models.JSONField()
+    #secondary_state is stored as a reference to its interned Style, see the property below
+    style = models.ForeignKey(Style, on_delete=models.PROTECT, related_name="components")
     left = models.IntegerField()
     top = models.IntegerField()
     width = models.IntegerField()
     height = models.IntegerField()
     comp_id = models.CharField(max_length=250)
     parent = models.CharField(max_length=250, null=True)
+    #cell of the spatial grid, derived from the geometry on every write, see spatialGrid
+    cell_level = models.SmallIntegerField(default=0)
+    cell_x = models.IntegerField(default=0)
+    cell_y = models.IntegerField(default=0)
+    #materialized path of comp_ids from the root down, derived from the parents on every write, see componentTree
+    path = models.TextField(default="")
+
+    objects = ComponentQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["page", "comp_id"], name="unique_component_id"),
+        ]
+        indexes = [
+            models.Index(fields=["page", "parent"], name="component_parent_idx"),
+            models.Index(fields=["page", "cell_level", "cell_x", "cell_y"], name="component_cell_idx"),
+            models.Index(fields=["page", "path"], name="component_path_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        #the parent the stored path was derived from, syncTree tells moves from other writes with it
+        if "parent" in instance.__dict__:
+            instance._tree_parent = instance.parent
+        return instance
+
+    def needsPath(self):
+        if "_tree_parent" in self.__dict__:
+            return self._tree_parent != self.parent
+        return self._state.adding
+
+    @staticmethod
+    def treeRows(page_id, prefixes, lookups=(), children=()):
+        #rows of the page named in lookups, children of a comp_id in children or inside the subtree of a prefix
+        conditions = list(subtreesFilters(page_id, prefixes))
+        if lookups or children:
+            named = models.Q(page_id=page_id, comp_id__in=lookups) | models.Q(page_id=page_id, parent__in=children)
+            conditions = [named | conditions[0]] + conditions[1:] if conditions else [named]
+        rows = {}
+        for condition in conditions:
+            for row in Component.objects.filter(condition).only("id", "page", "comp_id", "parent", "path"):
+                rows[row.pk] = row
+        return list(rows.values())
+
+    @staticmethod
+    def syncTree(components, deleted=(), strict=False):
+        #sets the path of every created or re-parented component and rewrites the subtrees moving with them,
+        #deleted components leave their children under a missing parent; usually one query per page, none for
+        #new roots; raises TreeError on cycles and, when strict, on missing parents and orphaned children
+        pending = [comp for comp in components if comp.needsPath()]
+        pages = {}
+        for comp in pending:
+            pages.setdefault(comp.page_id, ([], []))[0].append(comp)
+        for comp in deleted:
+            pages.setdefault(comp.page_id, ([], []))[1].append(comp)
+        errors, rewrites = {}, []
+        for page_id, (saved, gone) in pages.items():
+            names = {comp.comp_id for comp in saved}
+            gone = [comp for comp in gone if comp.comp_id not in names]
+            goneIds = {comp.pk for comp in gone}
+            lookups = {comp.parent for comp in saved if comp.parent is not None} - names
+            prefixes = [comp.path for comp in saved if not comp._state.adding]
+            prefixes += [comp.path for comp in gone if strict or comp.path != ROOT + segment(comp.comp_id)]
+            #children stored under a missing parent that is now created anywhere but at the root come along
+            adopted = {comp.comp_id for comp in saved if comp._state.adding and comp.parent is not None}
+            parents, known, descendants = {comp.comp_id: comp.parent for comp in saved}, {}, []
+            rows = Component.treeRows(page_id, prefixes, lookups, adopted) if lookups or prefixes or adopted else []
+            waiting = [ROOT + segment(row.parent) for row in rows if row.parent in adopted]
+            if waiting:
+                prefixes += waiting
+                rows += Component.treeRows(page_id, waiting)
+            prefixSet, seen = set(prefixes), set()
+            for row in rows:
+                if row.pk in goneIds or row.comp_id in names or row.pk in seen:
+                    continue
+                seen.add(row.pk)
+                if any(path in prefixSet for path in ancestorPaths(row.path)):
+                    parents[row.comp_id] = row.parent
+                    descendants.append(row)
+                else:
+                    known[row.comp_id] = row.path
+            paths, cycles = resolvePaths(parents, known)
+            for comp in saved:
+                if comp.comp_id in cycles:
+                    errors[(page_id, comp.comp_id)] = ["Parent would make the component its own descendant."]
+                elif strict and comp.parent is not None and comp.parent not in parents and comp.parent not in known:
+                    errors[(page_id, comp.comp_id)] = ["Parent does not exist on the page."]
+            if strict:
+                orphaned = {row.parent for row in descendants}
+                for comp in gone:
+                    if comp.comp_id in orphaned:
+                        errors[(page_id, comp.comp_id)] = ["Component still has children."]
+            for comp in saved:
+                comp.path = paths.get(comp.comp_id, comp.path)
+                comp._tree_parent = comp.parent
+            rewrites += [row for row in descendants if paths.get(row.comp_id, row.path) != row.path]
+            for row in descendants:
+                row.path = paths.get(row.comp_id, row.path)
+        if errors:
+            raise TreeError(errors)
+        if rewrites:
+            Component.objects.bulk_update(rewrites, ["path"], batch_size=500)
+
+    @property
+    def secondary_state(self):
+        #the dict is shared with every component of the same style and must not be mutated
+        if self.style_id is None:
+            return self.__dict__.get("_secondary_state")
+        digest, data = self.__dict__.get("_style", (None, None))
+        if digest != self.style_id:
+            data = styleCache.get(self.style_id)
+            if data is None:
+                data = Style.objects.get(digest=self.style_id).data
+                styleCache.set(self.style_id, data)
+            self.__dict__["_style"] = (self.style_id, data)
+        return data
+
+    @secondary_state.setter
+    def secondary_state(self, value):
+        #interned on save, bulk writers call Style.intern first
+        self.__dict__["_secondary_state"] = value
+        self.style_id = None
+
+    def save(self, *args, **kwargs):
+        #the style stays pinned until the row referring to it is stored
+        with transaction.atomic(savepoint=False):
+            Style.intern([self])
+            place([self])
+            Component.syncTree([self])
+            super().save(*args, **kwargs)
 
     def getStyles(self):
-        if self.parent is None:
-            width = "100%"
-            height = "100%"
-            style = self.secondary_state
-            style.update({"width": width, "height": height})
-            return style
-        try:
-            parent = self.page.components.get(comp_id=self.parent)
-            width = round((self.width / parent.width)*100)
-            if width > 98:
-                width = 100
-            left = round((self.left / parent.left)*100)
-            if left < 1:
-                left = 0
-            top = round((self.top / parent.top)*100)
-            if top < 1:
-                top = 0
-            height = round((self.height / parent.height)*100)
-            if height > 98:
-                height = 100
-            left = f'{left}%'
-            width = f'{width}%'
-            height = f'{height}%'
-            top = f'{top}%'
-            style = self.secondary_state
-            style.update({"width": width, "height": height, "left": left, "top": top,})
-            return style
-        except Component.DoesNotExist:
-            #perform some logging here
-            raise TypeError
+        parent = None
+        if self.parent is not None:
+            #a dangling parent reference is styled like a root
+            parent = Component.objects.filter(page_id=self.page_id, comp_id=self.parent).first()
+        return compileStyle(self, parent)
     def getData(self):
         data = {}
         data.update(self.secondary_state)
         data.update({"left": self.left, "top": self.top, "width": self.width, "height": self.height, "id": self.comp_id, "parent": self.parent})
-        return data
\ No newline at end of file
+        return data
+
+class Revision(models.Model):
+    #one entry of a project's history, see historyHelpers for the data formats
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="revisions")
+    #project version right after the write
+    version = models.PositiveIntegerField()
+    snapshot = models.BooleanField(default=False)
+    #deltas written since the last snapshot, 0 for a snapshot
+    depth = models.PositiveIntegerField(default=0)
+    data = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "version"], name="revision_version_idx"),
+        ]
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def page_changed(sender, instance, **kwargs):
+    Project.bumpVersion(pk=instance.project_id)
+
+@receiver(post_save, sender=Component)
+@receiver(post_delete, sender=Component)
+def component_changed(sender, instance, **kwargs):
+    Page.bumpVersion(pk=instance.page_id)
+    Project.bumpVersion(pages=instance.page_id)
+
+@receiver(post_delete, sender=Component)
+def component_tree_changed(sender, instance, origin=None, **kwargs):
+    #deletes cascading from a page or project take the whole tree with them
+    if isinstance(origin, Component) or getattr(origin, "model", None) is Component:
+        Component.syncTree([], [instance])
+
+@receiver(components_changed)
+def components_bulk_changed(sender, project, pages=None, **kwargs):
+    if pages is None:
+        Page.bumpVersion(project=project.id)
+    else:
+        Page.bumpVersion(pk__in=pages)
+    Project.bumpVersion(pk=project.id)
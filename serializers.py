@@ -13,6 +13,8 @@ class PageSerializer(serializers.ModelSerializer):
         fields = ['title', 'id']
 
 class ComponentSerializer(serializers.ModelSerializer):
+    #stored as a reference to an interned Style, not a model field
+    secondary_state = serializers.JSONField()
     class Meta:
         model = models.Component
         fields = ['id', 'secondary_state', 'left', 'top', 'width', 'height', 'comp_id', 'parent']
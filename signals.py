@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+#sent by the bulk write paths, which bypass post_save/post_delete
+#arguments: project, pages (ids of the changed pages, None when unknown),
+#saved and deleted (the written and removed components, None when unknown),
+#fields ({saved component: names of the fields that changed}, components missing from it changed entirely)
+components_changed = Signal()
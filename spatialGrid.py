@@ -0,0 +1,39 @@
+# hierarchical grid placing every component in one cell, so a viewport query is a handful of index ranges
+#
+# a component goes to the lowest level whose cells are at least as large as its bigger side, and to the cell
+# holding its top left corner; it then reaches at most one cell further right and down, so at each level the
+# components intersecting a rectangle lie in the rectangle's cells widened by one cell to the left and top
+from django.db.models import F, Q
+
+#side of a level 0 cell in canvas pixels, rows are placed with it so changing it means placing them again
+GRID_CELL_SIZE = 256
+#cells double in size per level, the last level also takes everything larger and is not bounded by cell
+GRID_LEVELS = 16
+
+CELL_FIELDS = ["cell_level", "cell_x", "cell_y"]
+GEOMETRY_FIELDS = {"left", "top", "width", "height"}
+
+def gridCell(left, top, width, height):
+    #(level, x, y) of the cell a component with this geometry is stored in
+    size = max(width, height, 0)
+    level = 0
+    while level < GRID_LEVELS - 1 and GRID_CELL_SIZE << level < size:
+        level += 1
+    side = GRID_CELL_SIZE << level
+    return level, left // side, top // side
+
+def place(components):
+    for comp in components:
+        comp.cell_level, comp.cell_x, comp.cell_y = gridCell(comp.left, comp.top, comp.width, comp.height)
+
+def viewportFilter(page, left, top, width, height):
+    #components of the page intersecting or touching the rectangle, as a filter on the component table
+    #every branch repeats the page so the planner can serve each one from the cell index (sqlite's multi-index OR)
+    right, bottom = left + width, top + height
+    cells = Q(page_id=page, cell_level=GRID_LEVELS - 1)
+    for level in range(GRID_LEVELS - 1):
+        side = GRID_CELL_SIZE << level
+        cells |= Q(page_id=page, cell_level=level, cell_x__range=(left // side - 1, right // side), cell_y__range=(top // side - 1, bottom // side))
+    #the cells only narrow the rows down, the exact test runs on the few left
+    exact = Q(left__lte=right, top__lte=bottom) & Q(left__gte=left - F("width"), top__gte=top - F("height"))
+    return cells & exact
@@ -0,0 +1,44 @@
+# helper functions for streaming large payloads out without building them in memory
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from .models import Component, Style
+from .jsonCodec import dumps
+
+STREAM_CHUNK_SIZE = getattr(settings, "CRAYKOI_STREAM_CHUNK_SIZE", 500)
+
+def projectComponents(project):
+    #single query over every component of the project, read in chunks
+    components = Component.objects.filter(page__project=project).order_by("page_id", "id")
+    return withStyles(components.iterator(chunk_size=STREAM_CHUNK_SIZE))
+
+def withStyles(components, chunk_size=STREAM_CHUNK_SIZE):
+    #resolves the styles of each chunk in one query before handing the components on
+    chunk = []
+    for component in components:
+        chunk.append(component)
+        if len(chunk) >= chunk_size:
+            yield from Style.resolve(chunk)
+            chunk = []
+    yield from Style.resolve(chunk)
+
+def encodeJSONArray(items, chunk_size=STREAM_CHUNK_SIZE):
+    #lazily encode an iterable as a json array, yielding one chunk of items at a time
+    yield b"["
+    buffer = []
+    first = True
+    for item in items:
+        encoded = dumps(item)
+        buffer.append(encoded if first else b"," + encoded)
+        first = False
+        if len(buffer) >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+    if buffer:
+        yield b"".join(buffer)
+    yield b"]"
+
+def encodeComponentData(components):
+    return encodeJSONArray(comp.getData() for comp in components)
+
+def streamChunks(chunks):
+    return StreamingHttpResponse(chunks, content_type="application/json")
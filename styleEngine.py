@@ -0,0 +1,33 @@
+# computes the percentage styles of every component of a page in one pass
+from .batchGeometry import relativeGeometry, percentColumns
+
+ROOT_GEOMETRY = {"width": "100%", "height": "100%"}
+
+def computeGeometry(comp, parent):
+    #percentage geometry of a component relative to its parent, parent may be None for roots
+    if parent is None:
+        return dict(ROOT_GEOMETRY)
+    width, height, left, top = relativeGeometry(comp.left, comp.top, comp.width, comp.height, parent.left, parent.top, parent.width, parent.height)
+    return {"width": f'{width}%', "height": f'{height}%', "left": f'{left}%', "top": f'{top}%'}
+
+def compileStyle(comp, parent):
+    style = dict(comp.secondary_state)
+    style.update(computeGeometry(comp, parent))
+    return style
+
+def compilePageStyles(components):
+    #index the page once by comp_id, a missing parent is treated like a root; the geometry of the whole page is
+    #computed in one batch, see batchGeometry
+    index = {comp.comp_id: comp for comp in components}
+    rows = {comp_id: row for row, comp_id in enumerate(index)}
+    comps = list(index.values())
+    parents = [rows.get(comp.parent, -1) for comp in comps]
+    columns = ([comp.left for comp in comps], [comp.top for comp in comps], [comp.width for comp in comps], [comp.height for comp in comps])
+    widths, heights, lefts, tops = percentColumns(columns, parents)
+    styles = {}
+    for row, comp in enumerate(comps):
+        if parents[row] < 0:
+            styles[comp.comp_id] = {**comp.secondary_state, **ROOT_GEOMETRY}
+        else:
+            styles[comp.comp_id] = {**comp.secondary_state, "width": widths[row], "height": heights[row], "left": lefts[row], "top": tops[row]}
+    return styles
@@ -1,8 +1,40 @@
-from django.test import TestCase
+import json
+import random
+import threading
+import time
+from unittest import mock
+from django.test import AsyncClient, TestCase, modify_settings, override_settings
 from rest_framework.test import APIClient as Client
-from .models import Project, Page, Component
+from .models import Project, Page, Component, Style, Revision, styleCache
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.urls import resolve, reverse
+from .styleEngine import compilePageStyles
+from .cssCompiler import compilePageCSS, cssValue
+from .cacheHelpers import TieredCache
+from .localCache import LRUCache, SizedLRUCache
+from .benchHelpers import generateProject, QUERY_BUDGETS
+from .cursorHelpers import encodeCursor
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .authentication import TOKEN_TTL
+from rest_framework.authtoken.models import Token
+from django.utils import timezone
+from .instrumentation import endpointStats
+from .jsonCodec import FastJSONParser, FastJSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import ErrorDetail, ParseError
+from io import BytesIO, StringIO
+from .urls import buildPatterns
+from .asyncViews import AsyncProjectListView
+from .eventBus import InProcessBus, RedisBus, LocalRedis
+from .changeFeed import encodeEvent
+from .spatialGrid import gridCell, GRID_CELL_SIZE, GRID_LEVELS
+from .componentTree import resolvePaths
+from .historyHelpers import collectStyles
+from .batchGeometry import geometryColumns, scalarColumns, percentColumns
+from . import deleteHelpers, writeBehind
+from django.core.management import call_command
 
 # Create your tests here.
 
@@ -106,6 +138,15 @@ class PagePostTest(TestCase):
         proj = Project.objects.get(name="Keep Going")
         response = c.post(self.reverseWrapper(proj.id), {"title": "Love"}, format="json")
         self.assertEqual(response.status_code, 200)
+    def test_page_title_already_exists(self):
+        c = Client()
+        user = User.objects.get(username="leona")
+        c.force_authenticate(user=user)
+        proj = Project.objects.get(name="Keep Going")
+        c.post(self.reverseWrapper(proj.id), {"title": "Love"}, format="json")
+        response = c.post(self.reverseWrapper(proj.id), {"title": "Love"}, format="json")
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(proj.pages.filter(title="Love").count(), 1)
 
 class PageViewTest(TestCase):
     def setUp(self):
@@ -124,20 +165,20 @@ class PageViewTest(TestCase):
         proj = Project.objects.get(name="Discipline")
         response = c.delete(self.reverseWrapper(proj.id, 93), {"title": "Hardness"}, format="json")
         # view returns 404 if project does not belong to user
-        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.status_code, 404)
     def test_unauthenticated(self):
         c = Client()
         proj = Project.objects.get(name="Discipline")
         response = c.delete(self.reverseWrapper(proj.id, 90), {"title": "Love"}, format="json")
         self.assertEqual(response.status_code, 401)
-    #if project belongs to user, but user has no page and tries to delete, return "Not Allowed"
+    #if project belongs to user, but user has no page and tries to delete, return "Not Found"
     def test_page_does_not_exist(self):
         user = User.objects.get(username="musa")
         c = Client()
         c.force_authenticate(user=user)
         proj = Project.objects.get(name="Discipline")
         response = c.delete(self.reverseWrapper(proj.id, 90), {"title": "Love"}, format="json")
-        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.status_code, 404)
     #if project belongs to user, page exists, user tries to delete check if successful
     def test_page_delete_successful(self):
         user = User.objects.get(username="musa")
@@ -207,6 +248,83 @@ class ComponentViewTest(TestCase):
         delete_response = c.delete(self.urlReverse(proj.id, page.id, comp_id_2))
         self.assertEqual(get_response.status_code, 200)
         self.assertEqual(delete_response.status_code, 200)
+    def test_ownership_resolved_in_one_query(self):
+        c = Client()
+        user = User.objects.get(username="Thobz")
+        c.force_authenticate(user=user)
+        component = Component.objects.get(comp_id="some-id")
+        c.get(self.urlReverse(component.page.project_id, component.page_id, component.id))
+        #component, page and project in one joined query, styles come from the cache
+        with self.assertNumQueries(1):
+            get_response = c.get(self.urlReverse(component.page.project_id, component.page_id, component.id))
+        self.assertEqual(get_response.status_code, 200)
+        #a component of another page of the same project is not found
+        with self.assertNumQueries(1):
+            other_response = c.get(self.urlReverse(component.page.project_id, component.page_id + 1, component.id))
+        self.assertEqual(other_response.status_code, 404)
+
+class StylesheetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="styled", password="tomriddle5")
+        self.project = Project.objects.create(user=self.user, name="styled project")
+        self.page_1 = Page.objects.create(project=self.project, title="first")
+        self.page_2 = Page.objects.create(project=self.project, title="second")
+        Component.objects.create(page=self.page_1, secondary_state={"backgroundColor": "blue", "WebkitTransform": "none", "zIndex": 2}, left=0, top=0, height=200, width=200, comp_id="root", parent=None)
+        Component.objects.create(page=self.page_1, secondary_state={"color": "red;} body{display:none", "page": "first"}, left=50, top=50, height=100, width=50, comp_id='say "hi"', parent="root")
+        Component.objects.create(page=self.page_2, secondary_state={}, left=0, top=0, height=10, width=10, comp_id="other", parent=None)
+        self.client = Client()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("project-css", kwargs={"project_id": self.project.id})
+    def test_project_stylesheet(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/css; charset=utf-8")
+        self.assertEqual(response.content.decode().splitlines(), [
+            f'[data-page="{self.page_1.id}"] [data-comp="root"]{{background-color:blue;-webkit-transform:none;z-index:2;width:100%;height:100%;}}',
+            f'[data-page="{self.page_1.id}"] [data-comp="say \\"hi\\""]{{width:25%;height:50%;left:0%;top:0%;}}',
+            f'[data-page="{self.page_2.id}"] [data-comp="other"]{{width:100%;height:100%;}}',
+        ])
+        page = self.client.get(reverse("page-css", kwargs={"project_id": self.project.id, "page_id": self.page_2.id}))
+        self.assertEqual(page.content.decode(), response.content.decode().splitlines(keepends=True)[2])
+    def test_only_changed_pages_recompiled(self):
+        self.client.get(self.url)
+        with mock.patch("main.cacheHelpers.compilePageCSS", wraps=compilePageCSS) as compiled:
+            #ownership lookup and pages, both artifacts come from the cache
+            with self.assertNumQueries(2):
+                self.client.get(self.url)
+            other = Component.objects.get(comp_id="other")
+            other.secondary_state = {"color": "green"}
+            other.save()
+            response = self.client.get(self.url)
+        self.assertEqual([call.args[0] for call in compiled.call_args_list], [self.page_2.id])
+        self.assertIn("color:green;", response.content.decode())
+    def test_strong_etag(self):
+        response_1 = self.client.get(self.url)
+        etag = response_1["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        response_2 = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response_2.status_code, 304)
+        Component.objects.filter(comp_id="other").first().delete()
+        response_3 = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response_3.status_code, 200)
+        self.assertNotIn("other", response_3.content.decode())
+    def test_other_users_project(self):
+        stranger = User.objects.create_user(username="stranger", password="tomriddle6")
+        self.client.force_authenticate(user=stranger)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+    def test_values_that_swallow_the_sheet(self):
+        for value in ["red /*", "*/ red", 'bold"', '"Arial', "'Arial", "url(a.png", "rgb(1, 2, 3))", "[a", "a]", "rgb(1, 2]"]:
+            with self.subTest(value=value):
+                self.assertIsNone(cssValue(value))
+                css = compilePageCSS(1, {"a": {"color": value}, "b": {"color": "blue"}})
+                self.assertEqual(css, '[data-page="1"] [data-comp="a"]{}\n[data-page="1"] [data-comp="b"]{color:blue;}\n')
+    def test_numbers_get_react_units(self):
+        style = {"borderRadius": 5, "fontSize": 12.5, "marginTop": 0, "zIndex": 2, "opacity": 0.5, "WebkitLineClamp": 3, "msFlexGrow": 1, "WebkitTransform": "none"}
+        self.assertEqual(compilePageCSS(1, {"a": style}), '[data-page="1"] [data-comp="a"]{border-radius:5px;font-size:12.5px;margin-top:0;z-index:2;opacity:0.5;-webkit-line-clamp:3;-ms-flex-grow:1;-webkit-transform:none;}\n')
+    def test_balanced_values_kept(self):
+        for value in ['"Arial", sans-serif', "url('a(1).png')", "rgb(1, 2, 3)", "calc((100% - 2px) / 2)", "[full] 1fr", 12]:
+            with self.subTest(value=value):
+                self.assertEqual(cssValue(value), str(value))
 
 class ComponentPostViewTest(TestCase):
     def setUp(self):
@@ -226,7 +344,7 @@ class ComponentPostViewTest(TestCase):
         c.force_authenticate(user=user)
         data = {}
         response = c.post(self.urlReverse(101, 102), data, format="json")
-        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.status_code, 404)
     def test_no_page(self):
         c = Client()
         user = User.objects.get(username="sethu")
@@ -234,7 +352,7 @@ class ComponentPostViewTest(TestCase):
         c.force_authenticate(user=user)
         data = {}
         response = c.post(self.urlReverse(project.id, 102), data, format="json")
-        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.status_code, 404)
     def test_successful(self):
         c = Client()
         user = User.objects.get(username="sethu")
@@ -244,6 +362,78 @@ class ComponentPostViewTest(TestCase):
         data_1 = {"left": 1, "top": 3, "width": 30, "height": 30, "id": "jdakie", "parent": None}
         response_1 = c.post(self.urlReverse(project.id, page.id), data_1, format="json")
         self.assertEqual(response_1.status_code, 200)
+    def test_created_components_survive_an_autosave(self):
+        #the listing only tells the editor the page through the page key it posted
+        c = Client()
+        user = User.objects.get(username="sethu")
+        project = Project.objects.get(name="unique 1")
+        page = Page.objects.get(project=project)
+        c.force_authenticate(user=user)
+        single = {"left": 1, "top": 3, "width": 30, "height": 30, "id": "single", "parent": None, "page": "best ever"}
+        batch = [{"left": 1, "top": 3, "width": 30, "height": 30, "id": "batch", "parent": None, "page": "best ever"}]
+        self.assertEqual(c.post(self.urlReverse(project.id, page.id), single, format="json").status_code, 200)
+        self.assertEqual(c.post(self.urlReverse(project.id, page.id), batch, format="json").status_code, 200)
+        delta = [{"op": "create", "page": "best ever", "id": "delta", "left": 1, "top": 3, "width": 30, "height": 30, "parent": None}]
+        self.assertEqual(c.post(reverse("components-delta", kwargs={"project_id": project.id}), {"base": Project.objects.get(pk=project.pk).version, "ops": delta}, format="json").status_code, 200)
+        listing = json.loads(b"".join(c.get(reverse("components-list", kwargs={"project_id": project.id})).streaming_content))
+        self.assertEqual([item["page"] for item in listing], ["best ever"] * 3)
+        for item in listing:
+            item["left"] += 1
+        response = c.put(reverse("components-list", kwargs={"project_id": project.id}), listing, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(page.components.values_list("left", flat=True)), [2, 2, 2])
+    def test_single_reports_its_errors(self):
+        c = Client()
+        user = User.objects.get(username="sethu")
+        project = Project.objects.get(name="unique 1")
+        page = Page.objects.get(project=project)
+        c.force_authenticate(user=user)
+        response_1 = c.post(self.urlReverse(project.id, page.id), {"top": 3, "width": 30, "height": 30, "id": "no-left", "parent": None}, format="json")
+        self.assertEqual((response_1.status_code, response_1.data), (400, {"left": ["This field is required."]}))
+        response_2 = c.post(self.urlReverse(project.id, page.id), "nonsense", format="json")
+        self.assertEqual(response_2.status_code, 400)
+        self.assertFalse(page.components.exists())
+    def test_batch_created_in_one_insert(self):
+        c = Client()
+        user = User.objects.get(username="sethu")
+        project = Project.objects.get(name="unique 1")
+        page = Page.objects.get(project=project)
+        c.force_authenticate(user=user)
+        data = [{"left": 1, "top": 3, "width": 30, "height": 30, "id": f"batch-{i}", "parent": None, "color": "red"} for i in range(30)]
+        #page with its project, taken comp_ids, savepoint, style insert, component insert, version bumps, change feed version, history read and insert, release
+        with self.assertNumQueries(11):
+            response_1 = c.post(self.urlReverse(project.id, page.id), data, format="json")
+        self.assertEqual(response_1.status_code, 200)
+        self.assertEqual(page.components.count(), 30)
+        self.assertDictEqual(page.components.get(comp_id="batch-0").secondary_state, {"color": "red"})
+    def test_batch_reports_every_bad_item(self):
+        c = Client()
+        user = User.objects.get(username="sethu")
+        project = Project.objects.get(name="unique 1")
+        page = Page.objects.get(project=project)
+        Component.objects.create(page=page, secondary_state={}, left=1, top=1, height=1, width=1, comp_id="taken", parent=None)
+        c.force_authenticate(user=user)
+        data = [
+            {"left": 1, "top": 3, "width": 30, "height": 30, "id": "fine", "parent": None},
+            {"left": 1, "top": 3, "width": 30, "height": 30, "id": "taken", "parent": None},
+            {"left": 1, "top": 3, "width": 30, "id": "short", "parent": None},
+            {"left": 1, "top": 3, "width": 30, "height": 30, "id": "fine", "parent": None},
+        ]
+        response_1 = c.post(self.urlReverse(project.id, page.id), data, format="json")
+        self.assertEqual(response_1.status_code, 400)
+        self.assertListEqual([error["index"] for error in response_1.data["errors"]], [1, 2, 3])
+        self.assertFalse(page.components.filter(comp_id="fine").exists())
+    def test_comp_id_already_exists(self):
+        c = Client()
+        user = User.objects.get(username="sethu")
+        project = Project.objects.get(name="unique 1")
+        page = Page.objects.get(project=project)
+        c.force_authenticate(user=user)
+        data_1 = {"left": 1, "top": 3, "width": 30, "height": 30, "id": "jdakie", "parent": None}
+        c.post(self.urlReverse(project.id, page.id), data_1, format="json")
+        response_1 = c.post(self.urlReverse(project.id, page.id), data_1, format="json")
+        self.assertEqual(response_1.status_code, 400)
+        self.assertEqual(page.components.filter(comp_id="jdakie").count(), 1)
 
 class ComponentListViewTest(TestCase):
     def setUp(self):
@@ -272,7 +462,7 @@ class ComponentListViewTest(TestCase):
         data_1 = {}
         response_2 = c.put(self.urlReverse(105), [data_1], format="json")
         self.assertEqual(response_1.status_code, 404)
-        self.assertEqual(response_2.status_code, 400)
+        self.assertEqual(response_2.status_code, 404)
     def test_no_components(self):
         c = Client()
         user = User.objects.get(username="inga")
@@ -290,6 +480,45 @@ class ComponentListViewTest(TestCase):
         c.force_authenticate(user=user)
         response_1 = c.get(self.urlReverse(project.id))
         self.assertEqual(response_1.status_code, 200)
+    def test_get_streams_all_components_in_one_query(self):
+        c = Client()
+        user = User.objects.get(username="inga")
+        project = Project.objects.get(name="unique 3")
+        Page.objects.create(project=project, title="second page")
+        c.force_authenticate(user=user)
+        #project lookup and a single component query, whatever the number of pages
+        with self.assertNumQueries(2):
+            response_1 = c.get(self.urlReverse(project.id))
+            data = json.loads(b"".join(response_1.streaming_content))
+        self.assertEqual(response_1["Content-Type"], "application/json")
+        self.assertListEqual([comp["id"] for comp in data], ["some-id-1", "another-id-2"])
+        self.assertEqual(data[1]["parent"], "some-id-1")
+        self.assertEqual(data[0]["backgroundColor"], "blue")
+    def test_get_not_modified_until_project_changes(self):
+        c = Client()
+        user = User.objects.get(username="inga")
+        project = Project.objects.get(name="unique 3")
+        c.force_authenticate(user=user)
+        response_1 = c.get(self.urlReverse(project.id))
+        etag = response_1["ETag"]
+        #only the project row is read when the client is up to date
+        with self.assertNumQueries(1):
+            response_2 = c.get(self.urlReverse(project.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response_2.status_code, 304)
+        data_1 = {"left": 1, "top": 3, "width": 30, "height": 30, "id": "some-id-1", "parent": None, "page": "best ever 3"}
+        c.put(self.urlReverse(project.id), data=[data_1], format="json")
+        response_3 = c.get(self.urlReverse(project.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response_3.status_code, 200)
+        self.assertNotEqual(response_3["ETag"], etag)
+    def test_single_component_writes_bump_version(self):
+        project = Project.objects.get(name="unique 3")
+        page = Page.objects.get(project=project)
+        version = project.version
+        comp = Component.objects.create(page=page, secondary_state={}, left=1, top=1, height=1, width=1, comp_id="bumper", parent=None)
+        comp.delete()
+        Page.objects.create(project=project, title="bumped")
+        project.refresh_from_db()
+        self.assertEqual(project.version, version + 3)
     def test_succesful_put(self):
         c = Client()
         user = User.objects.get(username="inga")
@@ -299,6 +528,979 @@ class ComponentListViewTest(TestCase):
         data_2 = {"left": 1, "top": 3, "width": 30, "height": 30, "id": "another-id-2", "parent": "some-id-1", "page": "best ever 3"}
         response_1 = c.put(self.urlReverse(project.id), data=[data_1, data_2], format="json")
         self.assertEqual(response_1.status_code, 200)
+        self.assertEqual(Component.objects.get(comp_id="another-id-2").width, 30)
+    def test_put_reports_every_bad_item(self):
+        c = Client()
+        user = User.objects.get(username="inga")
+        project = Project.objects.get(name="unique 3")
+        c.force_authenticate(user=user)
+        data_1 = {"left": 1, "top": 3, "width": 30, "height": 30, "id": "some-id-1", "parent": None, "page": "best ever 3"}
+        data_2 = {"left": 1, "top": 3, "width": 30, "height": 30, "id": "missing-id", "parent": None, "page": "best ever 3"}
+        data_3 = {"left": "far", "top": 3, "width": 30, "height": 30, "id": "another-id-2", "parent": "some-id-1", "page": "best ever 3"}
+        response_1 = c.put(self.urlReverse(project.id), data=[data_1, data_2, data_3], format="json")
+        self.assertEqual(response_1.status_code, 400)
+        self.assertListEqual([error["index"] for error in response_1.data["errors"]], [1, 2])
+        self.assertIn("left", response_1.data["errors"][1]["errors"])
+        #nothing is saved when any item is bad
+        self.assertEqual(Component.objects.get(comp_id="some-id-1").width, 50)
+    def test_put_reports_unhashable_keys(self):
+        c = Client()
+        user = User.objects.get(username="inga")
+        project = Project.objects.get(name="unique 3")
+        c.force_authenticate(user=user)
+        data = [{"page": [], "id": "some-id-1"}, {"page": "best ever 3", "id": {"x": 1}}]
+        response_1 = c.put(self.urlReverse(project.id), data=data, format="json")
+        self.assertEqual(response_1.status_code, 400)
+        self.assertListEqual([(error["index"], error["errors"]) for error in response_1.data["errors"]], [(0, ["Component does not exist."]), (1, ["Component does not exist."])])
+    def test_put_query_count_does_not_grow_with_components(self):
+        c = Client()
+        user = User.objects.get(username="inga")
+        project = Project.objects.get(name="unique 3")
+        page = Page.objects.get(project=project)
+        obj = {"backgroundColor": 'red'}
+        data = []
+        for i in range(50):
+            Component.objects.create(page=page, secondary_state=obj, left=1, top=1, height=1, width=1, comp_id=f"bulk-{i}", parent=None)
+            data.append({"left": 2, "top": 2, "width": 2, "height": 2, "id": f"bulk-{i}", "parent": None, "page": "best ever 3"})
+        c.force_authenticate(user=user)
+        #project lookup, component load, savepoint and release, style insert, one batched update, page and project version bumps, change feed version, history read and insert
+        with self.assertNumQueries(11):
+            response_1 = c.put(self.urlReverse(project.id), data=data, format="json")
+        self.assertEqual(response_1.status_code, 200)
+
+    def test_keyset_pagination(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="inga"))
+        project = Project.objects.get(name="unique 3")
+        page_2 = Page.objects.create(project=project, title="second page")
+        for n in range(3):
+            Component.objects.create(page=page_2, secondary_state={}, left=1, top=1, height=1, width=1, comp_id=f"second-{n}", parent=None)
+        response_1 = c.get(self.urlReverse(project.id), {"limit": 3})
+        self.assertEqual([item["id"] for item in response_1.data["results"]], ["some-id-1", "another-id-2", "second-0"])
+        #edits behind the cursor do not shift the next page
+        Component.objects.get(comp_id="some-id-1").delete()
+        Component.objects.create(page=page_2, secondary_state={}, left=1, top=1, height=1, width=1, comp_id="second-3", parent=None)
+        #ownership lookup and one keyset query
+        with self.assertNumQueries(2):
+            response_2 = c.get(self.urlReverse(project.id), {"limit": 3, "cursor": response_1.data["next"]})
+        self.assertEqual([item["id"] for item in response_2.data["results"]], ["second-1", "second-2", "second-3"])
+        self.assertIsNone(response_2.data["next"])
+        self.assertEqual(c.get(self.urlReverse(project.id), {"cursor": "nonsense"}).status_code, 400)
+        self.assertEqual(c.get(self.urlReverse(project.id), {"limit": 0}).status_code, 400)
+        #checked before the streamed listing sends its headers
+        self.assertEqual(c.get(self.urlReverse(project.id), {"page": "9" * 30}).status_code, 400)
+        self.assertEqual(c.get(self.urlReverse(project.id), {"cursor": encodeCursor(Component(page_id=1, id=2 ** 40))}).status_code, 400)
+    def test_page_filters_and_fields(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="inga"))
+        project = Project.objects.get(name="unique 3")
+        page = project.pages.get()
+        Page.objects.create(project=project, title="empty page")
+        response_1 = c.get(self.urlReverse(project.id), {"page_title": "empty page"})
+        self.assertEqual(json.loads(b"".join(response_1.streaming_content)), [])
+        response_2 = c.get(self.urlReverse(project.id), {"page": page.id, "fields": "left,backgroundColor", "limit": 1})
+        self.assertEqual(response_2.data["results"], [{"id": "some-id-1", "left": 55, "backgroundColor": "blue"}])
+        response_3 = c.get(self.urlReverse(project.id), {"fields": "parent"})
+        self.assertEqual(json.loads(b"".join(response_3.streaming_content)), [{"id": "some-id-1", "parent": None}, {"id": "another-id-2", "parent": "some-id-1"}])
+
+class PageStylesViewTest(TestCase):
+    def setUp(self):
+        def url_wrapper(project_id, page_id):
+            return reverse("page-styles", kwargs={"project_id": project_id, "page_id": page_id})
+        self.urlReverse = url_wrapper
+        user_1 = User.objects.create_user(username="ayanda", password="tomriddle3")
+        User.objects.create_user(username="stranger", password="tomriddle4")
+        user_project = Project.objects.create(user=user_1, name="styled")
+        user_page = Page.objects.create(project=user_project, title="styled page")
+        obj = {"backgroundColor": 'blue'}
+        Component.objects.create(page=user_page, secondary_state=obj, left=100, top=200, height=400, width=300, comp_id="root", parent=None)
+        Component.objects.create(page=user_page, secondary_state=obj, left=50, top=1, height=400, width=150, comp_id="child", parent="root")
+        Component.objects.create(page=user_page, secondary_state=obj, left=0, top=0, height=10, width=10, comp_id="zero", parent=None)
+        Component.objects.create(page=user_page, secondary_state=obj, left=5, top=5, height=5, width=5, comp_id="in-zero", parent="zero")
+        Component.objects.create(page=user_page, secondary_state=obj, left=5, top=5, height=5, width=5, comp_id="orphan", parent="gone")
+    def test_not_your_project(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="stranger"))
+        page = Page.objects.get(title="styled page")
+        response = c.get(self.urlReverse(page.project_id, page.id))
+        self.assertEqual(response.status_code, 404)
+    def test_page_styles_in_constant_queries(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="ayanda"))
+        page = Page.objects.get(title="styled page")
+        #page with its project in one query, then the components
+        with self.assertNumQueries(2):
+            response = c.get(self.urlReverse(page.project_id, page.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(response.data["root"], {"backgroundColor": "blue", "width": "100%", "height": "100%"})
+        self.assertDictEqual(response.data["child"], {"backgroundColor": "blue", "width": "50%", "height": "100%", "left": "50%", "top": "0%"})
+        #zero parent offsets and dangling parents have a defined result
+        self.assertEqual(response.data["in-zero"]["left"], "0%")
+        self.assertEqual(response.data["in-zero"]["width"], "50%")
+        self.assertDictEqual(response.data["orphan"], {"backgroundColor": "blue", "width": "100%", "height": "100%"})
+    def test_matches_component_get_styles(self):
+        page = Page.objects.get(title="styled page")
+        styles = compilePageStyles(page.components.all())
+        for comp in page.components.all():
+            self.assertDictEqual(styles[comp.comp_id], comp.getStyles())
+        #computing styles must not change the stored style
+        self.assertDictEqual(Component.objects.get(comp_id="child").secondary_state, {"backgroundColor": "blue"})
+    def test_batch_geometry_matches_get_styles(self):
+        page = Page.objects.get(title="styled page")
+        #the vectorized path on a small page, and the pure python one
+        with mock.patch("main.batchGeometry.VECTOR_MIN_ROWS", 0):
+            styles = compilePageStyles(page.components.all())
+        with mock.patch("main.batchGeometry.numpy", None):
+            self.assertDictEqual(compilePageStyles(page.components.all()), styles)
+        for comp in page.components.all():
+            self.assertDictEqual(styles[comp.comp_id], comp.getStyles())
+
+class BatchGeometryTest(TestCase):
+    def test_rounding_and_clamps(self):
+        #halves round to even, near full sizes snap to 100, offsets under 1% to 0, zero parents are defined
+        parent = (8, 8, 8, 8)
+        rows = [parent, (1, 3, 4, 7), (3, 5, 7, 8), (0, -4, 100, 1), (5, 5, 5, 5)]
+        columns = tuple(list(column) for column in zip(*rows))
+        columns[0][4] = 0
+        for column in columns:
+            column.append(5)
+        parents = [-1, 0, 0, 0, -1, 4]
+        expected = ([100, 50, 88, 100, 100, 100], [100, 88, 100, 12, 100, 100], [0, 12, 38, 0, 0, 0], [0, 38, 62, 0, 0, 100])
+        with mock.patch("main.batchGeometry.VECTOR_MIN_ROWS", 0):
+            self.assertEqual(geometryColumns(columns, parents), expected)
+            self.assertEqual(percentColumns(columns, parents)[2], ["0%", "12%", "38%", "0%", "0%", "0%"])
+        self.assertEqual(scalarColumns(columns, parents), expected)
+    def test_matches_scalar_path(self):
+        rng = random.Random(7)
+        count = 2000
+        columns = tuple([rng.randrange(-50, 400) for n in range(count)] for column in range(4))
+        parents = [rng.randrange(-1, row) if row else -1 for row in range(count)]
+        self.assertEqual(geometryColumns(columns, parents), scalarColumns(columns, parents))
+        self.assertEqual(percentColumns(columns, parents), tuple([f"{value}%" for value in values] for values in scalarColumns(columns, parents)))
+        #integers float64 cannot hold exactly are left to python
+        columns[0][1], columns[0][0] = 2 ** 60 + 1, 3
+        self.assertEqual(geometryColumns(columns, parents), scalarColumns(columns, parents))
+        columns[0][1] = 2 ** 70
+        self.assertEqual(geometryColumns(columns, parents), scalarColumns(columns, parents))
+
+class ComponentDeltaViewTest(TestCase):
+    def setUp(self):
+        def url_wrapper(project_id):
+            return reverse("components-delta", kwargs={"project_id": project_id})
+        self.urlReverse = url_wrapper
+        user_1 = User.objects.create_user(username="delta", password="tomriddle7")
+        user_project = Project.objects.create(user=user_1, name="delta project")
+        user_page = Page.objects.create(project=user_project, title="delta page")
+        obj = {"backgroundColor": 'blue', "borderRadius": "9px"}
+        Component.objects.create(page=user_page, secondary_state=obj, left=10, top=10, height=10, width=10, comp_id="box-1", parent=None)
+        Component.objects.create(page=user_page, secondary_state=obj, left=20, top=20, height=20, width=20, comp_id="box-2", parent=None)
+    def test_stale_base_conflicts(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="delta"))
+        project = Project.objects.get(name="delta project")
+        ops = [{"op": "update", "page": "delta page", "id": "box-1", "left": 11}]
+        response = c.post(self.urlReverse(project.id), {"base": project.version - 1, "ops": ops}, format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["version"], project.version)
+        self.assertEqual(Component.objects.get(comp_id="box-1").left, 10)
+    def test_unhashable_keys_reported(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="delta"))
+        project = Project.objects.get(name="delta project")
+        ops = [{"op": "update", "page": "delta page", "id": ["box-1"], "left": 11}, {"op": "delete", "page": ["delta page"], "id": "box-2"}]
+        response = c.post(self.urlReverse(project.id), {"base": project.version, "ops": ops}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertListEqual([error["index"] for error in response.data["errors"]], [0, 1])
+        self.assertEqual(Component.objects.filter(page__project=project).count(), 2)
+    def test_boolean_base_rejected(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="delta"))
+        project = Project.objects.get(name="delta project")
+        ops = [{"op": "update", "page": "delta page", "id": "box-1", "left": 11}]
+        for base in (True, False):
+            with self.subTest(base=base):
+                response = c.post(self.urlReverse(project.id), {"base": base, "ops": ops}, format="json")
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Component.objects.get(comp_id="box-1").left, 10)
+    def test_applies_ops(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="delta"))
+        project = Project.objects.get(name="delta project")
+        ops = [
+            {"op": "update", "page": "delta page", "id": "box-1", "left": 11, "borderRadius": None, "color": "red"},
+            {"op": "delete", "page": "delta page", "id": "box-2"},
+            {"op": "create", "page": "delta page", "id": "box-3", "left": 1, "top": 2, "width": 3, "height": 4, "parent": "box-1", "color": "green"},
+        ]
+        response = c.post(self.urlReverse(project.id), {"base": project.version, "ops": ops}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([result["status"] for result in response.data["results"]], ["updated", "deleted", "created"])
+        project.refresh_from_db()
+        self.assertEqual(response.data["version"], project.version)
+        box_1 = Component.objects.get(comp_id="box-1")
+        self.assertEqual(box_1.left, 11)
+        self.assertDictEqual(box_1.secondary_state, {"backgroundColor": "blue", "color": "red"})
+        self.assertFalse(Component.objects.filter(comp_id="box-2").exists())
+        box_3 = Component.objects.get(comp_id="box-3")
+        self.assertEqual(box_3.parent, "box-1")
+        self.assertDictEqual(box_3.secondary_state, {"page": "delta page", "color": "green"})
+    def test_bad_op_rolls_back_batch(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="delta"))
+        project = Project.objects.get(name="delta project")
+        ops = [
+            {"op": "update", "page": "delta page", "id": "box-1", "left": 11},
+            {"op": "update", "page": "delta page", "id": "missing", "left": 11},
+            {"op": "create", "page": "delta page", "id": "box-2", "left": 1, "top": 2, "width": 3, "height": 4, "parent": None},
+        ]
+        response = c.post(self.urlReverse(project.id), {"base": project.version, "ops": ops}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertListEqual([error["index"] for error in response.data["errors"]], [1, 2])
+        self.assertEqual(Component.objects.get(comp_id="box-1").left, 10)
+
+def parseEvents(body):
+    #[(event name, data)] of an sse body, comments and the retry field are skipped
+    events = []
+    for block in body.split(b"\n\n"):
+        fields = dict(line.split(b": ", 1) for line in block.split(b"\n") if b": " in line and not line.startswith(b":"))
+        if b"event" in fields:
+            events.append((fields[b"event"].decode(), json.loads(fields[b"data"])))
+    return events
+
+@mock.patch("main.changeFeed.FEED_MAX_SECONDS", 0.05)
+@mock.patch("main.changeFeed.FEED_POLL_SECONDS", 0.05)
+class ChangeFeedTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="feed", password="tomriddle9")
+        self.project = Project.objects.create(user=self.user, name="feed project")
+        self.page = Page.objects.create(project=self.project, title="feed page")
+        for n in range(2):
+            Component.objects.create(page=self.page, secondary_state={"color": "red"}, left=n, top=n, height=10, width=10, comp_id=f"box-{n}", parent=None)
+        self.project.refresh_from_db()
+        self.bus = InProcessBus()
+        patcher = mock.patch("main.changeFeed.bus", self.bus)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.c = Client()
+        self.c.force_authenticate(user=self.user)
+        self.url = reverse("project-events", kwargs={"project_id": self.project.id})
+    def test_bus_backends(self):
+        for bus in (InProcessBus(backlog=3), RedisBus(LocalRedis(), backlog=3, poll_interval=0.01)):
+            for version in (2, 1, 3, 4):
+                bus.publish(7, version, f"frame {version}".encode())
+            self.assertEqual([version for version, frame in bus.since(7, 0)], [2, 3, 4])
+            self.assertEqual(bus.since(7, 3), [(4, b"frame 4")])
+            self.assertEqual(bus.wait(7, 4, 0.02), [])
+            bus.drop(7)
+            self.assertEqual(bus.since(7, 0), [])
+    def test_writes_publish_events(self):
+        base = self.project.version
+        ops = [
+            {"op": "update", "page": "feed page", "id": "box-0", "left": 5},
+            {"op": "delete", "page": "feed page", "id": "box-1"},
+            {"op": "create", "page": "feed page", "id": "box-2", "left": 1, "top": 2, "width": 3, "height": 4, "parent": None},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.c.post(reverse("components-delta", kwargs={"project_id": self.project.id}), {"base": base, "ops": ops}, format="json")
+        with self.captureOnCommitCallbacks(execute=True):
+            Page.objects.create(project=self.project, title="second page")
+        self.project.refresh_from_db()
+        events = parseEvents(b"".join(frame for version, frame in self.bus.since(self.project.id, base)))
+        #the batch is published as a whole
+        self.assertEqual([name for name, data in events], ["components", "page"])
+        self.assertEqual([data["version"] for name, data in events], [base + 1, base + 2])
+        changes = events[0][1]["pages"][str(self.page.id)]
+        self.assertEqual([(item["id"], item["left"]) for item in changes["saved"]], [("box-2", 1), ("box-0", 5)])
+        self.assertEqual(changes["deleted"], ["box-1"])
+        self.assertEqual(events[1][1]["title"], "second page")
+    def test_stream_resumes_after_last_event_id(self):
+        base = self.project.version
+        with self.captureOnCommitCallbacks(execute=True):
+            Component.objects.filter(comp_id="box-1").get().delete()
+        response = self.c.get(self.url, HTTP_LAST_EVENT_ID=str(base))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = parseEvents(b"".join(response.streaming_content))
+        self.assertEqual(events, [("components", {"pages": {str(self.page.id): {"saved": [], "deleted": ["box-1"]}}, "version": base + 1})])
+        #nothing to replay for a client that is up to date
+        self.assertEqual(parseEvents(b"".join(self.c.get(self.url, {"version": base + 1}).streaming_content)), [])
+    def test_sync_stream_answers_once(self):
+        base = self.project.version
+        with self.captureOnCommitCallbacks(execute=True):
+            Component.objects.filter(comp_id="box-1").get().delete()
+        #a client behind gets the catch-up without waiting for more
+        with mock.patch("main.changeFeed.FEED_POLL_SECONDS", 30), mock.patch.object(self.bus, "wait") as wait:
+            events = parseEvents(b"".join(self.c.get(self.url, {"version": base}).streaming_content))
+        self.assertEqual([data["version"] for name, data in events], [base + 1])
+        wait.assert_not_called()
+        #an up to date one waits for the first events once and the stream ends
+        with mock.patch.object(self.bus, "wait", return_value=[(base + 2, encodeEvent(base + 2, "page", {"id": 1}))]) as wait:
+            events = parseEvents(b"".join(self.c.get(self.url, {"version": base + 1}).streaming_content))
+        self.assertEqual(events, [("page", {"id": 1, "version": base + 2})])
+        self.assertEqual(wait.call_args.args, (self.project.id, base + 1, 0.05))
+    def test_stream_resets_when_backlog_is_gone(self):
+        #the events before the process started are not kept, the client has to reload
+        events = parseEvents(b"".join(self.c.get(self.url, {"version": 0}).streaming_content))
+        self.assertEqual(events, [("reset", {"version": self.project.version})])
+        self.assertEqual(self.c.get(self.url, {"version": "soon"}).status_code, 400)
+        stranger = User.objects.create_user(username="feed stranger", password="tomriddle9")
+        self.c.force_authenticate(user=stranger)
+        self.assertEqual(self.c.get(self.url).status_code, 404)
+
+class CloneTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="cloner", password="tomriddle4")
+        self.project = generateProject(self.user, "clone source", pages=3, components=60, depth=3, fanout=3, seed=4)
+        self.page = self.project.pages.order_by("id").first()
+        self.c = Client()
+        self.c.force_authenticate(user=self.user)
+    def snapshot(self, project):
+        return [(comp.page.title, comp.getData()) for comp in Component.objects.filter(page__project=project).select_related("page").order_by("page__title", "id")]
+    def test_project_clone(self):
+        styles = Style.objects.count()
+        before = self.snapshot(self.project)
+        response = self.c.post(reverse("project-clone", kwargs={"project_id": self.project.id}), format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["name"], "clone source (copy)")
+        copy = Project.objects.get(pk=response.data["id"])
+        self.assertEqual(copy.user, self.user)
+        self.assertListEqual(self.snapshot(copy), before)
+        self.assertListEqual(self.snapshot(self.project), before)
+        #styles are shared with the source
+        self.assertEqual(Style.objects.count(), styles)
+        response = self.c.post(reverse("project-clone", kwargs={"project_id": self.project.id}), {"name": "clone source (copy)"}, format="json")
+        self.assertEqual(response.status_code, 406)
+        stranger = User.objects.create_user(username="clone stranger", password="tomriddle4")
+        self.c.force_authenticate(user=stranger)
+        self.assertEqual(self.c.post(reverse("project-clone", kwargs={"project_id": self.project.id}), format="json").status_code, 404)
+    def test_page_clone(self):
+        version = self.project.version
+        response = self.c.post(reverse("page-clone", kwargs={"project_id": self.project.id, "page_id": self.page.id}), {"title": "cloned page"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        copy = Page.objects.get(pk=response.data["id"])
+        self.assertEqual((copy.project_id, copy.title), (self.project.id, "cloned page"))
+        original = [comp.getData() for comp in self.page.components.order_by("id")]
+        self.assertListEqual([comp.getData() for comp in copy.components.order_by("id")], original)
+        self.project.refresh_from_db()
+        self.assertGreater(self.project.version, version)
+        response = self.c.post(reverse("page-clone", kwargs={"project_id": self.project.id, "page_id": self.page.id}), {"title": "cloned page"}, format="json")
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(Page.objects.filter(project=self.project).count(), 4)
+
+class DeleteTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="deleter", password="tomriddle3")
+        self.project = generateProject(self.user, "doomed project", pages=2, components=40, seed=5)
+        self.other = generateProject(self.user, "kept project", pages=1, components=10, seed=6)
+        self.c = Client()
+        self.c.force_authenticate(user=self.user)
+    def test_page_delete(self):
+        page, kept = self.project.pages.order_by("id")
+        version = self.project.version
+        response = self.c.delete(reverse("page-view", kwargs={"project_id": self.project.id, "page_id": page.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Page.objects.filter(pk=page.pk).exists())
+        self.assertFalse(Component.objects.filter(page_id=page.pk).exists())
+        self.assertEqual(kept.components.count(), 40)
+        self.project.refresh_from_db()
+        self.assertGreater(self.project.version, version)
+    def test_small_project_deleted_at_once(self):
+        response = self.c.delete(reverse("project-view", kwargs={"project_id": self.project.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertFalse(Component.objects.filter(page__project_id=self.project.pk).exists())
+        self.assertEqual(Component.objects.filter(page__project=self.other).count(), 10)
+    @mock.patch("main.deleteHelpers.PURGE_THRESHOLD", 50)
+    def test_large_project_hidden_then_purged(self):
+        url = reverse("components-list", kwargs={"project_id": self.project.id})
+        with mock.patch.object(deleteHelpers.purgeExecutor, "submit") as submit, self.captureOnCommitCallbacks(execute=True):
+            response = self.c.delete(reverse("project-view", kwargs={"project_id": self.project.id}))
+        self.assertEqual(response.status_code, 202)
+        submit.assert_called_once_with(deleteHelpers.purgeInBackground, self.project.id)
+        #gone for every lookup, and the name can be reused right away
+        self.assertEqual(self.c.get(url).status_code, 404)
+        self.assertEqual([item["name"] for item in self.c.get(reverse("projects-list")).data], ["kept project"])
+        self.assertEqual(self.c.post(reverse("projects-new"), {"name": "doomed project"}, format="json").status_code, 200)
+        deleteHelpers.purgeProject(self.project.id, chunk_size=7)
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertFalse(Component.objects.filter(page__project_id=self.project.pk).exists())
+        self.assertEqual(Component.objects.filter(page__project=self.other).count(), 10)
+    def test_purge_command_finishes_interrupted_purges(self):
+        Project.objects.filter(pk=self.project.pk).update(hidden=True)
+        call_command("purge_projects", stdout=StringIO())
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertTrue(Project.objects.filter(pk=self.other.pk).exists())
+
+class HistoryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="historian", password="tomriddle9")
+        self.project = generateProject(self.user, "history project", pages=2, components=20, seed=7)
+        self.page = self.project.pages.order_by("id").first()
+        self.c = Client()
+        self.c.force_authenticate(user=self.user)
+    def state(self):
+        return {(comp.page.title, comp.comp_id): comp.getData() for comp in Component.objects.filter(page__project=self.project).select_related("page")}
+    def delta(self, ops):
+        self.project.refresh_from_db()
+        response = self.c.post(reverse("components-delta", kwargs={"project_id": self.project.id}), {"base": self.project.version, "ops": ops}, format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.data["version"]
+    def test_writes_store_changed_fields(self):
+        comp = self.page.components.order_by("id").first()
+        version = self.delta([{"op": "update", "page": self.page.title, "id": comp.comp_id, "left": comp.left + 1}])
+        revision = self.project.revisions.order_by("-version").first()
+        self.assertEqual(revision.version, version)
+        self.assertFalse(revision.snapshot)
+        self.assertEqual(revision.depth, 1)
+        self.assertEqual(revision.data, {"set": {str(self.page.id): {comp.comp_id: {"left": comp.left + 1}}}, "del": {}})
+    @mock.patch("main.historyHelpers.HISTORY_SNAPSHOT_INTERVAL", 2)
+    def test_snapshot_every_interval(self):
+        comp = self.page.components.order_by("id").first()
+        #the generator's bulk insert did not say what it wrote and left a snapshot
+        self.assertTrue(self.project.revisions.order_by("-version").first().snapshot)
+        for left in range(5):
+            version = self.delta([{"op": "update", "page": self.page.title, "id": comp.comp_id, "left": left}])
+        revisions = list(self.project.revisions.order_by("-version").values_list("snapshot", "depth")[:5])
+        self.assertEqual(revisions, [(False, 2), (False, 1), (True, 0), (False, 2), (False, 1)])
+        self.assertEqual(self.project.revisions.filter(version__gt=version - 5).count(), 5)
+    def test_restore(self):
+        self.project.refresh_from_db()
+        version, before = self.project.version, self.state()
+        #the last generated components are leaves
+        first, second = self.page.components.order_by("-id")[:2]
+        self.delta([
+            {"op": "update", "page": self.page.title, "id": first.comp_id, "left": 999, "color": "red"},
+            {"op": "delete", "page": self.page.title, "id": second.comp_id},
+            {"op": "create", "page": self.page.title, "id": "late", "left": 1, "top": 1, "width": 1, "height": 1, "parent": None},
+        ])
+        other = self.project.pages.order_by("id").last()
+        self.c.delete(reverse("page-view", kwargs={"project_id": self.project.id, "page_id": other.id}))
+        self.assertNotEqual(self.state(), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.c.post(reverse("project-restore", kwargs={"project_id": self.project.id}), {"version": version}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.state(), before)
+        self.project.refresh_from_db()
+        self.assertEqual(response.data["version"], self.project.version)
+        #the restore is history too and can be undone the same way
+        self.assertEqual(self.project.revisions.order_by("-version").first().version, self.project.version)
+        self.assertEqual(styleCache.get(first.style_id), first.secondary_state)
+    def test_restore_without_history(self):
+        project = Project.objects.create(user=self.user, name="no history")
+        response = self.c.post(reverse("project-restore", kwargs={"project_id": project.id}), {"version": 0}, format="json")
+        self.assertEqual(response.status_code, 404)
+        response = self.c.post(reverse("project-restore", kwargs={"project_id": self.project.id}), {"version": "latest"}, format="json")
+        self.assertEqual(response.status_code, 400)
+    def test_restore_to_a_future_version(self):
+        self.project.refresh_from_db()
+        version = self.project.version
+        for future in (version + 5, 10 ** 30):
+            response = self.c.post(reverse("project-restore", kwargs={"project_id": self.project.id}), {"version": future}, format="json")
+            self.assertEqual(response.status_code, 404)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.version, version)
+    def test_history_listing(self):
+        comp = self.page.components.order_by("id").first()
+        self.delta([{"op": "update", "page": self.page.title, "id": comp.comp_id, "left": 7}])
+        response = self.c.get(reverse("project-history", kwargs={"project_id": self.project.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item["version"], item["snapshot"]) for item in response.data][0], (self.project.revisions.order_by("-version").first().version, False))
+        self.assertTrue(response.data[-1]["snapshot"])
+    def test_project_delete_takes_history(self):
+        self.c.delete(reverse("project-view", kwargs={"project_id": self.project.id}))
+        self.assertFalse(Revision.objects.filter(project_id=self.project.id).exists())
+        self.user.delete()
+
+class ViewportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="viewer", password="tomriddle10")
+        self.project = generateProject(self.user, "viewport project", pages=2, components=300, seed=8, canvas=5000, size=400)
+        self.page = self.project.pages.order_by("id").first()
+        #a huge one, one on negative coordinates and a point
+        Component.objects.create(page=self.page, secondary_state={}, left=-10 ** 7, top=-10 ** 7, width=10 ** 8, height=10 ** 8, comp_id="huge")
+        Component.objects.create(page=self.page, secondary_state={}, left=-700, top=-300, width=500, height=100, comp_id="negative")
+        Component.objects.create(page=self.page, secondary_state={}, left=2048, top=2048, width=0, height=0, comp_id="point")
+        self.url = reverse("page-viewport", kwargs={"project_id": self.project.id, "page_id": self.page.id})
+        self.c = Client()
+        self.c.force_authenticate(user=self.user)
+    def query(self, left, top, width, height, **params):
+        response = self.c.get(self.url, dict(params, left=left, top=top, width=width, height=height))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    def expected(self, left, top, width, height):
+        return [comp.comp_id for comp in self.page.components.order_by("id")
+            if comp.left <= left + width and comp.left + comp.width >= left and comp.top <= top + height and comp.top + comp.height >= top]
+    def test_matches_full_scan(self):
+        for rect in [(0, 0, 800, 600), (2048, 2048, 0, 0), (-1000, -1000, 400, 800), (4000, 100, 1920, 1080), (20000, 20000, 10, 10), (-5000, -5000, 20000, 20000)]:
+            self.assertEqual([item["id"] for item in self.query(*rect)], self.expected(*rect), rect)
+    def test_cells(self):
+        self.assertEqual(gridCell(10, 20, 30, 40), (0, 0, 0))
+        self.assertEqual(gridCell(-1, 300, GRID_CELL_SIZE + 1, 1), (1, -1, 0))
+        self.assertEqual(gridCell(0, 0, 10 ** 9, 1)[0], GRID_LEVELS - 1)
+    def test_index_follows_writes(self):
+        comp = self.page.components.order_by("id").first()
+        rect = (9000, 9000, 100, 100)
+        self.assertEqual([item["id"] for item in self.query(*rect)], ["huge"])
+        project_url = reverse("components-delta", kwargs={"project_id": self.project.id})
+        self.project.refresh_from_db()
+        self.c.post(project_url, {"base": self.project.version, "ops": [{"op": "update", "page": self.page.title, "id": comp.comp_id, "left": 9050, "top": 9050}]}, format="json")
+        self.assertEqual([item["id"] for item in self.query(*rect)], [comp.comp_id, "huge"])
+        self.c.post(reverse("new-component", kwargs={"project_id": self.project.id, "page_id": self.page.id}), [{"left": 9010, "top": 9010, "width": 5, "height": 5, "id": "late", "parent": None}], format="json")
+        self.assertEqual([item["id"] for item in self.query(*rect)], [comp.comp_id, "huge", "late"])
+        #copies keep their cells
+        copy = self.c.post(reverse("page-clone", kwargs={"project_id": self.project.id, "page_id": self.page.id}), format="json").data
+        url = reverse("page-viewport", kwargs={"project_id": self.project.id, "page_id": copy["id"]})
+        response = self.c.get(url, dict(zip(["left", "top", "width", "height"], rect)))
+        self.assertEqual([item["id"] for item in response.data], [comp.comp_id, "huge", "late"])
+    def test_projection_and_query_count(self):
+        #page with its project, then the components
+        with self.assertNumQueries(2):
+            data = self.query(0, 0, 100, 100, fields="left,top")
+        self.assertTrue(data)
+        self.assertEqual(set(data[0]), {"id", "left", "top"})
+    def test_bad_rectangle(self):
+        self.assertEqual(self.c.get(self.url, {"left": 0, "top": 0, "width": 10}).status_code, 400)
+        self.assertEqual(self.c.get(self.url, {"left": "a", "top": 0, "width": 10, "height": 10}).status_code, 400)
+        self.assertEqual(self.c.get(self.url, {"left": "9" * 30, "top": 0, "width": 10, "height": 10}).status_code, 400)
+        self.assertEqual(self.c.get(self.url, {"left": 0, "top": 0, "width": 10, "height": 2 ** 31}).status_code, 400)
+        self.assertEqual(self.c.get(self.url, {"left": 0, "top": 0, "width": -10, "height": 10}).status_code, 400)
+
+class TreeTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="gardener", password="tomriddle11")
+        self.project = Project.objects.create(user=self.user, name="tree project")
+        self.page = Page.objects.create(project=self.project, title="tree page")
+        self.c = Client()
+        self.c.force_authenticate(user=self.user)
+        #root > a > (b > c, d/e), plus a second root
+        items = [{"id": comp_id, "parent": parent, "left": 1, "top": 1, "width": 1, "height": 1} for comp_id, parent in
+            [("root", None), ("a", "root"), ("b", "a"), ("c", "b"), ("d/e", "a"), ("other", None)]]
+        response = self.c.post(self.componentUrl("new-component"), items, format="json")
+        self.assertEqual(response.status_code, 200)
+    def componentUrl(self, name, comp_id=None):
+        kwargs = {"project_id": self.project.id, "page_id": self.page.id}
+        if comp_id is not None:
+            kwargs["comp_id"] = Component.objects.get(page=self.page, comp_id=comp_id).id
+        return reverse(name, kwargs=kwargs)
+    def paths(self):
+        return dict(self.page.components.values_list("comp_id", "path"))
+    def subtree(self, comp_id):
+        response = self.c.get(self.componentUrl("component-subtree", comp_id))
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data]
+    def test_resolve_paths(self):
+        paths, cycles = resolvePaths({"a": None, "b": "a", "c": "gone", "x": "y", "y": "x", "z": "y"}, {})
+        self.assertEqual(paths, {"a": "/a/", "b": "/a/b/", "c": "/gone/c/"})
+        self.assertEqual(cycles, {"x", "y", "z"})
+        self.assertEqual(resolvePaths({"q": "p/1"}, {"p/1": "/p\\/1/"})[0], {"q": "/p\\/1/q/"})
+    def test_paths_follow_creates(self):
+        self.assertEqual(self.paths(), {"root": "/root/", "a": "/root/a/", "b": "/root/a/b/", "c": "/root/a/b/c/", "d/e": "/root/a/d\\/e/", "other": "/other/"})
+    def test_subtree_in_one_query(self):
+        url = self.componentUrl("component-subtree", "a")
+        #component with its project, the subtree
+        with self.assertNumQueries(2):
+            response = self.c.get(url)
+        self.assertEqual([item["id"] for item in response.data], ["a", "b", "c", "d/e"])
+        self.assertEqual(self.subtree("c"), ["c"])
+    def test_move_subtree(self):
+        url = self.componentUrl("component-move", "b")
+        response = self.c.post(url, {"parent": "other"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.subtree("other"), ["other", "b", "c"])
+        self.assertEqual(self.subtree("a"), ["a", "d/e"])
+        self.assertEqual(Component.objects.get(page=self.page, comp_id="b").parent, "other")
+        self.assertEqual(Component.objects.get(page=self.page, comp_id="c").parent, "b")
+        self.project.refresh_from_db()
+        self.assertEqual(response.data["version"], self.project.version)
+        #to the root and back
+        self.c.post(url, {"parent": None}, format="json")
+        self.assertEqual(self.paths()["c"], "/b/c/")
+    def test_move_rejects_cycles_and_missing_parents(self):
+        paths = self.paths()
+        url = self.componentUrl("component-move", "a")
+        self.assertEqual(self.c.post(url, {"parent": "c"}, format="json").status_code, 400)
+        self.assertEqual(self.c.post(url, {"parent": "a"}, format="json").status_code, 400)
+        response = self.c.post(url, {"parent": "nowhere"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("parent", response.data)
+        self.assertEqual(self.c.post(url, {"parent": 3}, format="json").status_code, 400)
+        self.assertEqual(self.paths(), paths)
+    def test_writes_reject_broken_trees(self):
+        response = self.c.post(self.componentUrl("new-component"), [{"id": "lost", "parent": "nowhere", "left": 1, "top": 1, "width": 1, "height": 1}], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"][0]["id"], "lost")
+        response = self.c.post(self.componentUrl("new-component"), {"id": "lost", "parent": "nowhere", "left": 1, "top": 1, "width": 1, "height": 1}, format="json")
+        self.assertEqual(response.status_code, 400)
+        delta = reverse("components-delta", kwargs={"project_id": self.project.id})
+        self.project.refresh_from_db()
+        #a parent cannot go while its children stay
+        response = self.c.post(delta, {"base": self.project.version, "ops": [{"op": "delete", "page": "tree page", "id": "b"}]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"], [{"index": 0, "id": "b", "errors": {"parent": ["Component still has children."]}}])
+        response = self.c.post(delta, {"base": self.project.version, "ops": [
+            {"op": "create", "page": "tree page", "id": "x", "parent": "y", "left": 1, "top": 1, "width": 1, "height": 1},
+            {"op": "create", "page": "tree page", "id": "y", "parent": "x", "left": 1, "top": 1, "width": 1, "height": 1},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.data["errors"]], [0, 1])
+        #an autosave cannot put a component under its own descendant
+        payload = [dict(Component.objects.get(page=self.page, comp_id="a").getData(), page="tree page", parent="c")]
+        response = self.c.put(reverse("components-list", kwargs={"project_id": self.project.id}), payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.paths()["a"], "/root/a/")
+    def test_batch_moves_rewrite_descendants(self):
+        delta = reverse("components-delta", kwargs={"project_id": self.project.id})
+        self.project.refresh_from_db()
+        response = self.c.post(delta, {"base": self.project.version, "ops": [
+            {"op": "update", "page": "tree page", "id": "b", "parent": "other"},
+            {"op": "delete", "page": "tree page", "id": "d/e"},
+            {"op": "create", "page": "tree page", "id": "f", "parent": "c", "left": 1, "top": 1, "width": 1, "height": 1},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.subtree("other"), ["other", "b", "c", "f"])
+        payload = [dict(Component.objects.get(page=self.page, comp_id="b").getData(), page="tree page", parent="a")]
+        self.assertEqual(self.c.put(reverse("components-list", kwargs={"project_id": self.project.id}), payload, format="json").status_code, 200)
+        self.assertEqual(self.paths()["f"], "/root/a/b/c/f/")
+    def test_large_batches(self):
+        #one create of a deep page, and moves whose subtrees are loaded over several queries
+        rows = [Component(page=self.page, secondary_state={}, left=1, top=1, width=1, height=1, comp_id=f"n{n}", parent=f"n{n - 1}" if n else "c") for n in range(1500)]
+        Style.intern(rows)
+        Component.objects.bulk_create(rows, batch_size=500)
+        self.assertEqual(self.paths()["n2"], "/root/a/b/c/n0/n1/n2/")
+        payload = [dict(comp.getData(), page="tree page", parent="other") for comp in Component.objects.filter(page=self.page, comp_id__in=["b", "d/e", "n1000"])]
+        with mock.patch("main.componentTree.SUBTREE_BATCH", 1):
+            self.assertEqual(self.c.put(reverse("components-list", kwargs={"project_id": self.project.id}), payload, format="json").status_code, 200)
+        paths = self.paths()
+        self.assertEqual((paths["n0"], paths["d/e"], paths["n1001"]), ("/other/b/c/n0/", "/other/d\\/e/", "/other/n1000/n1001/"))
+    def test_delete_takes_subtree_on_request(self):
+        #the same rule as a delta delete unless the subtree is asked for
+        response = self.c.delete(self.componentUrl("component-view", "b"))
+        self.assertEqual((response.status_code, response.data), (400, {"detail": "Component still has children."}))
+        self.assertIn("c", self.paths())
+        response = self.c.delete(self.componentUrl("component-view", "b") + "?subtree=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.paths()), {"root", "a", "d/e", "other"})
+    def test_missing_parents_are_adopted(self):
+        #rows written before parents were checked keep working: the orphan waits under its missing parent
+        Component.objects.create(page=self.page, secondary_state={}, left=1, top=1, width=1, height=1, comp_id="orphan", parent="late")
+        self.assertEqual(self.paths()["orphan"], "/late/orphan/")
+        Component.objects.create(page=self.page, secondary_state={}, left=1, top=1, width=1, height=1, comp_id="orphan-child", parent="orphan")
+        response = self.c.post(self.componentUrl("new-component"), [{"id": "late", "parent": "other", "left": 1, "top": 1, "width": 1, "height": 1}], format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.subtree("other"), ["other", "late", "orphan", "orphan-child"])
+        #and is left under it again when the parent goes through the ORM
+        Component.objects.get(page=self.page, comp_id="late").delete()
+        self.assertEqual(self.paths()["orphan"], "/late/orphan/")
+
+class StyleInterningTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="interned", password="tomriddle5")
+        project = Project.objects.create(user=self.user, name="interned project")
+        self.page = Page.objects.create(project=project, title="interned page")
+    def test_identical_styles_stored_once(self):
+        c = Client()
+        c.force_authenticate(user=self.user)
+        items = [{"left": 1, "top": 1, "width": 1, "height": 1, "id": f"box-{n}", "parent": None, "color": "red", "radius": "4px"} for n in range(20)]
+        items.append({"left": 1, "top": 1, "width": 1, "height": 1, "id": "odd", "parent": None, "radius": "4px", "color": "blue"})
+        c.post(reverse("new-component", kwargs={"project_id": self.page.project_id, "page_id": self.page.id}), items, format="json")
+        self.assertEqual(Style.objects.count(), 2)
+        #key order does not matter, and "all components with style X" is a plain indexed lookup
+        red = Style.digestOf({"radius": "4px", "color": "red"})
+        self.assertEqual(Component.objects.filter(style_id=red).count(), 20)
+        Component.objects.create(page=self.page, secondary_state={"radius": "4px", "color": "red"}, left=1, top=1, height=1, width=1, comp_id="late", parent=None)
+        self.assertEqual(Style.objects.count(), 2)
+    def test_update_switches_style(self):
+        component = Component.objects.create(page=self.page, secondary_state={"color": "red"}, left=1, top=1, height=1, width=1, comp_id="box", parent=None)
+        component.secondary_state = {"color": "green"}
+        component.save()
+        component.refresh_from_db()
+        self.assertEqual(component.secondary_state, {"color": "green"})
+        self.assertEqual(component.style_id, Style.digestOf({"color": "green"}))
+    def test_listing_resolves_styles_in_bulk(self):
+        for n in range(30):
+            Component.objects.create(page=self.page, secondary_state={"shade": n % 3}, left=1, top=1, height=1, width=1, comp_id=f"box-{n}", parent=None)
+        styleCache.clear()
+        c = Client()
+        c.force_authenticate(user=self.user)
+        #ownership lookup, components, one query for the three styles
+        with self.assertNumQueries(3):
+            data = json.loads(b"".join(c.get(reverse("components-list", kwargs={"project_id": self.page.project_id})).streaming_content))
+        self.assertEqual([item["shade"] for item in data[:4]], [0, 1, 2, 0])
+    def test_shared_style_is_not_mutated(self):
+        root = Component.objects.create(page=self.page, secondary_state={"color": "red"}, left=0, top=0, height=100, width=100, comp_id="root", parent=None)
+        child = Component.objects.create(page=self.page, secondary_state={"color": "red"}, left=0, top=0, height=50, width=50, comp_id="child", parent="root")
+        child.getStyles()
+        self.assertEqual(root.secondary_state, {"color": "red"})
+        self.assertIs(root.secondary_state, child.secondary_state)
+
+    def test_more_styles_than_the_cache_holds(self):
+        rows = [Component(page=self.page, secondary_state={"color": f"#{n:06x}"}, left=1, top=1, width=1, height=1, comp_id=f"box-{n}") for n in range(30)]
+        Style.intern(rows)
+        Component.objects.bulk_create(rows)
+        styleCache.clear()
+        #the resolved data stays on the instances once the shared cache has evicted it
+        with mock.patch("main.models.styleCache", LRUCache(4)):
+            with self.assertNumQueries(2):
+                styles = compilePageStyles(Style.resolve(list(self.page.components.all())))
+        self.assertEqual(styles["box-29"]["color"], "#00001d")
+    def test_collect_unused_styles(self):
+        c = Client()
+        c.force_authenticate(user=self.user)
+        c.post(reverse("new-component", kwargs={"project_id": self.page.project_id, "page_id": self.page.id}), {"left": 1, "top": 1, "width": 1, "height": 1, "id": "box", "parent": None, "color": "red"}, format="json")
+        for color in ["green", "blue"]:
+            c.put(reverse("components-list", kwargs={"project_id": self.page.project_id}), [{"left": 1, "top": 1, "width": 1, "height": 1, "id": "box", "parent": None, "color": color, "page": "interned page"}], format="json")
+        Style.intern([Component(secondary_state={"color": "never used"})])
+        self.assertEqual(Style.objects.count(), 4)
+        #every colour the history can restore stays
+        call_command("collect_styles", stdout=StringIO())
+        self.assertEqual(Style.objects.count(), 3)
+        Revision.objects.all().delete()
+        self.assertEqual(collectStyles(), 2)
+        self.assertEqual(Style.objects.get().data["color"], "blue")
+        self.assertEqual(self.page.components.get().secondary_state["color"], "blue")
+    def test_style_collected_while_interning(self):
+        #a writer reusing an unused style races the collector; whatever pin no longer finds is inserted again
+        Style.intern([Component(secondary_state={"color": "unused"})])
+        def collected(digests):
+            self.assertEqual(collectStyles(), 1)
+            return set(Style.objects.filter(digest__in=digests).values_list("digest", flat=True))
+        with mock.patch.object(Style, "pin", collected):
+            comp = Component.objects.create(page=self.page, secondary_state={"color": "unused"}, left=1, top=1, width=1, height=1, comp_id="late")
+        self.assertTrue(Style.objects.filter(digest=comp.style_id).exists())
+
+class AsyncURLConf:
+    urlpatterns = buildPatterns(async_views=True)
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="async", password="tomriddle5")
+        self.project = generateProject(self.user, "async project", pages=2, components=30, seed=3)
+        self.page = self.project.pages.order_by("id").first()
+        self.component = self.page.components.order_by("id").last()
+        self.headers = {"Authorization": f"Token {Token.objects.get(user=self.user).key}"}
+    async def content(self, response):
+        if response.streaming:
+            return b"".join([chunk async for chunk in response.streaming_content])
+        return response.content
+    async def test_authentication(self):
+        self.assertIs(resolve(reverse("projects-list")).func.view_class, AsyncProjectListView)
+        response_1 = await self.async_client.get(reverse("projects-list"))
+        self.assertEqual(response_1.status_code, 401)
+        self.assertEqual(response_1["WWW-Authenticate"], "Token")
+        response_2 = await self.async_client.get(reverse("projects-list"), headers={"Authorization": "Token nonsense"})
+        self.assertEqual(response_2.status_code, 401)
+        response_3 = await self.async_client.get(reverse("projects-list"), headers=self.headers)
+        self.assertEqual(json.loads(response_3.content), [{"name": "async project", "id": self.project.id}])
+    async def test_component_listing_matches_sync_output(self):
+        url = reverse("components-list", kwargs={"project_id": self.project.id})
+        expected = [comp.getData() async for comp in Component.objects.filter(page__project=self.project).order_by("page_id", "id")]
+        for _ in range(2):
+            #first from the database, then from the payload cache
+            response = await self.async_client.get(url, headers=self.headers)
+            self.assertEqual(await self.content(response), JSONRenderer().render(expected))
+        response = await self.async_client.get(url, headers=dict(self.headers, **{"If-None-Match": response["ETag"]}))
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(url, {"limit": 40, "fields": "left"}, headers=self.headers)
+        data = json.loads(response.content)
+        self.assertEqual(data["results"][39], {"id": expected[39]["id"], "left": expected[39]["left"]})
+        self.assertIsNotNone(data["next"])
+    async def test_component_view(self):
+        url = reverse("component-view", kwargs={"project_id": self.project.id, "page_id": self.page.id, "comp_id": self.component.id})
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("width", json.loads(response.content))
+        stranger = await User.objects.acreate(username="async stranger")
+        token = await Token.objects.aget(user=stranger)
+        response = await self.async_client.get(url, headers={"Authorization": f"Token {token.key}"})
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.delete(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await Component.objects.filter(pk=self.component.pk).aexists())
+    async def test_delete_parent_needs_subtree(self):
+        parent = await Component.objects.exclude(parent=None).values_list("parent", flat=True).filter(page=self.page).afirst()
+        parent = await Component.objects.aget(page=self.page, comp_id=parent)
+        url = reverse("component-view", kwargs={"project_id": self.project.id, "page_id": self.page.id, "comp_id": parent.id})
+        response = await self.async_client.delete(url, headers=self.headers)
+        self.assertEqual((response.status_code, json.loads(response.content)), (400, {"detail": "Component still has children."}))
+        response = await self.async_client.delete(url + "?subtree=1", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await Component.objects.filter(page=self.page, parent=parent.comp_id).aexists())
+    async def test_autosave(self):
+        url = reverse("components-list", kwargs={"project_id": self.project.id})
+        payload = [dict(self.component.getData(), page=self.page.title, left=self.component.left + 1)]
+        response = await self.async_client.put(url, json.dumps(payload), content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        await self.component.arefresh_from_db()
+        self.assertEqual(self.component.left, payload[0]["left"])
+        response = await self.async_client.put(url, b"{", content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+    @modify_settings(MIDDLEWARE={"append": "django.middleware.csrf.CsrfViewMiddleware"})
+    async def test_csrf_exempt_like_the_sync_views(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        url = reverse("components-list", kwargs={"project_id": self.project.id})
+        payload = [dict(self.component.getData(), page=self.page.title, left=self.component.left + 1)]
+        response = await client.put(url, json.dumps(payload), content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = await client.delete(reverse("component-view", kwargs={"project_id": self.project.id, "page_id": self.page.id, "comp_id": self.component.id}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+    async def test_change_feed(self):
+        with mock.patch("main.changeFeed.bus", InProcessBus()), mock.patch("main.changeFeed.FEED_MAX_SECONDS", 0.05):
+            response = await self.async_client.get(reverse("project-events", kwargs={"project_id": self.project.id}), {"version": 0}, headers=self.headers)
+            self.assertEqual(parseEvents(await self.content(response)), [("reset", {"version": self.project.version})])
+
+class CacheTest(TestCase):
+    def setUp(self):
+        def url_wrapper(project_id, page_id):
+            return reverse("page-styles", kwargs={"project_id": project_id, "page_id": page_id})
+        self.urlReverse = url_wrapper
+        user_1 = User.objects.create_user(username="cached", password="tomriddle5")
+        User.objects.create_superuser(username="admin", password="tomriddle6")
+        user_project = Project.objects.create(user=user_1, name="cached project")
+        user_page = Page.objects.create(project=user_project, title="cached page")
+        Component.objects.create(page=user_page, secondary_state={}, left=100, top=100, height=100, width=100, comp_id="root", parent=None)
+        Component.objects.create(page=user_page, secondary_state={}, left=50, top=50, height=50, width=50, comp_id="child", parent="root")
+    def test_lru_evicts_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), 1)
+        self.assertEqual(len(lru), 2)
+    def test_local_tier_bounded_by_bytes(self):
+        cache = TieredCache("sized", maxbytes=10, sizeof=lambda chunks: sum(map(len, chunks)))
+        cache.set("a", 1, [b"1234"])
+        cache.set("b", 1, [b"12", b"34"])
+        cache.set("c", 1, [b"1234"])
+        self.assertIsNone(cache.local.get("a"))
+        self.assertEqual(cache.stats()["local_bytes"], 8)
+        #too large to keep locally at all, still served from the shared tier
+        cache.set("d", 1, [b"12345678901"])
+        self.assertIsNone(cache.local.get("d"))
+        self.assertEqual(cache.get("d", 1), [b"12345678901"])
+        self.assertEqual(cache.stats()["local_bytes"], 8)
+        cache.delete("b")
+        self.assertEqual(cache.local.bytes, 4)
+    def test_sized_lru_replaces_in_place(self):
+        lru = SizedLRUCache(4, 10, len)
+        lru.set("a", "123456")
+        lru.set("a", "1234")
+        lru.set("b", "123456")
+        self.assertEqual((lru.get("a"), lru.bytes), ("1234", 10))
+    def test_counters_under_threads(self):
+        cache = TieredCache("counted")
+        cache.set("a", 1, "value")
+        def hit():
+            for _ in range(2000):
+                cache.get("a", 1)
+        threads = [threading.Thread(target=hit) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.stats()["local_hits"], 16000)
+    def test_page_styles_served_from_cache(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="cached"))
+        page = Page.objects.get(title="cached page")
+        response_1 = c.get(self.urlReverse(page.project_id, page.id))
+        #only the ownership lookup, the components are not read again
+        with self.assertNumQueries(1):
+            response_2 = c.get(self.urlReverse(page.project_id, page.id))
+        self.assertDictEqual(response_1.data, response_2.data)
+    def test_component_write_invalidates_page_styles(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="cached"))
+        page = Page.objects.get(title="cached page")
+        c.get(self.urlReverse(page.project_id, page.id))
+        child = Component.objects.get(comp_id="child")
+        child.width = 25
+        child.save()
+        response = c.get(self.urlReverse(page.project_id, page.id))
+        self.assertEqual(response.data["child"]["width"], "25%")
+    def test_stats_are_admin_only(self):
+        c = Client()
+        c.force_authenticate(user=User.objects.get(username="cached"))
+        self.assertEqual(c.get(reverse("cache-stats")).status_code, 403)
+        c.force_authenticate(user=User.objects.get(username="admin"))
+        response = c.get(reverse("cache-stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("misses", response.data["styles"])
+
+@modify_settings(MIDDLEWARE={"append": "main.middleware.RequestTimingMiddleware"})
+class RequestTimingTest(TestCase):
+    def setUp(self):
+        endpointStats.clear()
+        self.user = User.objects.create_user(username="timed", password="tomriddle5")
+        User.objects.create_superuser(username="admin", password="tomriddle6")
+        project = Project.objects.create(user=self.user, name="timed project")
+        self.page = Page.objects.create(project=project, title="timed page")
+    def test_server_timing_header(self):
+        c = Client()
+        c.force_authenticate(user=self.user)
+        items = [{"left": 1, "top": 1, "width": 1, "height": 1, "id": f"timed-{n}", "parent": None} for n in range(3)]
+        response = c.post(reverse("new-component", kwargs={"project_id": self.page.project_id, "page_id": self.page.id}), items, format="json")
+        self.assertEqual(response.status_code, 200)
+        entries = {entry.split(";")[0]: entry for entry in response["Server-Timing"].split(", ")}
+        self.assertIn("serializer", entries)
+        self.assertIn("render", entries)
+        self.assertIn("total", entries)
+        self.assertRegex(entries["db"], r'desc="[1-9]\d* queries"')
+    def test_endpoint_histograms(self):
+        c = Client()
+        c.force_authenticate(user=self.user)
+        c.get(reverse("projects-list"))
+        c.get(reverse("projects-list"))
+        self.assertEqual(c.get(reverse("request-stats")).status_code, 403)
+        c.force_authenticate(user=User.objects.get(username="admin"))
+        response = c.get(reverse("request-stats"))
+        self.assertEqual(response.status_code, 200)
+        stats = response.data["GET projects-list"]
+        self.assertEqual(stats["total"]["count"], 2)
+        self.assertEqual(sum(stats["queries"]["buckets"].values()), 2)
+    def test_slow_requests_log_sql(self):
+        c = Client()
+        c.force_authenticate(user=self.user)
+        with mock.patch("main.middleware.SLOW_REQUEST_MS", 0), self.assertLogs("main.middleware", level="WARNING") as logs:
+            c.get(reverse("projects-list"))
+        self.assertIn("SELECT", logs.output[0])
+
+class JSONCodecTest(TestCase):
+    def setUp(self):
+        self.data = {
+            "components": [{"id": "root", "parent": None, "left": 10, "width": 99.5, "label": "d\u00e9j\u00e0 vu \u2603", "tags": ["a", "b"]}],
+            "separators": "line\u2028para\u2029",
+            "errors": {"left": [ErrorDetail("A valid integer is required.", code="invalid")]},
+            "expires": timezone.now(),
+            "huge": 2 ** 70,
+            "empty": {},
+        }
+    def test_renderer_matches_stock_output(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+        #indented output keeps the stock path
+        self.assertEqual(FastJSONRenderer().render(self.data, "application/json; indent=4"), JSONRenderer().render(self.data, "application/json; indent=4"))
+    def test_stdlib_fallback_matches(self):
+        with mock.patch("main.jsonCodec.orjson", None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+            self.assertEqual(FastJSONParser().parse(BytesIO(b'{"a": [1, null]}')), {"a": [1, None]})
+    def test_parser_matches_stock_parser(self):
+        body = JSONRenderer().render({key: value for key, value in self.data.items() if key != "expires"})
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        for invalid in (b"{", b'{"left": NaN}'):
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(BytesIO(invalid))
+    def test_listing_round_trip(self):
+        user = User.objects.create_user(username="codec", password="tomriddle5")
+        project = generateProject(user, "codec project", components=20, style_size=6)
+        c = Client()
+        c.force_authenticate(user=user)
+        url = reverse("components-list", kwargs={"project_id": project.id})
+        streamed = b"".join(c.get(url).streaming_content)
+        expected = [comp.getData() for comp in Component.objects.filter(page__project=project).order_by("page_id", "id")]
+        self.assertEqual(streamed, JSONRenderer().render(expected))
+        page = c.get(url, {"limit": 20})
+        self.assertEqual(page.content, JSONRenderer().render({"results": expected, "next": None}))
 
 class SignUpTest(TestCase):
     def setUp(self):
@@ -334,3 +1536,243 @@ class LoginTest(TestCase):
         response = c.post(reverse("auth-view"), {"username": "atibia@gmail.com", "password": "hashatibia13"}, format="json")
         self.assertEquals(response.status_code, 400)
 
+class TokenAuthenticationTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="token@gmail.com", password="hashtoken1", email="token@gmail.com")
+        Project.objects.create(user=user, name="token project")
+    def login(self):
+        c = Client()
+        response = c.post(reverse("auth-view"), {"username": "token@gmail.com", "password": "hashtoken1"}, format="json")
+        c.credentials(HTTP_AUTHORIZATION="Token " + response.data["token"])
+        return c, response.data["token"]
+    def test_resolved_user_is_cached(self):
+        c, key = self.login()
+        self.assertEqual(c.get(reverse("projects-list")).status_code, 200)
+        #only the view's own project queries, no token lookup
+        with self.assertNumQueries(2):
+            response = c.get(reverse("projects-list"))
+        self.assertEqual(response.status_code, 200)
+    def test_logout_invalidates_token(self):
+        c, key = self.login()
+        c.get(reverse("projects-list"))
+        self.assertEqual(c.post(reverse("auth-logout")).status_code, 200)
+        self.assertEqual(c.get(reverse("projects-list")).status_code, 401)
+    def test_deactivated_user_is_rejected(self):
+        c, key = self.login()
+        c.get(reverse("projects-list"))
+        user = User.objects.get(username="token@gmail.com")
+        user.is_active = False
+        user.save()
+        self.assertEqual(c.get(reverse("projects-list")).status_code, 401)
+    def test_refresh_rotates_token(self):
+        c, key = self.login()
+        response = c.post(reverse("auth-refresh"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data["token"], key)
+        self.assertEqual(c.get(reverse("projects-list")).status_code, 401)
+        c.credentials(HTTP_AUTHORIZATION="Token " + response.data["token"])
+        self.assertEqual(c.get(reverse("projects-list")).status_code, 200)
+    def test_expired_token_is_rejected_and_replaced_on_login(self):
+        c, key = self.login()
+        Token.objects.filter(key=key).update(created=timezone.now() - TOKEN_TTL)
+        self.assertEqual(c.get(reverse("projects-list")).status_code, 401)
+        c, new_key = self.login()
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(c.get(reverse("projects-list")).status_code, 200)
+
+@mock.patch("main.writeBehind.WRITE_BEHIND", True)
+class WriteBehindTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="dragger", password="tomriddle12")
+        self.project = generateProject(self.user, "autosaved project", components=5, seed=3)
+        self.c = Client()
+        self.c.force_authenticate(user=self.user)
+        self.url = reverse("components-list", kwargs={"project_id": self.project.id})
+        self.payload = [dict(comp.getData(), page=comp.page.title) for comp in Component.objects.filter(page__project=self.project).select_related("page").order_by("id")]
+        writeBehind.buffers.clear()
+        #flushes are driven by the tests, no timer thread writes behind the test transaction
+        patcher = mock.patch("main.writeBehind.threading.Timer")
+        self.timer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(writeBehind.buffers.clear)
+    def stored(self, index):
+        return Component.objects.get(page__project=self.project, comp_id=self.payload[index]["id"]).left
+    def drag(self, index, left):
+        self.payload[index] = dict(self.payload[index], left=left)
+        return self.c.put(self.url, self.payload, format="json")
+    def test_coalesces_until_read(self):
+        left = self.stored(0)
+        for step in range(1, 6):
+            self.assertEqual(self.drag(0, left + step).status_code, 202)
+        self.assertEqual(self.stored(0), left)
+        self.timer.assert_called_once()
+        self.timer.return_value.start.assert_called_once()
+        #the next request of the project writes the buffer first and sees the last frame
+        version = Project.objects.get(pk=self.project.pk).version
+        response = self.c.get(self.url)
+        item = next(item for item in json.loads(b"".join(response.streaming_content)) if item["id"] == self.payload[0]["id"])
+        self.assertEqual(item["left"], left + 5)
+        self.assertEqual(self.stored(0), left + 5)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).version, version + 1)
+        self.timer.return_value.cancel.assert_called_once()
+        #a resend of what is stored leaves nothing to write
+        self.assertEqual(self.c.put(self.url, self.payload, format="json").status_code, 200)
+    def test_size_threshold_writes_in_request(self):
+        with mock.patch("main.writeBehind.WRITE_BEHIND_MAX_ITEMS", 2):
+            #the first autosave has nothing to diff against, the whole project is pending at once
+            self.assertEqual(self.c.put(self.url, self.payload, format="json").status_code, 200)
+            self.assertEqual(self.drag(0, 1).status_code, 202)
+            self.assertEqual(self.drag(1, 2).status_code, 200)
+        self.assertEqual((self.stored(0), self.stored(1)), (1, 2))
+        self.assertFalse(writeBehind.hasPending(self.project.id))
+    def test_background_errors_reach_next_autosave(self):
+        self.assertEqual(self.drag(0, "wide").status_code, 202)
+        left = self.stored(1)
+        self.drag(1, left + 1)
+        writeBehind.flushProject(self.project.id)
+        self.assertEqual(self.stored(1), left)
+        response = self.drag(1, left + 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"][0]["id"], self.payload[0]["id"])
+        #reported once, the fixed payload goes through again in full
+        self.payload[0]["left"] = 3
+        self.assertEqual(self.c.put(self.url, self.payload, format="json").status_code, 202)
+        writeBehind.flushAll()
+        self.assertEqual((self.stored(0), self.stored(1)), (3, left + 1))
+    def test_other_writes_invalidate_accepted_items(self):
+        left = self.stored(0)
+        self.drag(0, left + 1)
+        writeBehind.flushAll()
+        self.project.refresh_from_db()
+        ops = [{"op": "update", "page": self.payload[0]["page"], "id": self.payload[0]["id"], "left": left + 7}]
+        self.assertEqual(self.c.post(reverse("components-delta", kwargs={"project_id": self.project.id}), {"base": self.project.version, "ops": ops}, format="json").status_code, 200)
+        #the same payload as the last autosave now differs from the database and is written again
+        self.assertEqual(self.c.put(self.url, self.payload, format="json").status_code, 202)
+        writeBehind.flushAll()
+        self.assertEqual(self.stored(0), left + 1)
+    def test_locked_writes_flush_before_the_lock(self):
+        #a flush waiting on the project row from inside the locked request would wait on itself, the views flush
+        #once up front and their lookups under the lock do not
+        page = self.project.pages.get()
+        comp = page.components.exclude(parent=None).first()
+        self.drag(0, 1)
+        calls = []
+        flushProject = writeBehind.flushProject
+        def recorder(where):
+            def record(project_id):
+                calls.append(where)
+                flushProject(project_id)
+            return record
+        with mock.patch("main.mixins.flushProject", recorder("lookup")), mock.patch("main.views.flushProject", recorder("view")):
+            response = self.c.post(reverse("component-move", kwargs={"project_id": self.project.id, "page_id": page.id, "comp_id": comp.id}), {"parent": None}, format="json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.stored(0), 1)
+            self.assertEqual(self.c.post(reverse("page-clone", kwargs={"project_id": self.project.id, "page_id": page.id}), {}, format="json").status_code, 200)
+        self.assertEqual(calls, ["view", "view"])
+    def test_readers_wait_for_a_running_flush(self):
+        self.drag(0, 1)
+        buffer = writeBehind.buffers[self.project.id]
+        #a flush in another thread has taken the items and not stored them yet
+        taken, finished = threading.Event(), []
+        def runningFlush():
+            with buffer.flushing:
+                with buffer.lock:
+                    buffer.pending = {}
+                taken.set()
+                time.sleep(0.2)
+                finished.append(True)
+        thread = threading.Thread(target=runningFlush)
+        thread.start()
+        taken.wait(5)
+        self.assertTrue(writeBehind.hasPending(self.project.id))
+        writeBehind.flushProject(self.project.id)
+        self.assertEqual(finished, [True])
+        thread.join()
+        self.assertFalse(writeBehind.hasPending(self.project.id))
+    def test_rejects_items_it_cannot_coalesce(self):
+        response = self.c.put(self.url, self.payload + [3, {"page": "page-0"}], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.data["errors"]], [5, 6])
+        self.assertFalse(writeBehind.hasPending(self.project.id))
+
+class QueryBudgetTest(TestCase):
+    #requests must stay within QUERY_BUDGETS whatever the size of the project
+    def setUp(self):
+        self.user = User.objects.create_user(username="budget", password="tomriddle8")
+        self.small = generateProject(self.user, "small budget", pages=2, components=20, depth=2, fanout=3, seed=1)
+        self.large = generateProject(self.user, "large budget", pages=2, components=200, depth=5, fanout=4, seed=2)
+        self.client = Client()
+        self.client.force_authenticate(user=self.user)
+    def assertWithinBudget(self, label, send):
+        with CaptureQueriesContext(connection) as context:
+            response = send()
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        self.assertLessEqual(len(context.captured_queries), QUERY_BUDGETS[label], label)
+    def test_generator_is_deterministic(self):
+        other = generateProject(self.user, "small budget again", pages=2, components=20, depth=2, fanout=3, seed=1)
+        first = [comp.getData() for comp in Component.objects.filter(page__project=self.small).order_by("id")]
+        second = [comp.getData() for comp in Component.objects.filter(page__project=other).order_by("id")]
+        self.assertListEqual(first, second)
+        depths = {}
+        for comp in second:
+            depths[comp["id"]] = 0 if comp["parent"] is None else depths[comp["parent"]] + 1
+        self.assertEqual(max(depths.values()), 1)
+    def test_budgets(self):
+        c = self.client
+        for project in (self.small, self.large):
+            page = project.pages.order_by("id").first()
+            component = page.components.order_by("id").last()
+            self.assertWithinBudget("projects-list", lambda: c.get(reverse("projects-list")))
+            self.assertWithinBudget("page-post", lambda: c.post(reverse("page-post", kwargs={"project_id": project.id}), {"title": "budget page"}, format="json"))
+            self.assertWithinBudget("page-viewport", lambda: c.get(reverse("page-viewport", kwargs={"project_id": project.id, "page_id": page.id}), {"left": 100, "top": 100, "width": 400, "height": 300}))
+            self.assertWithinBudget("page-styles", lambda: c.get(reverse("page-styles", kwargs={"project_id": project.id, "page_id": page.id})))
+            self.assertWithinBudget("project-css", lambda: c.get(reverse("project-css", kwargs={"project_id": project.id})))
+            self.assertWithinBudget("page-css", lambda: c.get(reverse("page-css", kwargs={"project_id": project.id, "page_id": page.id})))
+            self.assertWithinBudget("components-list", lambda: c.get(reverse("components-list", kwargs={"project_id": project.id})))
+            #an autosave resends every component with a few of them moved
+            payload = []
+            for index, comp in enumerate(Component.objects.filter(page__project=project).select_related("page")):
+                item = comp.getData()
+                item.update({"page": comp.page.title, "left": comp.left + (1 if index % 50 == 0 else 0)})
+                payload.append(item)
+            #the first save stores the page title in secondary_state like any client save, prime it
+            c.put(reverse("components-list", kwargs={"project_id": project.id}), [dict(item, left=item["left"] - (1 if index % 50 == 0 else 0)) for index, item in enumerate(payload)], format="json")
+            self.assertWithinBudget("components-list-page", lambda: c.get(reverse("components-list", kwargs={"project_id": project.id}), {"limit": 50, "fields": "left,top"}))
+            self.assertWithinBudget("components-list-put", lambda: c.put(reverse("components-list", kwargs={"project_id": project.id}), payload, format="json"))
+            project.refresh_from_db()
+            version = project.version
+            ops = [{"op": "update", "page": page.title, "id": component.comp_id, "left": 3}, {"op": "create", "page": page.title, "id": "budget-new", "left": 1, "top": 1, "width": 1, "height": 1, "parent": None}]
+            self.assertWithinBudget("components-delta", lambda: c.post(reverse("components-delta", kwargs={"project_id": project.id}), {"base": project.version, "ops": ops}, format="json"))
+            items = [{"left": 1, "top": 1, "width": 1, "height": 1, "id": f"budget-{n}", "parent": None} for n in range(20)]
+            self.assertWithinBudget("new-component", lambda: c.post(reverse("new-component", kwargs={"project_id": project.id, "page_id": page.id}), items, format="json"))
+            self.assertWithinBudget("component-view", lambda: c.get(reverse("component-view", kwargs={"project_id": project.id, "page_id": page.id, "comp_id": component.id})))
+            self.assertWithinBudget("project-history", lambda: c.get(reverse("project-history", kwargs={"project_id": project.id})))
+            self.assertWithinBudget("project-restore", lambda: c.post(reverse("project-restore", kwargs={"project_id": project.id}), {"version": version}, format="json"))
+            with mock.patch("main.changeFeed.FEED_POLL_SECONDS", 0):
+                self.assertWithinBudget("project-events", lambda: c.get(reverse("project-events", kwargs={"project_id": project.id}), {"version": version}))
+            self.assertWithinBudget("component-subtree", lambda: c.get(reverse("component-subtree", kwargs={"project_id": project.id, "page_id": page.id, "comp_id": component.id})))
+            self.assertWithinBudget("component-move", lambda: c.post(reverse("component-move", kwargs={"project_id": project.id, "page_id": page.id, "comp_id": component.id}), {"parent": None}, format="json"))
+            self.assertWithinBudget("component-view-delete", lambda: c.delete(reverse("component-view", kwargs={"project_id": project.id, "page_id": page.id, "comp_id": component.id}) + "?subtree=1"))
+            self.assertWithinBudget("project-clone", lambda: c.post(reverse("project-clone", kwargs={"project_id": project.id}), format="json"))
+            self.assertWithinBudget("page-clone", lambda: c.post(reverse("page-clone", kwargs={"project_id": project.id, "page_id": page.id}), format="json"))
+            self.assertWithinBudget("page-view", lambda: c.delete(reverse("page-view", kwargs={"project_id": project.id, "page_id": page.id})))
+            self.assertWithinBudget("project-view", lambda: c.delete(reverse("project-view", kwargs={"project_id": project.id})))
+    def test_unchanged_autosave_writes_nothing(self):
+        project = self.large
+        payload = []
+        for comp in Component.objects.filter(page__project=project).select_related("page"):
+            item = comp.getData()
+            item["page"] = comp.page.title
+            payload.append(item)
+        url = reverse("components-list", kwargs={"project_id": project.id})
+        self.client.put(url, payload, format="json")
+        project.refresh_from_db()
+        version = project.version
+        #project lookup and component load only
+        with self.assertNumQueries(2):
+            response = self.client.put(url, payload, format="json")
+        self.assertEqual(response.status_code, 200)
+        project.refresh_from_db()
+        self.assertEqual(project.version, version)
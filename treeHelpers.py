@@ -0,0 +1,43 @@
+# whole subtrees of the component tree in one statement each, through the materialized paths
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from .models import Component
+from .componentTree import ROOT, childPath, subtreeFilter, movedPath, TreeError
+from .deleteHelpers import rawDelete
+from .signals import components_changed
+
+def subtree(component):
+    #the component and all its descendants in depth first order, one query
+    return Component.objects.filter(subtreeFilter(component.page_id, component.path)).order_by("path")
+
+def deleteSubtree(project, component, cascade=False):
+    #one query lists the component and its descendants for the signals and one DELETE removes them; like a delta
+    #delete, a component that still has children raises TreeError unless cascade is set
+    with transaction.atomic():
+        rows = list(subtree(component).only("id", "page", "comp_id"))
+        if len(rows) > 1 and not cascade:
+            raise TreeError({(component.page_id, component.comp_id): ["Component still has children."]})
+        rawDelete(Component.objects.filter(pk__in=[row.pk for row in rows]))
+        components_changed.send(sender=Component, project=project, pages={component.page_id}, deleted=rows, saved=[])
+    return rows
+
+def moveSubtree(project, component, parent):
+    #re-parents the component, its descendants follow in the same UPDATE; raises TreeError for a parent that is
+    #missing or inside the subtree; callers hold the project row lock
+    if parent == component.parent:
+        return
+    path = ROOT
+    if parent is not None:
+        target = Component.objects.filter(page_id=component.page_id, comp_id=parent).only("path").first()
+        if target is None:
+            raise TreeError({(component.page_id, component.comp_id): ["Parent does not exist on the page."]})
+        if target.path.startswith(component.path):
+            raise TreeError({(component.page_id, component.comp_id): ["Parent would make the component its own descendant."]})
+        path = target.path
+    path = childPath(path, component.comp_id)
+    Component.objects.filter(subtreeFilter(component.page_id, component.path)).update(
+        path=movedPath(component.path, path),
+        parent=Case(When(pk=component.pk, then=Value(parent, output_field=models.CharField())), default=F("parent")),
+    )
+    component.parent, component.path, component._tree_parent = parent, path, parent
+    components_changed.send(sender=Component, project=project, pages={component.page_id}, saved=[component], fields={component: {"parent"}})
@@ -1,15 +1,43 @@
+from django.conf import settings
 from django.urls import path
-from .views import ProjectView, PageView, ComponentView, ComponentListView, ComponentPostView, ProjectListView, PagePost, SignUpView
-from rest_framework.authtoken import views as tokenView
+from .views import ProjectView, PageView, ComponentView, ComponentSubtreeView, ComponentMoveView, ComponentListView, ComponentPostView, ProjectListView, ProjectDeleteView, PagePost, SignUpView, PageStylesView, PageViewportView, ProjectCSSView, PageCSSView, CacheStatsView, RequestStatsView, ChangeFeedView, ComponentDeltaView, ProjectCloneView, PageCloneView, ProjectHistoryView, ProjectRestoreView, ObtainTokenView, RefreshTokenView, LogoutView
+from .asyncViews import AsyncProjectListView, AsyncComponentListView, AsyncComponentView, AsyncChangeFeedView
 
-urlpatterns = [
-    path("projects/", ProjectListView.as_view(), name="projects-list"),
-    path("projects/new/", ProjectView.as_view(), name="projects-new"),
-    path("projects/project/<int:project_id>/new/page/", PagePost.as_view(), name="page-post"),
-    path("projects/project/<int:project_id>/page/<int:page_id>/", PageView.as_view(), name="page-view"),
-    path("projects/project/<int:project_id>/ui/", ComponentListView.as_view(), name="components-list"),
-    path("projects/project/<int:project_id>/page/<int:page_id>/new/component/", ComponentPostView.as_view(), name="new-component"),
-    path("projects/project/<int:project_id>/page/<int:page_id>/component/<int:comp_id>/", ComponentView.as_view(), name="component-view"),
-    path("sign-up/", SignUpView.as_view(), name="sign-up"),
-    path('auth/', tokenView.obtain_auth_token, name="auth-view")
-]
\ No newline at end of file
+#ASGI deployments serve the polling and autosave endpoints from native async views
+ASYNC_VIEWS = getattr(settings, "CRAYKOI_ASYNC_VIEWS", False)
+
+def buildPatterns(async_views=ASYNC_VIEWS):
+    projectList = AsyncProjectListView if async_views else ProjectListView
+    componentList = AsyncComponentListView if async_views else ComponentListView
+    component = AsyncComponentView if async_views else ComponentView
+    changeFeed = AsyncChangeFeedView if async_views else ChangeFeedView
+    return [
+        path("projects/", projectList.as_view(), name="projects-list"),
+        path("projects/new/", ProjectView.as_view(), name="projects-new"),
+        path("projects/project/<int:project_id>/", ProjectDeleteView.as_view(), name="project-view"),
+        path("projects/project/<int:project_id>/new/page/", PagePost.as_view(), name="page-post"),
+        path("projects/project/<int:project_id>/clone/", ProjectCloneView.as_view(), name="project-clone"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/", PageView.as_view(), name="page-view"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/clone/", PageCloneView.as_view(), name="page-clone"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/styles/", PageStylesView.as_view(), name="page-styles"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/viewport/", PageViewportView.as_view(), name="page-viewport"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/styles.css", PageCSSView.as_view(), name="page-css"),
+        path("projects/project/<int:project_id>/styles.css", ProjectCSSView.as_view(), name="project-css"),
+        path("projects/project/<int:project_id>/ui/", componentList.as_view(), name="components-list"),
+        path("projects/project/<int:project_id>/ui/delta/", ComponentDeltaView.as_view(), name="components-delta"),
+        path("projects/project/<int:project_id>/history/", ProjectHistoryView.as_view(), name="project-history"),
+        path("projects/project/<int:project_id>/history/restore/", ProjectRestoreView.as_view(), name="project-restore"),
+        path("projects/project/<int:project_id>/events/", changeFeed.as_view(), name="project-events"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/new/component/", ComponentPostView.as_view(), name="new-component"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/component/<int:comp_id>/", component.as_view(), name="component-view"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/component/<int:comp_id>/subtree/", ComponentSubtreeView.as_view(), name="component-subtree"),
+        path("projects/project/<int:project_id>/page/<int:page_id>/component/<int:comp_id>/move/", ComponentMoveView.as_view(), name="component-move"),
+        path("stats/cache/", CacheStatsView.as_view(), name="cache-stats"),
+        path("stats/requests/", RequestStatsView.as_view(), name="request-stats"),
+        path("sign-up/", SignUpView.as_view(), name="sign-up"),
+        path('auth/', ObtainTokenView.as_view(), name="auth-view"),
+        path('auth/refresh/', RefreshTokenView.as_view(), name="auth-refresh"),
+        path('auth/logout/', LogoutView.as_view(), name="auth-logout")
+    ]
+
+urlpatterns = buildPatterns()
@@ -0,0 +1,12 @@
+# helper functions for conditional requests against the project version
+from django.utils.http import parse_etags, quote_etag
+
+def projectETag(project):
+    return quote_etag(f"{project.id}-{project.version}")
+
+def notModified(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
@@ -2,21 +2,34 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Project, Page, Component
-from .serializers import ProjectSerializer, PageSerializer, ComponentSerializer, UserSerializer
-from rest_framework.parsers import JSONParser
-import itertools
-from .styleHelpers import getStyle, getComp
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from .models import Project, Page, Component, Style
+from .serializers import ProjectSerializer, PageSerializer, UserSerializer
+from .jsonCodec import FastJSONMixin
+from .bulkHelpers import buildComponent, bulkCreateComponents, applyDelta
+from .cloneHelpers import cloneProject, clonePage, copyName
+from .deleteHelpers import deletePage, deleteProject
+from .historyHelpers import restoreProject, HISTORY_LIST_SIZE
+from .treeHelpers import subtree, deleteSubtree, moveSubtree
+from .writeBehind import autosave, flushProject
+from .componentTree import TreeError
+from .streamHelpers import projectComponents, encodeComponentData, encodeJSONArray, streamChunks, withStyles, STREAM_CHUNK_SIZE
+from .cursorHelpers import parseListing, filterComponents, projectItem, componentPage, needsStyles, parseViewport, viewportComponents, ListingError
+from .cacheHelpers import cachedPageStyles, cachedPagesCSS, projectData, recordChunks, cacheStats
+from .cssCompiler import CSSRenderer, cssETag
+from .changeFeed import EventStreamRenderer, eventStream, feedResponse, resumeVersion
+from .versionHelpers import projectETag, notModified
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.authtoken.models import Token
+from .authentication import CachedTokenAuthentication, isExpired, tokenExpires, rotateToken
+from .mixins import OwnershipMixin
+from .instrumentation import endpointStats, timed
 from django.contrib.auth import authenticate, login
+from django.db import IntegrityError, transaction
 
 # Create your views here.
-def get_key(comp):
-    return comp["page"]
-
 class ProjectView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     def post(self, request, format=None):
         user = request.user
@@ -27,12 +40,12 @@ class ProjectView(APIView):
         return Response(data=project_serializer.errors, status=status.HTTP_406_NOT_ACCEPTABLE)
 
 class ProjectListView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     def get(self, request, format=None):
         #get list of projects
         user = request.user
-        user_projects = user.projects.all()
+        user_projects = user.projects.filter(hidden=False)
         if(user_projects.count() > 0):
             data = []
             for project in user_projects:
@@ -43,148 +56,335 @@ class ProjectListView(APIView):
             return Response(data=data, status=status.HTTP_200_OK)
         return Response(data=[], status=status.HTTP_200_OK)
 
-class PagePost(APIView):
-    authentication_classes = [TokenAuthentication]
+class PagePost(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     #create new page
     def post(self, request, project_id, format=None):
-        user = request.user
-        try:
-            project = user.projects.get(id=project_id)
-            page_serializer = PageSerializer(data=request.data)
-            if page_serializer.is_valid():
-                page_serializer.save(project=project)
-                return Response(status=status.HTTP_200_OK)
-            return Response(data=page_serializer.errors, status=status.HTTP_406_NOT_ACCEPTABLE)
-        except Project.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-
-class PageView(APIView):
-    authentication_classes = [TokenAuthentication]
+        project = self.getProject(request, project_id)
+        page_serializer = PageSerializer(data=request.data)
+        if page_serializer.is_valid():
+            try:
+                with transaction.atomic():
+                    page_serializer.save(project=project)
+            except IntegrityError:
+                #page titles are unique per project
+                return Response(data={"title": ["A page with this title already exists."]}, status=status.HTTP_406_NOT_ACCEPTABLE)
+            return Response(status=status.HTTP_200_OK)
+        return Response(data=page_serializer.errors, status=status.HTTP_406_NOT_ACCEPTABLE)
+
+class ProjectDeleteView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #large projects disappear at once and are purged in the background, answered with 202
+    def delete(self, request, project_id, format=None):
+        project = self.getProject(request, project_id)
+        if deleteProject(project):
+            return Response(status=status.HTTP_202_ACCEPTED)
+        return Response(status=status.HTTP_200_OK)
+
+class PageView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     def delete(self, request, project_id, page_id, format=None):
-        user = request.user
-        try:
-            project = user.projects.get(id=project_id)
-            try:
-                page = project.pages.get(id=page_id)
-                page.delete()
-                return Response(status=status.HTTP_200_OK)
-            except Page.DoesNotExist:
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-        except Project.DoesNotExist:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+        page = self.getPage(request, project_id, page_id)
+        deletePage(page)
+        return Response(status=status.HTTP_200_OK)
 
-class ComponentView(APIView):
-    authentication_classes = [TokenAuthentication]
+class ComponentView(FastJSONMixin, OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     #retreive component styles
     def get(self, request, project_id, page_id, comp_id, format=None):
-        user = request.user
-        try:
-            project = user.projects.get(id=project_id)
-            try:
-                page = project.pages.get(id=page_id)
-                try:
-                    component = page.components.get(id=comp_id)
-                    data = component.getStyles()
-                    return Response(data=data, status=status.HTTP_200_OK)
-                except Component.DoesNotExist:
-                    return Response(status=status.HTTP_404_NOT_FOUND)
-            except Page.DoesNotExist:
-                return Response(status=status.HTTP_404_NOT_FOUND)
-        except Project.DoesNotExist:
-           return Response(status=status.HTTP_404_NOT_FOUND)
+        component = self.getComponent(request, project_id, page_id, comp_id)
+        etag = projectETag(component.page.project)
+        if notModified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        data = cachedPageStyles(component.page)[component.comp_id]
+        return Response(data=data, status=status.HTTP_200_OK, headers={"ETag": etag})
+    #removes a leaf component, ?subtree=1 also removes its descendants
     def delete(self, request, project_id, page_id, comp_id, format=None):
-        user = request.user
+        component = self.getComponent(request, project_id, page_id, comp_id)
         try:
-            project = user.projects.get(id=project_id)
+            deleteSubtree(component.page.project, component, cascade=request.query_params.get("subtree") == "1")
+        except TreeError as exc:
+            return Response(data={"detail": exc.errors[(component.page_id, component.comp_id)][0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_200_OK)
+
+class ComponentSubtreeView(FastJSONMixin, OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #the component and all its descendants, parents before their children
+    def get(self, request, project_id, page_id, comp_id, format=None):
+        component = self.getComponent(request, project_id, page_id, comp_id)
+        etag = projectETag(component.page.project)
+        if notModified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        rows = Style.resolve(list(subtree(component)))
+        return Response(data=[comp.getData() for comp in rows], status=status.HTTP_200_OK, headers={"ETag": etag})
+
+class ComponentMoveView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #body {"parent": comp_id or null}, the component's descendants move with it
+    def post(self, request, project_id, page_id, comp_id, format=None):
+        data = request.data
+        if not isinstance(data, dict) or "parent" not in data or not (data["parent"] is None or isinstance(data["parent"], str)):
+            return Response(data={"detail": "Expected {\"parent\": comp_id or null}."}, status=status.HTTP_400_BAD_REQUEST)
+        #buffered autosaves are written before the lock, a flush waiting on it from inside would deadlock
+        flushProject(project_id)
+        with transaction.atomic():
+            project = self.getProject(request, project_id, Project.objects.select_for_update(), flush=False)
+            component = self.getComponent(request, project_id, page_id, comp_id, flush=False)
             try:
-                page = project.pages.get(id=page_id)
-                try:
-                    component = page.components.get(id=comp_id)
-                    component.delete()
-                    return Response(status=status.HTTP_200_OK)
-                except Component.DoesNotExist:
-                    return Response(status=status.HTTP_404_NOT_FOUND)
-            except Page.DoesNotExist:
-                return Response(status=status.HTTP_404_NOT_FOUND)
-        except Project.DoesNotExist:
-           return Response(status=status.HTTP_404_NOT_FOUND)
-
-class ComponentPostView(APIView):
-    authentication_classes = [TokenAuthentication]
+                moveSubtree(project, component, data["parent"])
+            except TreeError as exc:
+                return Response(data={"parent": exc.errors[(component.page_id, component.comp_id)]}, status=status.HTTP_400_BAD_REQUEST)
+        project.refresh_from_db(fields=["version"])
+        return Response(data={"version": project.version}, status=status.HTTP_200_OK)
+
+class PageStylesView(FastJSONMixin, OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #retrieve the computed styles of every component of a page, keyed by comp_id
+    def get(self, request, project_id, page_id, format=None):
+        page = self.getPage(request, project_id, page_id)
+        etag = projectETag(page.project)
+        if notModified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        data = cachedPageStyles(page)
+        return Response(data=data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+class PageViewportView(FastJSONMixin, OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #components of a page intersecting ?left=&top=&width=&height=, optionally projected with ?fields=
+    def get(self, request, project_id, page_id, format=None):
+        page = self.getPage(request, project_id, page_id)
+        etag = projectETag(page.project)
+        if notModified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        try:
+            viewport = parseViewport(request.query_params)
+        except ListingError as exc:
+            return Response(data={"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        fields = viewport.pop("fields")
+        rows = list(viewportComponents(page.id, fields=fields, **viewport))
+        if needsStyles(fields):
+            Style.resolve(rows)
+        return Response(data=[projectItem(comp, fields) for comp in rows], status=status.HTTP_200_OK, headers={"ETag": etag})
+
+class ProjectCSSView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CSSRenderer]
+    #one stylesheet for every page of the project, only pages changed since the last build are recompiled
+    def get(self, request, project_id, format=None):
+        project = self.getProject(request, project_id)
+        etag = cssETag(f"{project.id}-{project.version}")
+        if notModified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        pages = list(project.pages.order_by("id"))
+        css = cachedPagesCSS(pages)
+        return Response(data="".join(css[page.id] for page in pages), status=status.HTTP_200_OK, headers={"ETag": etag})
+
+class PageCSSView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CSSRenderer]
+    #stylesheet of a single page
+    def get(self, request, project_id, page_id, format=None):
+        page = self.getPage(request, project_id, page_id)
+        etag = cssETag(f"{page.project_id}-{page.id}-{page.version}")
+        if notModified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(data=cachedPagesCSS([page])[page.id], status=status.HTTP_200_OK, headers={"ETag": etag})
+
+class ChangeFeedView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [EventStreamRenderer]
+    #server-sent events of the project's committed changes, resumed after Last-Event-ID or ?version=; one long poll
+    #per request, see eventStream
+    def get(self, request, project_id, format=None):
+        project = self.getProject(request, project_id)
+        try:
+            since = resumeVersion(request)
+        except ValueError:
+            return Response(data={"detail": "version must be a non-negative integer."}, status=status.HTTP_400_BAD_REQUEST)
+        return feedResponse(eventStream(project, since))
+
+class ComponentPostView(FastJSONMixin, OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     #create new component
     def post(self, request, project_id, page_id, format=None):
-        user = request.user
-        try:
-            project = user.projects.get(id=project_id)
+        page = self.getPage(request, project_id, page_id)
+        if isinstance(request.data, list):
+            #batch of components, created together or not at all
             try:
-                page = project.pages.get(id=page_id)
-                secondary = getStyle(request.data)
-                primary = getComp(request.data)
-                serializer_data = {}
-                serializer_data.update(primary)
-                serializer_data.update({"secondary_state": secondary})
-                comp_serializer = ComponentSerializer(data=serializer_data)
-                if comp_serializer.is_valid():
-                    comp_serializer.save(page=page)
-                    return Response(status=status.HTTP_200_OK)
-                print(comp_serializer.errors)
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-            except Page.DoesNotExist:
+                components, errors = bulkCreateComponents(page.project, page, request.data)
+            except IntegrityError:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
-        except Project.DoesNotExist:
-           return Response(status=status.HTTP_400_BAD_REQUEST)
-def sortFunc(entry):
-    return entry["page"]
-
+            if errors:
+                return Response(data={"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(status=status.HTTP_200_OK)
+        if not isinstance(request.data, dict):
+            return Response(data={"non_field_errors": ["Expected a component object."]}, status=status.HTTP_400_BAD_REQUEST)
+        with timed("serializer"):
+            component, errors = buildComponent(page, request.data)
+        if errors:
+            return Response(data=errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                Component.syncTree([component], strict=True)
+                component.save()
+        except TreeError as exc:
+            return Response(data={"parent": exc.errors[(page.id, component.comp_id)]}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            #comp_id is unique per page
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_200_OK)
 #retrieves all components of a project
-class ComponentListView(APIView):
-    authentication_classes = [TokenAuthentication]
+class ComponentListView(FastJSONMixin, OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     #get all components of a project
     def get(self, request, project_id, format=None):
-        user = request.user
+        project = self.getProject(request, project_id)
+        etag = projectETag(project)
+        if notModified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
         try:
-            project = user.projects.get(id=project_id)
-            pages = project.pages.all()
-            data = []
-            for page in pages:
-                components = page.components.all()
-                for comp in components:
-                    data.append(comp.getData())
-            return Response(data=data, status=status.HTTP_200_OK)
-        except Project.DoesNotExist:
-           return Response(status=status.HTTP_404_NOT_FOUND)
+            listing = parseListing(request.query_params)
+        except ListingError as exc:
+            return Response(data={"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if listing is not None:
+            #filtered, projected or paginated listings bypass the whole-project payload cache
+            components = filterComponents(project, listing["page"], listing["page_title"], listing["fields"])
+            resolve = needsStyles(listing["fields"])
+            if listing["limit"] is None:
+                components = components.iterator(chunk_size=STREAM_CHUNK_SIZE)
+                items = (projectItem(comp, listing["fields"]) for comp in (withStyles(components) if resolve else components))
+                response = streamChunks(encodeJSONArray(items))
+                response["ETag"] = etag
+                return response
+            rows, cursor = componentPage(components, listing["limit"], listing["after"])
+            if resolve:
+                Style.resolve(rows)
+            data = {"results": [projectItem(comp, listing["fields"]) for comp in rows], "next": cursor}
+            return Response(data=data, status=status.HTTP_200_OK, headers={"ETag": etag})
+        chunks = projectData.get(project.id, project.version)
+        if chunks is None:
+            chunks = recordChunks(project, encodeComponentData(projectComponents(project)))
+        response = streamChunks(chunks)
+        response["ETag"] = etag
+        return response
     def put(self, request, project_id, format=None):
-        #update all components of a project
-        user = request.user
-        try:
-            project = user.projects.get(id=project_id)
-            sortedData = sorted(request.data, key=sortFunc)
-            groupedPages = itertools.groupby(sortedData, get_key)
-            for page_title, group in groupedPages:
-                try:
-                    page = project.pages.get(title=page_title)
-                    for compData in group:
-                        try:
-                            component = page.components.get(comp_id=compData["id"])
-                            component_data = getComp(compData)
-                            component_data["secondary_state"] = getStyle(compData)
-                            comp_serializer = ComponentSerializer(component, data=component_data)
-                            if comp_serializer.is_valid():
-                                comp_serializer.save()
-                            else:
-                                return Response(status=status.HTTP_400_BAD_REQUEST)
-                        except Component.DoesNotExist:
-                            return Response(status=status.HTTP_400_BAD_REQUEST)
-                except Page.DoesNotExist:
-                    return Response(status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_200_OK)
-        except Project.DoesNotExist:
-           return Response(status=status.HTTP_400_BAD_REQUEST)
+        #update all components of a project in one transaction, or 202 when the write is buffered (see writeBehind)
+        project = self.getProject(request, project_id, flush=False)
+        if not isinstance(request.data, list):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        errors, pending = autosave(project, request.data)
+        if errors:
+            return Response(data={"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_202_ACCEPTED if pending else status.HTTP_200_OK)
+
+#applies a batch of component operations against a base project version
+class ComponentDeltaView(FastJSONMixin, OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    def post(self, request, project_id, format=None):
+        data = request.data
+        if not isinstance(data, dict) or not isinstance(data.get("base"), int) or isinstance(data.get("base"), bool) or not isinstance(data.get("ops"), list):
+            return Response(data={"detail": "Expected {\"base\": version, \"ops\": [...]}."}, status=status.HTTP_400_BAD_REQUEST)
+        flushProject(project_id)
+        with transaction.atomic():
+            project = self.getProject(request, project_id, Project.objects.select_for_update(), flush=False)
+            if project.version != data["base"]:
+                return Response(data={"version": project.version}, status=status.HTTP_409_CONFLICT)
+            results, errors = applyDelta(project, data["ops"])
+            if errors:
+                return Response(data={"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        project.refresh_from_db(fields=["version"])
+        return Response(data={"version": project.version, "results": results}, status=status.HTTP_200_OK)
+
+class ProjectCloneView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #copies the project with all its pages and components, optional body {"name": ...}
+    def post(self, request, project_id, format=None):
+        data = request.data if isinstance(request.data, dict) else {}
+        flushProject(project_id)
+        with transaction.atomic():
+            #writers of the source project wait until the copy is done
+            project = self.getProject(request, project_id, Project.objects.select_for_update(), flush=False)
+            project_serializer = ProjectSerializer(data={"name": data.get("name") or copyName(project.name, Project._meta.get_field("name").max_length)})
+            if not project_serializer.is_valid():
+                return Response(data=project_serializer.errors, status=status.HTTP_406_NOT_ACCEPTABLE)
+            try:
+                copy = cloneProject(project, project_serializer.validated_data["name"])
+            except IntegrityError:
+                return Response(data={"name": ["project with this name already exists."]}, status=status.HTTP_406_NOT_ACCEPTABLE)
+        return Response(data=ProjectSerializer(copy).data, status=status.HTTP_200_OK)
+
+class PageCloneView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #copies the page with all its components into the same project, optional body {"title": ...}
+    def post(self, request, project_id, page_id, format=None):
+        data = request.data if isinstance(request.data, dict) else {}
+        flushProject(project_id)
+        with transaction.atomic():
+            self.getProject(request, project_id, Project.objects.select_for_update(), flush=False)
+            page = self.getPage(request, project_id, page_id, flush=False)
+            page_serializer = PageSerializer(data={"title": data.get("title") or copyName(page.title, Page._meta.get_field("title").max_length)})
+            if not page_serializer.is_valid():
+                return Response(data=page_serializer.errors, status=status.HTTP_406_NOT_ACCEPTABLE)
+            try:
+                copy = clonePage(page, page_serializer.validated_data["title"])
+            except IntegrityError:
+                return Response(data={"title": ["A page with this title already exists."]}, status=status.HTTP_406_NOT_ACCEPTABLE)
+        return Response(data=PageSerializer(copy).data, status=status.HTTP_200_OK)
+
+class ProjectHistoryView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #newest revisions first, the project can be restored to any of their versions
+    def get(self, request, project_id, format=None):
+        project = self.getProject(request, project_id)
+        revisions = project.revisions.order_by("-version", "-id").values("version", "snapshot", "created")[:HISTORY_LIST_SIZE]
+        return Response(data=list(revisions), status=status.HTTP_200_OK)
+
+class ProjectRestoreView(OwnershipMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    #body {"version": N}, the restore is a new write on top of the history
+    def post(self, request, project_id, format=None):
+        data = request.data
+        if not isinstance(data, dict) or not isinstance(data.get("version"), int) or isinstance(data.get("version"), bool):
+            return Response(data={"detail": "Expected {\"version\": version}."}, status=status.HTTP_400_BAD_REQUEST)
+        flushProject(project_id)
+        with transaction.atomic():
+            project = self.getProject(request, project_id, Project.objects.select_for_update(), flush=False)
+            if not restoreProject(project, data["version"]):
+                return Response(data={"detail": "No history for this version."}, status=status.HTTP_404_NOT_FOUND)
+        project.refresh_from_db(fields=["version"])
+        return Response(data={"version": project.version}, status=status.HTTP_200_OK)
+
+class CacheStatsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+    #hit/miss counters of the style and payload caches
+    def get(self, request, format=None):
+        return Response(data=cacheStats(), status=status.HTTP_200_OK)
+
+class RequestStatsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+    #latency, SQL and phase histograms per endpoint, filled by RequestTimingMiddleware
+    def get(self, request, format=None):
+        return Response(data=endpointStats.data(), status=status.HTTP_200_OK)
 
 class SignUpView(APIView):
     def post(self, request, format=None):
@@ -198,4 +398,29 @@ class SignUpView(APIView):
         if user_serializer.is_valid():
             user_serializer.save()
             return Response(status=status.HTTP_200_OK)
-        return Response(data=user_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(data=user_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class ObtainTokenView(ObtainAuthToken):
+    #same as the stock view, but an expired token is replaced instead of handed back
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data["user"]
+        token, created = Token.objects.get_or_create(user=user)
+        if isExpired(token):
+            token = rotateToken(user)
+        return Response(data={"token": token.key, "expires": tokenExpires(token)}, status=status.HTTP_200_OK)
+
+class RefreshTokenView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    def post(self, request, format=None):
+        token = rotateToken(request.user)
+        return Response(data={"token": token.key, "expires": tokenExpires(token)}, status=status.HTTP_200_OK)
+
+class LogoutView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    def post(self, request, format=None):
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_200_OK)
@@ -0,0 +1,162 @@
+# write-behind buffer for the autosave PUT, off unless CRAYKOI_WRITE_BEHIND is set
+#
+# the editor resends the whole project on every drag frame and keystroke; with the buffer on, a PUT only keeps the
+# items that differ from what its project's buffer accepted last, a later item for the same (page, comp_id)
+# replaces the pending one, and the coalesced items go through bulkUpdateComponents once the oldest of them waited
+# WRITE_BEHIND_INTERVAL seconds or WRITE_BEHIND_MAX_ITEMS components are pending
+# any other request of the project writes its buffer out before looking the project up, so a client always reads
+# its own writes; buffers still pending when the interpreter exits (a worker's graceful shutdown) are written then
+# buffers live in the process: deployments with several workers need the requests of a project to reach one worker
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connections, transaction
+from .bulkHelpers import bulkUpdateComponents
+from .models import Project
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND = getattr(settings, "CRAYKOI_WRITE_BEHIND", False)
+#seconds an accepted autosave may wait before it is written
+WRITE_BEHIND_INTERVAL = getattr(settings, "CRAYKOI_WRITE_BEHIND_INTERVAL", 0.5)
+#pending components that make the PUT adding them write the buffer itself
+WRITE_BEHIND_MAX_ITEMS = getattr(settings, "CRAYKOI_WRITE_BEHIND_MAX_ITEMS", 1000)
+#idle buffers kept around for the payload they accepted last
+WRITE_BEHIND_PROJECTS = getattr(settings, "CRAYKOI_WRITE_BEHIND_PROJECTS", 256)
+
+class AutosaveBuffer:
+    def __init__(self, project_id):
+        self.project_id = project_id
+        #guards the dicts below, flushing keeps the writes of the project in the order they were accepted
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        #{(page title, comp_id): item} waiting to be written, and the last item accepted for every component
+        self.pending = {}
+        self.accepted = {}
+        #project version the accepted items are a diff against, a write from anywhere else invalidates them
+        self.version = None
+        #errors of a write no request was waiting on, reported to the next autosave
+        self.errors = None
+        self.timer = None
+    def accept(self, version, items):
+        #returns how many components are pending
+        with self.lock:
+            if version != self.version:
+                self.accepted = {}
+                self.version = version
+            for item in items:
+                key = (item["page"], item["id"])
+                if self.accepted.get(key) != item:
+                    self.accepted[key] = self.pending[key] = item
+            if self.pending and self.timer is None:
+                self.timer = threading.Timer(WRITE_BEHIND_INTERVAL, flushInBackground, [self.project_id])
+                self.timer.daemon = True
+                self.timer.start()
+            return len(self.pending)
+    def takeErrors(self):
+        with self.lock:
+            errors, self.errors = self.errors, None
+            return errors
+    def flush(self):
+        #writes the pending items, returns the errors of the write (nothing is written then)
+        with self.flushing:
+            with self.lock:
+                items, self.pending = list(self.pending.values()), {}
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            if not items:
+                return []
+            with transaction.atomic():
+                project = Project.objects.select_for_update().filter(pk=self.project_id, hidden=False).first()
+                if project is None:
+                    #deleted in the meantime, there is nothing left to save to
+                    return []
+                before = project.version
+                components, errors = bulkUpdateComponents(project, items)
+                project.refresh_from_db(fields=["version"])
+            with self.lock:
+                if errors or before != self.version:
+                    #the database no longer holds what was accepted
+                    self.accepted = dict(self.pending)
+                self.version = project.version
+            return errors
+    def busy(self):
+        #items wait or are being written; flush drains pending only once it holds flushing, so an item is always
+        #in one or the other until it is stored
+        return bool(self.pending) or self.flushing.locked()
+    def idle(self):
+        return not self.busy()
+
+buffers = OrderedDict()
+buffersLock = threading.Lock()
+
+def bufferFor(project_id):
+    with buffersLock:
+        buffer = buffers.get(project_id)
+        if buffer is None:
+            buffer = buffers[project_id] = AutosaveBuffer(project_id)
+            #the least recently created idle buffers go first
+            for key in [key for key, other in buffers.items() if other.idle() and key != project_id][:max(0, len(buffers) - WRITE_BEHIND_PROJECTS)]:
+                del buffers[key]
+        return buffer
+
+def itemErrors(items):
+    #what the buffer needs from every item to coalesce it, the rest is validated when it is written
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "errors": ["Expected a component object."]})
+        elif not isinstance(item.get("page"), str) or not isinstance(item.get("id"), str):
+            errors.append({"index": index, "page": item.get("page"), "id": item.get("id"), "errors": ["Component does not exist."]})
+    return errors
+
+def autosave(project, items):
+    #the autosave PUT, returns (errors, whether items are still waiting to be written)
+    if not WRITE_BEHIND:
+        components, errors = bulkUpdateComponents(project, items)
+        return errors, False
+    errors = itemErrors(items)
+    if errors:
+        return errors, False
+    buffer = bufferFor(project.id)
+    errors = buffer.takeErrors()
+    if errors:
+        return errors, False
+    if buffer.accept(project.version, items) < WRITE_BEHIND_MAX_ITEMS:
+        return [], bool(buffer.pending)
+    return buffer.flush(), False
+
+def hasPending(project_id):
+    buffer = buffers.get(project_id)
+    return buffer is not None and buffer.busy()
+
+def flushProject(project_id):
+    #writes the project's pending autosaves, or waits for the write already running, called before a request
+    #looks the project up
+    buffer = buffers.get(project_id)
+    if buffer is not None and buffer.busy():
+        errors = buffer.flush()
+        if errors:
+            with buffer.lock:
+                buffer.errors = errors
+
+def flushInBackground(project_id):
+    try:
+        flushProject(project_id)
+    except Exception:
+        #the items are lost, the editor's next autosave sends them again
+        logger.exception("writing the autosaves of project %s failed", project_id)
+    finally:
+        #connections are per thread, this one would otherwise stay open
+        connections.close_all()
+
+@atexit.register
+def flushAll():
+    for project_id in list(buffers):
+        try:
+            flushProject(project_id)
+        except Exception:
+            logger.exception("writing the autosaves of project %s failed", project_id)